@@ -1,9 +1,14 @@
 #!/usr/bin/env python
 
+import atexit
+import itertools
 import os
 import re
 import sys
 from datetime import datetime
+from functools import partial
+from multiprocessing.pool import ThreadPool
+from threading import BoundedSemaphore
 
 import click
 from send2trash import send2trash
@@ -16,20 +21,28 @@ if not verify_dependencies():
 
 from elodie import constants
 from elodie import geolocation
+from elodie import stats
+from elodie import transfer
 from elodie.media.media import Media
 from elodie.media.audio import Audio
 from elodie.media.photo import Photo
 from elodie.media.video import Video
 from elodie.filesystem import FileSystem
 from elodie.localstorage import Db
+from elodie.localstorage import ImportJournal
 
 
 DB = Db()
-FILESYSTEM = FileSystem()
+FILESYSTEM = FileSystem(DB)
 
+# Hashes are committed in batches so anything pending is written on exit.
+atexit.register(DB.flush)
 
-def import_file(_file, destination, album_from_folder, trash):
+
+def import_file(_file, destination, album_from_folder, trash, media=None):
     """Set file metadata and move it to destination.
+
+    :returns: str path the file was copied to, or None if it was skipped.
     """
     if not os.path.exists(_file):
         if constants.debug:
@@ -38,7 +51,8 @@ def import_file(_file, destination, album_from_folder, trash):
             (_file, _file)
         return
 
-    media = Media.get_class_by_file(_file, [Audio, Photo, Video])
+    if media is None:
+        media = Media.get_class_by_file(_file, [Audio, Photo, Video])
     if not media:
         if constants.debug:
             print 'Not a supported file (%s)' % _file
@@ -53,10 +67,122 @@ def import_file(_file, destination, album_from_folder, trash):
 
     dest_path = FILESYSTEM.process_file(_file, destination,
         media, allowDuplicate=False, move=False)
-    if dest_path:
-        print '%s -> %s' % (_file, dest_path)
     if trash:
         send2trash(_file)
+    return dest_path
+
+
+def get_import_files(paths):
+    """Yield the files to import from a list of files and directories.
+
+    Directories are listed as we go and only include files with extensions
+    we support, so importing can start before a large tree is listed. Files
+    given more than once, like a directory and one inside it, are only
+    yielded the first time.
+    """
+    extensions = tuple(
+        '.%s' % extension
+        for media_class in [Audio, Photo, Video]
+        for extension in media_class.extensions)
+    seen = set()
+    for path in paths:
+        path = os.path.expanduser(path)
+        if os.path.isdir(path):
+            files = FILESYSTEM.iter_all_files(path, extensions)
+        else:
+            files = [path]
+        for current_file in files:
+            real_path = os.path.realpath(current_file)
+            if real_path in seen:
+                continue
+            seen.add(real_path)
+            yield current_file
+
+
+def get_resumed_files(files, journal, trash):
+    """Yield the files which an earlier import didn't finish.
+
+    Files the journal says were copied, and haven't changed since, are
+    skipped. Their hashes are added again in case the hash db wasn't written
+    before the import stopped. Destinations which were only partly written
+    are deleted so those files are imported again.
+    """
+    for current_file in files:
+        try:
+            stat = os.stat(current_file)
+        except OSError:
+            yield current_file
+            continue
+
+        entry = journal.get(current_file, stat)
+        if entry is None:
+            yield current_file
+            continue
+
+        destination = entry['destination']
+        if entry['state'] == 'copying':
+            if os.path.isfile(destination):
+                os.remove(destination)
+            yield current_file
+            continue
+
+        if not os.path.isfile(destination) or \
+                os.path.getsize(destination) != stat.st_size:
+            yield current_file
+            continue
+
+        if entry['state'] == 'copied':
+            DB.add_hash(entry['checksum'], destination, size=stat.st_size,
+                        partial=entry['partial'])
+            DB.checkpoint()
+        if trash:
+            send2trash(current_file)
+        if constants.debug:
+            print '%s was already imported to %s' % (current_file,
+                                                     destination)
+
+
+def get_import_tasks(files, semaphore, album_from_folder=False):
+    """Yield files to import along with their media objects.
+
+    Metadata is read for a batch of files with a single exiftool command.
+    Place names for the batch are looked up together so files taken close
+    to each other need one lookup. The semaphore is acquired for each task
+    so we don't read ahead of the workers by more than it allows.
+    """
+    files = iter(files)
+    while True:
+        batch = list(itertools.islice(files, constants.exiftool_batch_size))
+        if len(batch) == 0:
+            break
+
+        medias = [Media.get_class_by_file(current_file, [Audio, Photo, Video])
+                  for current_file in batch]
+        Media.load_exiftool_metadata(
+            [media for media in medias if media is not None])
+
+        # Files with an album are put in a folder named after it instead.
+        if not album_from_folder:
+            geolocation.prefetch_place_names(
+                [(media.get_coordinate('latitude'),
+                  media.get_coordinate('longitude'))
+                 for media in medias
+                 if media is not None and media.get_album() is None],
+                DB)
+
+        for current_file, media in zip(batch, medias):
+            semaphore.acquire()
+            yield (current_file, media)
+
+
+def import_task(task, destination, album_from_folder, trash):
+    """Import a task from get_import_tasks(), possibly in a worker thread.
+    """
+    current_file, media = task
+    with stats.timer('import'):
+        dest_path = import_file(current_file, destination, album_from_folder,
+                                trash, media)
+    return (current_file, dest_path)
 
 
 @click.command('import')
@@ -70,50 +196,102 @@ def import_file(_file, destination, album_from_folder, trash):
               help="Use images' folders as their album names.")
 @click.option('--trash', default=False, is_flag=True,
               help='After copying files, move the old files to the trash.')
+@click.option('--jobs', default=1, type=click.IntRange(1, None),
+              help='Import this many files at the same time.')
+@click.option('--rehash', default=False, is_flag=True,
+              help='Hash every file again instead of using cached hashes.')
+@click.option('--transfer', 'transfer_mode', default='copy',
+              type=click.Choice(transfer.MODES),
+              help=('How to copy files. Modes which the file system does not '
+                    'support fall back to the next one: hardlink, reflink, '
+                    'kernel, copy.'))
+@click.option('--stats', 'stats_format', type=click.Choice(stats.FORMATS),
+              help='Print how long each stage took as a table or JSON.')
 @click.argument('paths', nargs=-1, type=click.Path())
-def _import(destination, source, file, album_from_folder, trash, paths):
+def _import(destination, source, file, album_from_folder, trash, jobs, rehash,
+            transfer_mode, stats_format, paths):
     """Import files or directories.
     """
+    if stats_format:
+        stats.enable()
     destination = os.path.expanduser(destination)
+    DB.rehash = rehash
+    FILESYSTEM.transfer_mode = transfer_mode
 
-    files = set()
     paths = set(paths)
     if source:
         paths.add(source)
     if file:
         paths.add(file)
-    for path in paths:
-        path = os.path.expanduser(path)
-        if os.path.isdir(path):
-            files.update(FILESYSTEM.get_all_files(path, None))
-        else:
-            files.add(path)
-
-    for current_file in files:
-        import_file(current_file, destination, album_from_folder,
-                    trash)
-
-
-def update_location(media, file_path, location_name):
-    """Update location exif metadata of media.
+    # Files which an earlier import into the same destination copied are
+    #   skipped.
+    journal = ImportJournal(constants.import_journal, destination)
+    FILESYSTEM.journal = journal
+    files = get_resumed_files(get_import_files(paths), journal, trash)
+
+    # Workers probe, hash and copy files concurrently. FileSystem serializes
+    #   duplicate checks and hash db updates.
+    semaphore = BoundedSemaphore(jobs * constants.exiftool_batch_size)
+    tasks = get_import_tasks(files, semaphore, album_from_folder)
+    worker = partial(import_task, destination=destination,
+                     album_from_folder=album_from_folder, trash=trash)
+    if jobs > 1:
+        pool = ThreadPool(jobs)
+        results = pool.imap_unordered(worker, tasks)
+    else:
+        pool = None
+        results = itertools.imap(worker, tasks)
+
+    for count, (current_file, dest_path) in enumerate(results, 1):
+        semaphore.release()
+        if dest_path:
+            print '%s -> %s' % (current_file, dest_path)
+        if count % constants.hash_db_batch_size == 0:
+            journal.sync()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    # Once the hash db is written the journal only needs the final state of
+    #   each file.
+    DB.flush()
+    journal.compact()
+    journal.close()
+    FILESYSTEM.journal = None
+
+    if stats_format:
+        click.echo(stats.get_report(stats_format), err=True)
+
+
+def parse_location(files, location_name):
+    """Look up the coordinates of a place name for updating media.
+
+    The place is looked up once for all the files. Exits if it can't be
+    found.
+
+    :returns: tuple(float, float) of latitude and longitude.
     """
-    location_coords = geolocation.coordinates_by_name(location_name)
+    location_coords = geolocation.coordinates_by_name(location_name, DB)
 
     if location_coords and 'latitude' in location_coords and \
             'longitude' in location_coords:
-        location_status = media.set_location(location_coords[
-            'latitude'], location_coords['longitude'])
-        if not location_status:
-            if constants.debug:
-                print 'Failed to update location'
-            print ('{"source":"%s",' % file_path,
-                '"error_msg":"Failed to update location"}')
-            sys.exit(1)
-    return True
+        return (location_coords['latitude'], location_coords['longitude'])
+
+    if constants.debug:
+        print 'Failed to update location'
+    for file_path in files:
+        print '{"source":"%s", "error_msg":"Failed to update location"}' % \
+            file_path
+    sys.exit(1)
 
 
-def update_time(media, file_path, time_string):
-    """Update time exif metadata of media.
+def parse_time(files, time_string):
+    """Parse the time given to update media.
+
+    Exits if the time isn't in a format we accept.
+
+    :returns: datetime
     """
     time_format = '%Y-%m-%d %H:%M:%S'
     if re.match(r'^\d{4}-\d{2}-\d{2}$', time_string):
@@ -122,12 +300,88 @@ def update_time(media, file_path, time_string):
         msg = ('Invalid time format. Use YYYY-mm-dd hh:ii:ss or YYYY-mm-dd')
         if constants.debug:
             print msg
-        print '{"source":"%s", "error_msg":"%s"}' % (file_path, msg)
+        for file_path in files:
+            print '{"source":"%s", "error_msg":"%s"}' % (file_path, msg)
         sys.exit(1)
 
-    time = datetime.strptime(time_string, time_format)
-    media.set_date_taken(time)
-    return True
+    return datetime.strptime(time_string, time_format)
+
+
+def update_task(task, updates):
+    """Write updates to a file, possibly in a worker thread.
+
+    :param tuple task: The file path and its media object.
+    :param dict updates: Values to pass to Media.write_metadata().
+    :returns: tuple of the file path, its media object and the metadata it
+        had before it was updated, or None if it couldn't be updated.
+    """
+    file_path, media = task
+    # We call get_metadata() to cache it before making any changes.
+    metadata = media.get_metadata()
+    with stats.timer('update'):
+        written = media.write_metadata(**updates)
+    if not written:
+        if constants.debug:
+            print 'Failed to update %s' % file_path
+        print '{"source":"%s", "error_msg":"Failed to update metadata"}' % \
+            file_path
+        return None
+
+    return (file_path, media, metadata)
+
+
+def move_updated_files(updated, title):
+    """Move updated files to where their new metadata puts them.
+
+    Metadata for a batch of files is read again with a single exiftool
+    command. Folders which are left empty are deleted once all files are
+    moved.
+
+    :param list updated: Results of update_task().
+    :param str title: The title files were updated with, if any.
+    """
+    directories = set()
+    updated = iter(updated)
+    while True:
+        batch = list(itertools.islice(updated, constants.exiftool_batch_size))
+        if len(batch) == 0:
+            break
+
+        Media.load_exiftool_metadata([result[1] for result in batch])
+        for file_path, media, metadata in batch:
+            # Updating a title can be problematic when doing it 2+ times on a
+            # file. You would end up with img_001.jpg ->
+            # img_001-first-title.jpg -> img_001-first-title-second-title.jpg.
+            # To resolve that we have to track the prior title (if there was
+            # one. Then we massage the media's metadata['base_name'] to remove
+            # the old title.
+            # Since FileSystem.get_file_name() relies on base_name it will
+            #  properly rename the file by updating the title instead of
+            #  appending it.
+            original_title = metadata['title']
+            if title and original_title:
+                # @TODO: We should move this to a shared method since
+                # FileSystem.get_file_name() does it too.
+                original_title = re.sub(r'\W+', '-', original_title.lower())
+                if len(original_title) > 0:
+                    media.set_metadata_basename(metadata['base_name'].replace(
+                        '-%s' % original_title, ''))
+
+            destination = os.path.dirname(os.path.dirname(
+                os.path.dirname(file_path)))
+            dest_path = FILESYSTEM.process_file(file_path, destination,
+                media, move=True, allowDuplicate=True)
+            if constants.debug:
+                print u'%s -> %s' % (file_path, dest_path)
+            print '{"source":"%s", "destination":"%s"}' % (file_path,
+                dest_path)
+            directories.add(os.path.dirname(file_path))
+            directories.add(os.path.dirname(os.path.dirname(file_path)))
+
+    # If the folder we moved a file out of or its parent are empty we delete
+    #   it. Deeper folders go first so their parents can be emptied.
+    for directory in sorted(directories, key=len, reverse=True):
+        FILESYSTEM.delete_directory_if_empty(directory)
 
 
 @click.command('update')
@@ -138,11 +392,34 @@ def update_time(media, file_path, time_string):
 @click.option('--time', help=('Update the image time. Time should be in '
                               'YYYY-mm-dd hh:ii:ss or YYYY-mm-dd format.'))
 @click.option('--title', help='Update the image title.')
+@click.option('--jobs', default=1, type=click.IntRange(1, None),
+              help='Update this many files at the same time.')
+@click.option('--stats', 'stats_format', type=click.Choice(stats.FORMATS),
+              help='Print how long each stage took as a table or JSON.')
 @click.argument('files', nargs=-1, type=click.Path(dir_okay=False),
                 required=True)
-def _update(album, location, time, title, files):
+def _update(album, location, time, title, jobs, stats_format, files):
     """Update files.
     """
+    if stats_format:
+        stats.enable()
+
+    # The same changes are written to every file so they're worked out once.
+    updates = {}
+    if location:
+        updates['latitude'], updates['longitude'] = parse_location(
+            files, location)
+    if time:
+        updates['date_taken'] = parse_time(files, time)
+    if album:
+        updates['album'] = album
+    if title:
+        updates['title'] = title
+
+    if len(updates) == 0:
+        return
+
+    tasks = []
     for file_path in files:
         if not os.path.exists(file_path):
             if constants.debug:
@@ -152,67 +429,31 @@ def _update(album, location, time, title, files):
             continue
 
         file_path = os.path.expanduser(file_path)
-        destination = os.path.expanduser(os.path.dirname(os.path.dirname(
-                                         os.path.dirname(file_path))))
-
         media = Media.get_class_by_file(file_path, [Audio, Photo, Video])
         if not media:
             continue
-
-        updated = False
-        if location:
-            update_location(media, file_path, location)
-            updated = True
-        if time:
-            update_time(media, file_path, time)
-            updated = True
-        if album:
-            media.set_album(album)
-            updated = True
-
-        # Updating a title can be problematic when doing it 2+ times on a file.
-        # You would end up with img_001.jpg -> img_001-first-title.jpg ->
-        # img_001-first-title-second-title.jpg.
-        # To resolve that we have to track the prior title (if there was one.
-        # Then we massage the updated_media's metadata['base_name'] to remove
-        # the old title.
-        # Since FileSystem.get_file_name() relies on base_name it will properly
-        #  rename the file by updating the title instead of appending it.
-        remove_old_title_from_name = False
-        if title:
-            # We call get_metadata() to cache it before making any changes
-            metadata = media.get_metadata()
-            title_update_status = media.set_title(title)
-            original_title = metadata['title']
-            if title_update_status and original_title:
-                # @TODO: We should move this to a shared method since
-                # FileSystem.get_file_name() does it too.
-                original_title = re.sub(r'\W+', '-', original_title.lower())
-                original_base_name = metadata['base_name']
-                remove_old_title_from_name = True
-            updated = True
-
-        if updated:
-            updated_media = Media.get_class_by_file(file_path,
-                                                    [Audio, Photo, Video])
-            # See comments above on why we have to do this when titles
-            # get updated.
-            if remove_old_title_from_name and len(original_title) > 0:
-                updated_media.get_metadata()
-                updated_media.set_metadata_basename(
-                    original_base_name.replace('-%s' % original_title, ''))
-
-            dest_path = FILESYSTEM.process_file(file_path, destination,
-                updated_media, move=True, allowDuplicate=True)
-            if constants.debug:
-                print u'%s -> %s' % (file_path, dest_path)
-            print '{"source":"%s", "destination":"%s"}' % (file_path,
-                dest_path)
-            # If the folder we moved the file out of or its parent are empty
-            # we delete it.
-            FILESYSTEM.delete_directory_if_empty(os.path.dirname(file_path))
-            FILESYSTEM.delete_directory_if_empty(
-                os.path.dirname(os.path.dirname(file_path)))
+        tasks.append((file_path, media))
+
+    # Metadata from before the update is read in batches, then workers write
+    #   the files concurrently.
+    for i in range(0, len(tasks), constants.exiftool_batch_size):
+        Media.load_exiftool_metadata(
+            [task[1] for task in tasks[i:i + constants.exiftool_batch_size]])
+
+    worker = partial(update_task, updates=updates)
+    if jobs > 1:
+        pool = ThreadPool(jobs)
+        updated = pool.map(worker, tasks)
+        pool.close()
+        pool.join()
+    else:
+        updated = map(worker, tasks)
+
+    move_updated_files([result for result in updated if result is not None],
+                       title)
+
+    if stats_format:
+        click.echo(stats.get_report(stats_format), err=True)
 
 
 @click.group()
@@ -0,0 +1,6 @@
+"""
+Benchmarks for Elodie, run with `python -m elodie.benchmarks`.
+
+See :mod:`elodie.benchmarks.run` for what's measured and
+:mod:`elodie.benchmarks.corpus` for the files they run on.
+"""
@@ -0,0 +1,71 @@
+"""
+Run benchmarks and save the results as JSON.
+
+    python -m elodie.benchmarks --output=results.json
+    python -m elodie.benchmarks --only=hash_db --sizes=1000,1000000 \\
+        --compare=previous.json
+"""
+
+import json
+import sys
+
+import click
+
+from elodie.benchmarks import run
+
+
+def parse_counts(ctx, param, value):
+    try:
+        return [int(count) for count in value.split(',')]
+    except ValueError:
+        raise click.BadParameter('Use a comma separated list of numbers.')
+
+
+def parse_benchmarks(ctx, param, value):
+    names = value.split(',')
+    for name in names:
+        if(name not in run.BENCHMARKS):
+            raise click.BadParameter('Unknown benchmark %s.' % name)
+    return names
+
+
+@click.command()
+@click.option('--only', default=','.join(run.FILE_BENCHMARKS +
+                                         run.DB_BENCHMARKS),
+              callback=parse_benchmarks,
+              help='Comma separated benchmarks to run.')
+@click.option('--files', default='1000', callback=parse_counts,
+              help='Comma separated numbers of files to import and update.')
+@click.option('--sizes', default='1000,10000,100000,1000000',
+              callback=parse_counts,
+              help='Comma separated numbers of hashes and locations in the '
+                   'databases.')
+@click.option('--seed', default=0, help='Seed for generating data.')
+@click.option('--output', type=click.Path(dir_okay=False),
+              help='Save the results to this JSON file.')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False),
+              help='Compare the results with these earlier ones.')
+def main(only, files, sizes, seed, output, compare):
+    """Benchmark importing, updating and Elodie's databases."""
+    def progress(name, count):
+        click.echo('Running %s with %d...' % (name, count), err=True)
+
+    results = run.run(only, files, sizes, seed, progress)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    else:
+        click.echo(json.dumps(results, indent=2, sort_keys=True))
+
+    if compare:
+        with open(compare, 'r') as f:
+            previous = json.load(f)
+        click.echo('Compared to %s:' % previous.get('commit'), err=True)
+        for name, old, new, change in run.compare(previous, results):
+            click.echo('%-70s %12.6f %12.6f %+7.1f%%' % (
+                name, old, new, change), err=True)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
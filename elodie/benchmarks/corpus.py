@@ -0,0 +1,325 @@
+"""
+Generate synthetic photos, videos and audio files to benchmark with.
+
+The files are small but have the structure Elodie reads: JPEGs have EXIF and
+XMP segments and QuickTime/MP4 files have the atoms with the dates, location
+and title. Which metadata each file has and how large it is vary, and the
+same seed always generates the same files.
+"""
+
+import os
+import random
+import struct
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+from elodie.exif_parser import DC, ELODIE, RDF
+from elodie.quicktime_parser import CREATION_DATE, EPOCH, TITLE
+
+#: Share of each kind of file in a corpus.
+KINDS = (('jpg', 0.6), ('mov', 0.25), ('m4a', 0.15))
+
+#: Range of sizes in bytes for each kind of file.
+SIZES = {
+    'jpg': (20 * 1024, 200 * 1024),
+    'mov': (100 * 1024, 1024 * 1024),
+    'm4a': (50 * 1024, 300 * 1024)
+}
+
+#: Number of places the coordinates in a corpus are around.
+PLACE_COUNT = 50
+
+# Bytes of random data repeated to fill each file.
+FILLER_SIZE = 4096
+
+# TIFF field types
+ASCII = 2
+LONG = 4
+RATIONAL = 5
+
+
+def generate_places(rng, count=PLACE_COUNT):
+    """Make up named places for the files in a corpus to be taken at.
+
+    :param random.Random rng:
+    :param int count: Number of places.
+    :returns: list of (name, latitude, longitude)
+    """
+    return [
+        ('Place %d' % i, rng.uniform(-60, 70), rng.uniform(-180, 180))
+        for i in range(count)
+    ]
+
+
+def generate_corpus(folder, count, seed=0, places=None):
+    """Write a corpus of files to a folder.
+
+    About two thirds of the files have a location near one of `places`, a
+    third have a title and a tenth have an album. A few have no date.
+
+    :param str folder: Folder to write the files to. It's created if it
+        doesn't exist.
+    :param int count: Number of files.
+    :param int seed: Seed for the random choices.
+    :param list places: Places from :func:`generate_places`. Made up from
+        the seed if not given.
+    :returns: list of str paths of the files.
+    """
+    rng = random.Random(seed)
+    if(places is None):
+        places = generate_places(rng)
+    if(not os.path.isdir(folder)):
+        os.makedirs(folder)
+
+    start = datetime(2010, 1, 1)
+    paths = []
+    for i in range(count):
+        kind = _choose_kind(rng)
+        # Files are spread over subfolders like a camera would.
+        subfolder = os.path.join(folder, '%03d' % (i // 500))
+        if(not os.path.isdir(subfolder)):
+            os.makedirs(subfolder)
+        path = os.path.join(subfolder, 'file_%07d.%s' % (i, kind))
+
+        values = {
+            'size': rng.randint(*SIZES[kind]),
+            'date_taken': None,
+            'latitude': None,
+            'longitude': None,
+            'title': None,
+            'album': None
+        }
+        if(rng.random() < 0.95):
+            values['date_taken'] = start + timedelta(
+                seconds=rng.randint(0, 10 * 365 * 24 * 60 * 60))
+        if(kind != 'm4a' and rng.random() < 0.66):
+            # Within a few hundred meters of the place.
+            name, latitude, longitude = rng.choice(places)
+            values['latitude'] = latitude + rng.uniform(-0.002, 0.002)
+            values['longitude'] = longitude + rng.uniform(-0.002, 0.002)
+        if(rng.random() < 0.33):
+            values['title'] = 'Title %d' % rng.randint(0, 1000)
+        if(rng.random() < 0.1):
+            values['album'] = 'Album %d' % rng.randint(0, 20)
+
+        if(kind == 'jpg'):
+            make_jpeg(path, rng, **values)
+        else:
+            make_quicktime(path, rng, brand=kind, **values)
+        paths.append(path)
+
+    return paths
+
+
+def make_jpeg(path, rng, size, date_taken=None, latitude=None,
+              longitude=None, title=None, album=None):
+    """Write a JPEG with EXIF and XMP metadata.
+
+    :param str path:
+    :param random.Random rng: Used to fill the image data.
+    :param int size: Approximate size of the file in bytes.
+    """
+    ifd0 = []
+    exif_ifd = []
+    gps_ifd = []
+    if(date_taken is not None):
+        value = date_taken.strftime('%Y:%m:%d %H:%M:%S')
+        ifd0.append(_ascii_entry(0x0132, value))
+        exif_ifd.append(_ascii_entry(0x9003, value))
+    if(latitude is not None and longitude is not None):
+        gps_ifd.append(_ascii_entry(0x0001, 'N' if latitude >= 0 else 'S'))
+        gps_ifd.append(_coordinate_entry(0x0002, latitude))
+        gps_ifd.append(_ascii_entry(0x0003, 'E' if longitude >= 0 else 'W'))
+        gps_ifd.append(_coordinate_entry(0x0004, longitude))
+
+    # The pointers to the sub IFDs don't change the size of IFD0 so we lay
+    #   it out once to find where they go.
+    pointers = []
+    if(len(exif_ifd) > 0):
+        pointers.append((0x8769, exif_ifd))
+    if(len(gps_ifd) > 0):
+        pointers.append((0x8825, gps_ifd))
+    entries = ifd0 + [(tag, LONG, 1, '\x00' * 4) for tag, _ in pointers]
+    offset = 8 + len(_ifd(entries, 8))
+    sub_ifds = ''
+    for tag, sub_entries in pointers:
+        entries.remove((tag, LONG, 1, '\x00' * 4))
+        entries.append((tag, LONG, 1, struct.pack('>I', offset)))
+        sub_ifd = _ifd(sub_entries, offset)
+        sub_ifds += sub_ifd
+        offset += len(sub_ifd)
+    tiff = 'MM' + struct.pack('>HI', 42, 8) + _ifd(entries, 8) + sub_ifds
+
+    data = '\xff\xd8' + _segment(0xE1, 'Exif\x00\x00' + tiff)
+
+    properties = ''
+    if(title is not None):
+        properties += (
+            '<dc:title><rdf:Alt><rdf:li xml:lang="x-default">%s</rdf:li>'
+            '</rdf:Alt></dc:title>' % escape(title)
+        )
+    if(album is not None):
+        properties += '<elodie:Album>%s</elodie:Album>' % escape(album)
+    if(len(properties) > 0):
+        xmp = (
+            '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="%s">'
+            '<rdf:Description rdf:about="" xmlns:dc="%s" xmlns:elodie="%s">'
+            '%s</rdf:Description></rdf:RDF></x:xmpmeta>'
+        ) % (RDF, DC, ELODIE, properties)
+        data += _segment(0xE1, 'http://ns.adobe.com/xap/1.0/\x00' + xmp)
+
+    # Elodie stops reading at the start of the scan so the image data is
+    #   filler.
+    data += _segment(0xDA, '\x00' * 10)
+    data += _filler(rng, max(0, size - len(data) - 2)) + '\xff\xd9'
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def make_quicktime(path, rng, size, brand='mov', date_taken=None,
+                   latitude=None, longitude=None, title=None, album=None):
+    """Write a QuickTime movie or an MP4 audio file with metadata.
+
+    Movies store the location, title and album as QuickTime user data and
+    half of them also have a creation date and title in a keys/ilst item
+    list like iPhones write. Audio files use iTunes style items.
+
+    :param str path:
+    :param random.Random rng: Used to fill the media data.
+    :param int size: Approximate size of the file in bytes.
+    :param str brand: `mov` or `m4a`.
+    """
+    seconds = 0
+    if(date_taken is not None):
+        seconds = int((date_taken - EPOCH).total_seconds())
+    # Version, flags, creation and modification times, time scale,
+    #   duration and the rest of the header.
+    mvhd = _atom(
+        'mvhd',
+        struct.pack('>IIIII', 0, seconds, seconds, 600, 6000) + '\x00' * 80
+    )
+
+    if(brand == 'm4a'):
+        ftyp = _atom('ftyp', 'M4A \x00\x00\x00\x00M4A mp42isom')
+        items = ''
+        if(title is not None):
+            items += _atom('\xa9nam', _data_atom(title))
+        if(album is not None):
+            items += _atom('\xa9alb', _data_atom(album))
+        udta = _atom('udta', _atom(
+            'meta',
+            '\x00' * 4 + _atom('hdlr', '\x00' * 8 + 'mdir' + '\x00' * 13) +
+            _atom('ilst', items)
+        ))
+        moov = _atom('moov', mvhd + udta)
+    else:
+        ftyp = _atom('ftyp', 'qt  \x00\x00\x02\x00qt  ')
+        user_data = ''
+        if(latitude is not None and longitude is not None):
+            user_data += _atom(
+                '\xa9xyz',
+                _quicktime_text('%+08.4f%+09.4f/' % (latitude, longitude))
+            )
+        if(title is not None):
+            user_data += _atom('\xa9nam', _quicktime_text(title))
+        if(album is not None):
+            user_data += _atom('\xa9alb', _quicktime_text(album))
+        children = mvhd + _atom('udta', user_data)
+
+        keys = []
+        if(date_taken is not None and rng.random() < 0.5):
+            keys.append((CREATION_DATE, date_taken.strftime(
+                '%Y-%m-%dT%H:%M:%S+0000')))
+            if(title is not None):
+                keys.append((TITLE, title))
+        if(len(keys) > 0):
+            children += _atom('meta', _keys_meta(keys))
+        moov = _atom('moov', children)
+
+    data = ftyp + moov
+    mdat_size = max(0, size - len(data) - 8)
+    data += _atom('mdat', _filler(rng, mdat_size))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _choose_kind(rng):
+    value = rng.random()
+    for kind, share in KINDS:
+        if(value < share):
+            return kind
+        value -= share
+    return KINDS[-1][0]
+
+
+def _filler(rng, size):
+    block = ''.join(chr(rng.randint(0, 255)) for i in range(FILLER_SIZE))
+    return (block * (size // FILLER_SIZE + 1))[:size]
+
+
+def _segment(marker, payload):
+    return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+
+def _ascii_entry(tag, value):
+    value += '\x00'
+    return (tag, ASCII, len(value), value)
+
+
+def _coordinate_entry(tag, value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = int(round(((value - degrees) * 60 - minutes) * 60 * 10000))
+    return (tag, RATIONAL, 3, struct.pack(
+        '>IIIIII', degrees, 1, minutes, 1, seconds, 10000))
+
+
+def _ifd(entries, offset):
+    """Lay out an IFD which starts at offset in the TIFF structure.
+
+    :param list entries: (tag, type, count, bytes of the value) tuples.
+    """
+    entries = sorted(entries)
+    values_offset = offset + 2 + 12 * len(entries) + 4
+    header = struct.pack('>H', len(entries))
+    values = ''
+    for tag, type, count, value in entries:
+        header += struct.pack('>HHI', tag, type, count)
+        if(len(value) <= 4):
+            header += value.ljust(4, '\x00')
+        else:
+            header += struct.pack('>I', values_offset + len(values))
+            values += value
+            if(len(values) % 2 == 1):
+                values += '\x00'
+    return header + struct.pack('>I', 0) + values
+
+
+def _atom(type, data):
+    return struct.pack('>I', len(data) + 8) + type + data
+
+
+def _data_atom(value):
+    # Type 1 is UTF-8 text, followed by an empty locale.
+    return _atom('data', struct.pack('>II', 1, 0) + value)
+
+
+def _quicktime_text(value):
+    # Size and language code of the text.
+    return struct.pack('>HH', len(value), 0x55c4) + value
+
+
+def _keys_meta(items):
+    keys = ''.join(
+        struct.pack('>I', len(key) + 8) + 'mdta' + key for key, _ in items
+    )
+    ilst = ''.join(
+        _atom(struct.pack('>I', index + 1), _data_atom(value))
+        for index, (_, value) in enumerate(items)
+    )
+    return (
+        _atom('hdlr', '\x00' * 8 + 'mdta' + '\x00' * 13) +
+        _atom('keys', struct.pack('>II', 0, len(items)) + keys) +
+        _atom('ilst', ilst)
+    )
@@ -0,0 +1,325 @@
+"""
+Benchmarks for importing and updating files and for Elodie's databases.
+
+Each benchmark runs in a temporary folder with its own hash and location
+dbs so nothing in `~/.elodie` is read or changed, and no place names are
+looked up online. Latencies are summarized with :mod:`elodie.stats`.
+"""
+
+import os
+import platform
+import random
+import shutil
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from elodie import constants
+from elodie import stats
+from elodie.benchmarks import corpus
+from elodie.dependencies import get_exiftool
+from elodie.filesystem import FileSystem
+from elodie.localstorage import Db
+from elodie.media.audio import Audio
+from elodie.media.media import Media
+from elodie.media.photo import Photo
+from elodie.media.video import Video
+
+#: Benchmarks which run on a corpus of files.
+FILE_BENCHMARKS = ('import', 'update')
+
+#: Benchmarks which run on databases of a number of entries.
+DB_BENCHMARKS = ('hash_db', 'location_cache')
+
+#: Number of lookups to time in the database benchmarks.
+LOOKUPS = 10000
+
+# Constants which point into ~/.elodie.
+SETTINGS = (
+    'application_directory', 'hash_db', 'legacy_hash_db', 'location_db',
+    'import_journal', 'geolocation_cache_db'
+)
+
+
+@contextmanager
+def workspace():
+    """Run a benchmark in a temporary folder with its own settings.
+
+    :returns: str path of the folder, which is deleted afterwards.
+    """
+    folder = tempfile.mkdtemp(prefix='elodie-benchmark-')
+    application_directory = os.path.join(folder, '.elodie')
+    previous = dict((name, getattr(constants, name)) for name in SETTINGS)
+    for name in SETTINGS:
+        value = previous[name].replace(
+            previous['application_directory'], application_directory)
+        setattr(constants, name, value)
+
+    stats.reset()
+    stats.enable()
+    try:
+        yield folder
+    finally:
+        stats.enable(False)
+        stats.reset()
+        for name, value in previous.iteritems():
+            setattr(constants, name, value)
+        shutil.rmtree(folder)
+
+
+def benchmark_import(count, seed=0, transfer_mode='copy'):
+    """Import a corpus of files into an empty library.
+
+    :param int count: Number of files in the corpus.
+    :param int seed: Seed for generating the corpus.
+    :param str transfer_mode: How files are copied.
+    :returns: dict
+    """
+    with workspace() as folder:
+        rng = random.Random(seed)
+        places = corpus.generate_places(rng)
+        paths = corpus.generate_corpus(
+            os.path.join(folder, 'source'), count, seed, places)
+        size = sum(os.path.getsize(path) for path in paths)
+        destination = os.path.join(folder, 'library')
+
+        # Every place is cached so nothing is looked up online.
+        db = Db()
+        for name, latitude, longitude in places:
+            db.add_location(latitude, longitude, name)
+        db.flush()
+        stats.reset()
+
+        filesystem = FileSystem(db)
+        filesystem.transfer_mode = transfer_mode
+        imported = 0
+        start = time.time()
+        for i in range(0, len(paths), constants.exiftool_batch_size):
+            batch = paths[i:i + constants.exiftool_batch_size]
+            medias = [Media.get_class_by_file(path, [Audio, Photo, Video])
+                      for path in batch]
+            Media.load_exiftool_metadata(
+                [media for media in medias if media is not None])
+            for path, media in zip(batch, medias):
+                with stats.timer('import'):
+                    if(filesystem.process_file(path, destination, media)):
+                        imported += 1
+        db.flush()
+        seconds = time.time() - start
+
+        return {
+            'files': count,
+            'imported': imported,
+            'bytes': size,
+            'seconds': seconds,
+            'files_per_second': count / seconds,
+            'bytes_per_second': size / seconds,
+            'stages': stats.get_stats()
+        }
+
+
+def benchmark_update(count, seed=0):
+    """Write a title and album to a corpus of photos.
+
+    Needs exiftool, which writes the metadata.
+
+    :param int count: Number of photos.
+    :param int seed: Seed for generating the photos.
+    :returns: dict
+    """
+    if(get_exiftool() is None):
+        return {'skipped': 'exiftool is not installed'}
+
+    with workspace() as folder:
+        rng = random.Random(seed)
+        paths = []
+        for i in range(count):
+            path = os.path.join(folder, 'photo_%07d.jpg' % i)
+            corpus.make_jpeg(path, rng, rng.randint(*corpus.SIZES['jpg']),
+                             date_taken=datetime(2015, 1, 1))
+            paths.append(path)
+        stats.reset()
+
+        start = time.time()
+        for path in paths:
+            with stats.timer('update'):
+                Photo(path).write_metadata(title='Title', album='Album')
+        seconds = time.time() - start
+
+        return {
+            'files': count,
+            'seconds': seconds,
+            'files_per_second': count / seconds,
+            'stages': stats.get_stats()
+        }
+
+
+def benchmark_hash_db(size, seed=0):
+    """Add hashes to an empty hash db, then look some up.
+
+    Half of the lookups are for hashes which aren't in the db.
+
+    :param int size: Number of hashes.
+    :param int seed: Seed for generating the hashes.
+    :returns: dict
+    """
+    with workspace():
+        rng = random.Random(seed)
+        db = Db()
+        hashes = ['%064x' % rng.getrandbits(256) for i in range(size)]
+
+        start = time.time()
+        for i, checksum in enumerate(hashes):
+            db.add_hash(checksum, '/library/%d.jpg' % i,
+                        size=rng.randint(1, 10 ** 7), partial=checksum)
+            db.checkpoint()
+        with stats.timer('flush'):
+            db.flush()
+        add_seconds = time.time() - start
+
+        for i in range(LOOKUPS):
+            if(i % 2 == 0):
+                checksum = rng.choice(hashes)
+            else:
+                checksum = '%064x' % rng.getrandbits(256)
+            with stats.timer('check_hash'):
+                db.check_hash(checksum)
+            with stats.timer('might_have_hash'):
+                db.might_have_hash(rng.randint(1, 10 ** 7), checksum)
+
+        return {
+            'size': size,
+            'add_seconds': add_seconds,
+            'adds_per_second': size / add_seconds,
+            'stages': stats.get_stats()
+        }
+
+
+def benchmark_location_cache(size, seed=0):
+    """Add locations to an empty location db, then look names up.
+
+    Half of the lookups are near a location in the db.
+
+    :param int size: Number of locations.
+    :param int seed: Seed for generating the locations.
+    :returns: dict
+    """
+    with workspace():
+        rng = random.Random(seed)
+        db = Db()
+        locations = [
+            (rng.uniform(-80, 80), rng.uniform(-180, 180)) for i in range(size)
+        ]
+
+        start = time.time()
+        for i, (latitude, longitude) in enumerate(locations):
+            db.add_location(latitude, longitude, 'Place %d' % i)
+        add_seconds = time.time() - start
+        with stats.timer('flush'):
+            db.flush()
+
+        distance = constants.location_distance
+        for i in range(LOOKUPS):
+            if(i % 2 == 0):
+                latitude, longitude = rng.choice(locations)
+                latitude += rng.uniform(-0.01, 0.01)
+            else:
+                latitude, longitude = (
+                    rng.uniform(-80, 80), rng.uniform(-180, 180))
+            with stats.timer('get_location_name'):
+                db.get_location_name(latitude, longitude, distance)
+
+        return {
+            'size': size,
+            'add_seconds': add_seconds,
+            'adds_per_second': size / add_seconds,
+            'stages': stats.get_stats()
+        }
+
+
+BENCHMARKS = {
+    'import': benchmark_import,
+    'update': benchmark_update,
+    'hash_db': benchmark_hash_db,
+    'location_cache': benchmark_location_cache
+}
+
+
+def run(benchmarks, files, sizes, seed=0, progress=None):
+    """Run benchmarks and collect their results.
+
+    :param list benchmarks: Names from :data:`BENCHMARKS`.
+    :param list files: Corpus sizes for :data:`FILE_BENCHMARKS`.
+    :param list sizes: Database sizes for :data:`DB_BENCHMARKS`.
+    :param int seed: Seed for generating data.
+    :param progress: Called with the name and size of each benchmark
+        before it runs, if given.
+    :returns: dict which can be saved as JSON.
+    """
+    results = {
+        'commit': get_commit(),
+        'date': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'seed': seed,
+        'benchmarks': {}
+    }
+    for name in benchmarks:
+        counts = files if name in FILE_BENCHMARKS else sizes
+        results['benchmarks'][name] = {}
+        for count in counts:
+            if(progress is not None):
+                progress(name, count)
+            results['benchmarks'][name][str(count)] = BENCHMARKS[name](
+                count, seed)
+    return results
+
+
+def compare(previous, current):
+    """Compare timings in two sets of results.
+
+    :param dict previous: Results from :func:`run`.
+    :param dict current: Results from :func:`run`.
+    :returns: list of (name, previous value, current value, change in
+        percent) for each timing in both.
+    """
+    rows = []
+    previous_values = dict(_timings(previous['benchmarks']))
+    for name, value in _timings(current['benchmarks']):
+        if(name in previous_values and previous_values[name] > 0):
+            old = previous_values[name]
+            rows.append((name, old, value, (value - old) / old * 100))
+    return rows
+
+
+def get_commit():
+    """Get the git commit of the code being benchmarked.
+
+    :returns: str or None if it isn't a git checkout.
+    """
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(
+                ['git', 'rev-parse', 'HEAD'],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=devnull
+            ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _timings(values, prefix=''):
+    """Yield the durations and rates in nested results by their path."""
+    for key in sorted(values):
+        value = values[key]
+        name = '%s/%s' % (prefix, key) if prefix else key
+        if(isinstance(value, dict)):
+            for timing in _timings(value, name):
+                yield timing
+        elif(
+            isinstance(value, float) and
+            key not in ('bytes', 'count', 'files', 'size')
+        ):
+            yield (name, value)
@@ -10,17 +10,67 @@ debug = False
 #: Directory in which to store Elodie settings.
 application_directory = '{}/.elodie'.format(path.expanduser('~'))
 
-#: File in which to store details about media Elodie has seen.
-hash_db = '{}/hash.json'.format(application_directory)
+#: SQLite database in which to store details about media Elodie has seen.
+hash_db = '{}/hash.db'.format(application_directory)
+
+#: JSON hash database used by earlier versions, migrated into hash_db.
+legacy_hash_db = '{}/hash.json'.format(application_directory)
+
+#: Number of hashes to batch before they are committed to hash_db.
+hash_db_batch_size = 100
+
+#: Journal of how far imports got, so an interrupted import can resume.
+import_journal = '{}/import.journal'.format(application_directory)
+
+#: Size of the buffer used to copy files, in bytes.
+copy_buffer_size = 1024 * 1024
 
 #: File in which to store geolocation details about media Elodie has seen.
 location_db = '{}/location.json'.format(application_directory)
 
+#: Where to send requests to MapQuest.
+mapquest_url = 'http://open.mapquestapi.com'
+
+#: Coordinates within this many meters of a known location share its name.
+location_distance = 3000
+
+#: Number of place names to look up at the same time.
+geolocation_jobs = 4
+
+#: Most requests to make to MapQuest per second, on average. Up to
+#: geolocation_jobs requests can be made at once. Can be overridden with
+#: `rate_limit` in the [MapQuest] section of config.ini.
+geolocation_rate_limit = 5
+
+#: Seconds to wait for MapQuest to respond.
+geolocation_timeout = 10
+
+#: Times to retry a request to MapQuest which failed.
+geolocation_retries = 3
+
+#: SQLite database in which to cache responses from MapQuest.
+geolocation_cache_db = '{}/geolocation.db'.format(application_directory)
+
+#: Seconds to keep a cached response from MapQuest.
+geolocation_cache_ttl = 30 * 24 * 60 * 60
+
+#: Number of responses from MapQuest to keep in the cache.
+geolocation_cache_size = 10000
+
+#: Number of locations to batch before they are written to location_db.
+location_db_batch_size = 100
+
+#: Most seconds a location waits to be written to location_db.
+location_db_interval = 30
+
 #: Elodie installation directory.
 script_directory = path.dirname(path.dirname(path.abspath(__file__)))
 
 #: Path to Elodie's ExifTool config file.
 exiftool_config = path.join(script_directory, 'configs', 'ExifTool_config')
 
+#: Number of files to read metadata for with a single exiftool command.
+exiftool_batch_size = 200
+
 #: Accepted language in responses from MapQuest
 accepted_language = 'en'
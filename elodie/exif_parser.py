@@ -0,0 +1,370 @@
+"""
+Read the metadata Elodie needs from a JPEG without pyexiv2 or exiftool.
+
+Only the segments before the image data are read and only the EXIF tags for
+the date and location, and the IPTC and XMP properties for the title and
+album, are decoded. Files this module doesn't understand are read with
+exiftool.
+"""
+
+import struct
+from datetime import datetime
+from xml.etree import cElementTree as ElementTree
+
+EXIF_HEADER = 'Exif\x00\x00'
+PHOTOSHOP_HEADER = 'Photoshop 3.0\x00'
+XMP_HEADER = 'http://ns.adobe.com/xap/1.0/\x00'
+XMP_EXTENSION_HEADER = 'http://ns.adobe.com/xmp/extension/\x00'
+
+# JPEG markers
+APP1 = 0xE1
+APP13 = 0xED
+SOS = 0xDA
+EOI = 0xD9
+
+# Bytes in a single value of each TIFF field type.
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 7: 1, 9: 4, 10: 8}
+ASCII = 2
+SHORT = 3
+LONG = 4
+RATIONAL = 5
+
+# EXIF tags
+IMAGE_DESCRIPTION = 0x010E
+DATE_TIME = 0x0132
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATE_TIME_ORIGINAL = 0x9003
+GPS_LATITUDE_REF = 0x0001
+GPS_LATITUDE = 0x0002
+GPS_LONGITUDE_REF = 0x0003
+GPS_LONGITUDE = 0x0004
+
+# Photoshop image resource which holds IPTC data
+IPTC_RESOURCE = 0x0404
+
+# IPTC datasets as (record, dataset)
+CODED_CHARACTER_SET = (1, 90)
+HEADLINE = (2, 105)
+
+# XMP namespaces
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XML_LANG = '{http://www.w3.org/XML/1998/namespace}lang'
+DC = 'http://purl.org/dc/elements/1.1/'
+ELODIE = 'https://github.com/jmathai/elodie/'
+PHOTOSHOP = 'http://ns.adobe.com/photoshop/1.0/'
+TIFF = 'http://ns.adobe.com/tiff/1.0/'
+XMP_DM = 'http://ns.adobe.com/xmp/1.0/DynamicMedia/'
+
+
+class ParseError(Exception):
+
+    """Raised when a file can't be read by this module."""
+
+    pass
+
+
+def read_jpeg(path):
+    """Read the date, location, title and album of a JPEG.
+
+    The returned dict has the keys `date_taken` (datetime), `latitude` and
+    `longitude` (signed decimal degrees), `title` and `album`, each None if
+    the file doesn't have it.
+
+    :param str path: Path to the file.
+    :returns: dict, or None if the file isn't a JPEG we can read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _read_jpeg(f)
+    except (IOError, ParseError, struct.error):
+        return None
+
+
+def _read_jpeg(f):
+    if(f.read(2) != '\xff\xd8'):
+        raise ParseError('Not a JPEG')
+
+    exif = {}
+    xmp = None
+    iptc = {}
+    while True:
+        marker = _read_marker(f)
+        if(marker == SOS or marker == EOI):
+            break
+        # Markers without a length
+        if(marker == 0x01 or 0xD0 <= marker <= 0xD8):
+            continue
+
+        length = struct.unpack('>H', _read(f, 2))[0] - 2
+        if(length < 0):
+            raise ParseError('Invalid segment length')
+
+        if(marker == APP1):
+            data = _read(f, length)
+            if(data.startswith(EXIF_HEADER) and len(exif) == 0):
+                exif = _read_exif(data[len(EXIF_HEADER):])
+            elif(data.startswith(XMP_HEADER) and xmp is None):
+                xmp = parse_xmp(data[len(XMP_HEADER):])
+            elif(data.startswith(XMP_EXTENSION_HEADER)):
+                raise ParseError('Extended XMP is not supported')
+        elif(marker == APP13):
+            data = _read(f, length)
+            if(data.startswith(PHOTOSHOP_HEADER) and len(iptc) == 0):
+                iptc = _read_iptc(data[len(PHOTOSHOP_HEADER):])
+        else:
+            f.seek(length, 1)
+
+    # Same order of preference as Media.get_exiftool_attributes().
+    description = exif.get('description')
+    if(description is None):
+        description = get_xmp_property(xmp, TIFF, 'ImageDescription')
+    title = None
+    for value in [
+        iptc.get(HEADLINE),
+        get_xmp_property(xmp, PHOTOSHOP, 'Headline'),
+        get_xmp_property(xmp, DC, 'title'),
+        description
+    ]:
+        if(value is not None and len(value.strip()) > 0):
+            title = value.strip()
+            break
+
+    album = get_xmp_property(xmp, ELODIE, 'Album')
+    if(album is None):
+        album = get_xmp_property(xmp, XMP_DM, 'album')
+
+    return {
+        'date_taken': exif.get('date_taken'),
+        'latitude': exif.get('latitude'),
+        'longitude': exif.get('longitude'),
+        'title': title,
+        'album': album
+    }
+
+
+def _read(f, size):
+    data = f.read(size)
+    if(len(data) != size):
+        raise ParseError('Unexpected end of file')
+    return data
+
+
+def _read_marker(f):
+    if(_read(f, 1) != '\xff'):
+        raise ParseError('Expected a marker')
+    marker = _read(f, 1)
+    # Markers may be padded with any number of 0xFF bytes.
+    while(marker == '\xff'):
+        marker = _read(f, 1)
+    return ord(marker)
+
+
+def _read_exif(data):
+    """Read the tags we use from a TIFF structure."""
+    if(data[:2] == 'II'):
+        endian = '<'
+    elif(data[:2] == 'MM'):
+        endian = '>'
+    else:
+        raise ParseError('Invalid byte order')
+
+    magic, offset = _unpack(endian + 'HI', data, 2)
+    if(magic != 42):
+        raise ParseError('Invalid TIFF header')
+
+    exif = {}
+    ifd0 = _read_ifd(data, endian, offset)
+    exif['description'] = _get_ascii(ifd0, IMAGE_DESCRIPTION)
+
+    # DateTimeOriginal is preferred over DateTime, like Photo.exif_map.
+    dates = []
+    if(EXIF_IFD in ifd0):
+        exif_ifd = _read_ifd(data, endian, _get_long(ifd0, EXIF_IFD, endian))
+        dates.append(_get_ascii(exif_ifd, DATE_TIME_ORIGINAL))
+    dates.append(_get_ascii(ifd0, DATE_TIME))
+    for date in dates:
+        exif['date_taken'] = _parse_date(date)
+        if(exif['date_taken'] is not None):
+            break
+
+    if(GPS_IFD in ifd0):
+        gps_ifd = _read_ifd(data, endian, _get_long(ifd0, GPS_IFD, endian))
+        exif['latitude'] = _get_coordinate(
+            gps_ifd, GPS_LATITUDE, GPS_LATITUDE_REF, endian)
+        exif['longitude'] = _get_coordinate(
+            gps_ifd, GPS_LONGITUDE, GPS_LONGITUDE_REF, endian)
+
+    return exif
+
+
+def _read_iptc(data):
+    """Read IPTC datasets from Photoshop image resources.
+
+    :returns: dict of (record, dataset) to a utf-8 string
+    """
+    iptc = {}
+    offset = 0
+    while(offset + 12 <= len(data) and data[offset:offset + 4] == '8BIM'):
+        resource = _unpack('>H', data, offset + 4)[0]
+        # The resource name is a pascal string padded to an even length.
+        name_length = ord(data[offset + 6])
+        offset += 6 + name_length + 1 + (name_length + 1) % 2
+        size = _unpack('>I', data, offset)[0]
+        offset += 4
+        if(offset + size > len(data)):
+            raise ParseError('Resource out of bounds')
+        if(resource == IPTC_RESOURCE):
+            iptc.update(_read_iptc_datasets(data[offset:offset + size]))
+        offset += size + size % 2
+
+    # IPTC strings are latin-1 unless the coded character set says utf-8.
+    if(iptc.get(CODED_CHARACTER_SET) != '\x1b%G'):
+        for key in iptc:
+            iptc[key] = iptc[key].decode('latin-1').encode('utf-8')
+    return iptc
+
+
+def _read_iptc_datasets(data):
+    datasets = {}
+    offset = 0
+    while(offset + 5 <= len(data) and data[offset] == '\x1c'):
+        record, dataset, size = _unpack('>BBH', data, offset + 1)
+        if(size & 0x8000):
+            raise ParseError('Extended IPTC datasets are not supported')
+        offset += 5
+        if(offset + size > len(data)):
+            raise ParseError('Dataset out of bounds')
+        datasets.setdefault((record, dataset), data[offset:offset + size])
+        offset += size
+    return datasets
+
+
+def _read_ifd(data, endian, offset):
+    """Read the entries of an IFD.
+
+    :returns: dict of tag to (type, count, bytes of the value)
+    """
+    entries = {}
+    count = _unpack(endian + 'H', data, offset)[0]
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        tag, type, value_count = _unpack(endian + 'HHI', data, entry)
+        if(type not in TYPE_SIZES):
+            continue
+
+        length = TYPE_SIZES[type] * value_count
+        value_offset = entry + 8
+        if(length > 4):
+            value_offset = _unpack(endian + 'I', data, entry + 8)[0]
+        if(value_offset + length > len(data)):
+            raise ParseError('Value out of bounds')
+        entries[tag] = (
+            type,
+            value_count,
+            data[value_offset:value_offset + length]
+        )
+    return entries
+
+
+def _unpack(format, data, offset):
+    size = struct.calcsize(format)
+    if(offset < 0 or offset + size > len(data)):
+        raise ParseError('Offset out of bounds')
+    return struct.unpack(format, data[offset:offset + size])
+
+
+def _get_ascii(entries, tag):
+    if(tag not in entries or entries[tag][0] != ASCII):
+        return None
+    return entries[tag][2].split('\x00')[0]
+
+
+def _get_long(entries, tag, endian):
+    type, count, value = entries[tag]
+    if(count < 1):
+        raise ParseError('Missing offset')
+    if(type == LONG):
+        return struct.unpack(endian + 'I', value[:4])[0]
+    elif(type == SHORT):
+        return struct.unpack(endian + 'H', value[:2])[0]
+    raise ParseError('Invalid offset type')
+
+
+def _get_coordinate(entries, tag, ref_tag, endian):
+    """Convert a GPS coordinate to signed decimal degrees."""
+    ref = _get_ascii(entries, ref_tag)
+    if(tag not in entries or ref is None or len(ref) == 0):
+        return None
+
+    type, count, value = entries[tag]
+    if(type != RATIONAL or count != 3):
+        raise ParseError('Invalid coordinate')
+
+    parts = struct.unpack(endian + 'IIIIII', value)
+    if(0 in parts[1::2]):
+        raise ParseError('Invalid coordinate')
+
+    degrees, minutes, seconds = [
+        float(parts[i]) / parts[i + 1] for i in range(0, 6, 2)
+    ]
+    sign = 1
+    if(ref[0] in 'WSws'):
+        sign = -1
+    return (degrees + minutes / 60 + seconds / 3600) * sign
+
+
+def _parse_date(value):
+    if(value is None):
+        return None
+    try:
+        return datetime.strptime(value.strip(), '%Y:%m:%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def parse_xmp(packet):
+    """Parse an XMP packet.
+
+    :param str packet:
+    :returns: ElementTree.Element
+    """
+    try:
+        return ElementTree.fromstring(packet.rstrip('\x00'))
+    except SyntaxError:
+        raise ParseError('Invalid XMP')
+
+
+def get_xmp_property(xmp, namespace, name):
+    """Get the value of an XMP property as a utf-8 string.
+
+    Properties can be attributes or elements of an rdf:Description. The
+    x-default entry is used for language alternatives and the first entry
+    for other arrays.
+    """
+    if(xmp is None):
+        return None
+
+    key = '{%s}%s' % (namespace, name)
+    for description in xmp.iter('{%s}Description' % RDF):
+        value = description.get(key)
+        if(value is None):
+            element = description.find(key)
+            if(element is None):
+                continue
+            value = element.text
+            items = element.findall('.//{%s}li' % RDF)
+            if(len(items) > 0):
+                value = items[0].text
+                for item in items:
+                    if(item.get(XML_LANG) == 'x-default'):
+                        value = item.text
+                        break
+
+        if(value is None):
+            return ''
+        if(isinstance(value, unicode)):
+            value = value.encode('utf-8')
+        return value
+
+    return None
@@ -0,0 +1,321 @@
+"""
+Long running exiftool processes shared by the media classes.
+
+Starting exiftool means starting a Perl interpreter, which costs more than
+reading the metadata of a file. Instead of starting a process per file we
+keep a pool of exiftool processes running in `-stay_open` mode and send
+each of them one command at a time over stdin.
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import threading
+from Queue import Queue, Empty
+
+from elodie import constants
+from elodie import stats
+from elodie.dependencies import get_exiftool
+
+
+class ExifTool(object):
+
+    """A single exiftool process which stays open between commands.
+
+    :param str executable: Path to the exiftool executable.
+    :param str config: Path to an ExifTool config file to load, if any.
+    """
+
+    #: Line exiftool prints after the output of each command.
+    sentinel = '{ready}'
+
+    def __init__(self, executable, config=None):
+        args = [executable]
+        # -config has to be the first argument so it is set per process.
+        if(config is not None):
+            args += ['-config', config]
+        args += ['-stay_open', 'True', '-@', '-']
+
+        self.devnull = open(os.devnull, 'w')
+        self.process = subprocess.Popen(
+            args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=self.devnull
+        )
+
+    def execute(self, *args):
+        """Run exiftool with the given arguments and return its output.
+
+        Each argument is written on its own line followed by `-execute`, then
+        we read until exiftool signals it is ready for the next command.
+
+        :param args: Arguments to pass to exiftool.
+        :returns: str
+        """
+        lines = []
+        for arg in args:
+            if(isinstance(arg, unicode)):
+                arg = arg.encode('utf-8')
+            lines.append(arg)
+        lines.append('-execute')
+
+        self.process.stdin.write('%s\n' % '\n'.join(lines))
+        self.process.stdin.flush()
+
+        output = []
+        while True:
+            line = self.process.stdout.readline()
+            if(len(line) == 0):
+                raise IOError('exiftool exited unexpectedly')
+            if(line.rstrip('\r\n') == self.sentinel):
+                break
+            output.append(line)
+
+        return ''.join(output)
+
+    def terminate(self):
+        """Ask exiftool to exit and wait for it."""
+        try:
+            self.process.stdin.write('-stay_open\nFalse\n')
+            self.process.stdin.flush()
+            self.process.communicate()
+        except (IOError, OSError, ValueError):
+            pass
+        self.devnull.close()
+
+
+class ExifToolPool(object):
+
+    """A thread safe pool of :class:`ExifTool` processes.
+
+    Processes are started on demand, up to `size` of them.
+
+    :param int size: Maximum number of processes. Defaults to the number
+        of CPUs.
+    :param str config: Path to an ExifTool config file each process loads.
+    """
+
+    #: Seconds to wait for an idle process before checking whether another
+    #: can be started.
+    timeout = 1
+
+    def __init__(self, size=None, config=None):
+        if(size is None):
+            size = multiprocessing.cpu_count()
+        self.size = size
+        self.config = config
+        self.idle = Queue()
+        self.processes = []
+        self.lock = threading.Lock()
+
+    def execute(self, *args):
+        """Run a command on an idle process from the pool.
+
+        Arguments which can't be written as a line of exiftool's argument
+        file are passed to a new exiftool process instead.
+
+        :param args: Arguments to pass to exiftool.
+        :returns: str or None if exiftool is not available
+        """
+        if(not all(_is_line(arg) for arg in args)):
+            return self._execute_once(*args)
+
+        exiftool = self._acquire()
+        if(exiftool is None):
+            return None
+
+        try:
+            with stats.timer('exiftool'):
+                output = exiftool.execute(*args)
+        except (IOError, OSError) as e:
+            if(constants.debug is True):
+                print e
+            self._discard(exiftool)
+            return None
+
+        self.idle.put(exiftool)
+        return output
+
+    def execute_write(self, *args):
+        """Run a command which updates files.
+
+        :param args: Arguments to pass to exiftool.
+        :returns: bool True if at least one file was updated.
+        """
+        output = self.execute(*args)
+        if(output is None):
+            return False
+
+        return re.search('[1-9][0-9]* image files updated', output) is not None
+
+    def get_metadata(self, paths, tags=()):
+        """Read metadata for many files with a single command.
+
+        We ask exiftool for JSON with numeric values (`-n`) so nothing has to
+        be scraped from its human readable output.
+
+        :param list(str) paths: Files to read.
+        :param tuple(str) tags: Tags to read, i.e. `-Title`. All tags are
+            read if empty.
+        :returns: dict of path to a dict of tag names and values, or None if
+            exiftool is not available. Files exiftool could not read are
+            missing from the result.
+        """
+        if(len(paths) == 0):
+            return {}
+
+        args = ['-json', '-n'] + list(tags) + list(paths)
+        output = self.execute(*args)
+        if(output is None):
+            return None
+        if(len(output.strip()) == 0):
+            return {}
+
+        try:
+            items = json.loads(output)
+        except ValueError as e:
+            if(constants.debug is True):
+                print e
+            return {}
+
+        # exiftool uses forward slashes in SourceFile on all platforms.
+        by_source = {}
+        for item in items:
+            item = _encode(item)
+            by_source[item.pop('SourceFile', '').replace('\\', '/')] = item
+
+        metadata = {}
+        for path in paths:
+            normalized = path.replace('\\', '/')
+            if(normalized in by_source):
+                metadata[path] = by_source[normalized]
+
+        return metadata
+
+    def terminate(self):
+        """Stop all processes in the pool."""
+        with self.lock:
+            processes = self.processes
+            self.processes = []
+            self.idle = Queue()
+
+        for exiftool in processes:
+            exiftool.terminate()
+
+    def _acquire(self):
+        try:
+            return self.idle.get_nowait()
+        except Empty:
+            pass
+
+        # Processes which exited are discarded so we check again whether
+        #   we can start one while waiting.
+        while True:
+            with self.lock:
+                if(len(self.processes) < self.size):
+                    executable = get_exiftool()
+                    if(executable is None):
+                        return None
+                    exiftool = ExifTool(executable, self.config)
+                    self.processes.append(exiftool)
+                    return exiftool
+
+            try:
+                return self.idle.get(timeout=self.timeout)
+            except Empty:
+                pass
+
+    def _execute_once(self, *args):
+        executable = get_exiftool()
+        if(executable is None):
+            return None
+
+        command = [executable]
+        if(self.config is not None):
+            command += ['-config', self.config]
+        command += [
+            arg.encode('utf-8') if isinstance(arg, unicode) else arg
+            for arg in args
+        ]
+        try:
+            with stats.timer('exiftool'), open(os.devnull, 'w') as devnull:
+                process = subprocess.Popen(
+                    command,
+                    stdout=subprocess.PIPE,
+                    stderr=devnull
+                )
+                return process.communicate()[0]
+        except OSError as e:
+            if(constants.debug is True):
+                print e
+            return None
+
+    def _discard(self, exiftool):
+        with self.lock:
+            if(exiftool in self.processes):
+                self.processes.remove(exiftool)
+        exiftool.terminate()
+
+
+def _is_line(arg):
+    """Check whether an argument survives being a line of an argument file.
+
+    exiftool reads each line as one argument, skips lines starting with #
+    and removes whitespace around them.
+    """
+    if(isinstance(arg, unicode)):
+        arg = arg.encode('utf-8')
+    return (
+        '\n' not in arg and
+        '\r' not in arg and
+        not arg.startswith('#') and
+        arg == arg.strip()
+    )
+
+
+def _encode(value):
+    """Convert unicode from exiftool's JSON to utf-8 encoded strings.
+
+    The rest of Elodie works with str so we keep titles and albums that way.
+    """
+    if(isinstance(value, unicode)):
+        return value.encode('utf-8')
+    elif(isinstance(value, dict)):
+        return dict((_encode(k), _encode(v)) for k, v in value.iteritems())
+    elif(isinstance(value, list)):
+        return [_encode(v) for v in value]
+    return value
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_exiftool_pool(config=None):
+    """Get the shared pool of exiftool processes for a config file.
+
+    Processes load their config file when they start so reading and writing
+    with our custom tags use separate pools.
+
+    :param str config: Path to an ExifTool config file, if any.
+    :returns: :class:`ExifToolPool`
+    """
+    with _pools_lock:
+        if(config not in _pools):
+            _pools[config] = ExifToolPool(config=config)
+        return _pools[config]
+
+
+@atexit.register
+def terminate_pools():
+    """Stop all exiftool processes we started."""
+    with _pools_lock:
+        pools = _pools.values()
+        _pools.clear()
+
+    for pool in pools:
+        pool.terminate()
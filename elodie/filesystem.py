@@ -4,19 +4,84 @@ General file system methods.
 .. moduleauthor:: Jaisen Mathai <jaisen@jmathai.com>
 """
 
+import hashlib
 import os
 import re
 import shutil
+import threading
 import time
 
+try:
+    from os import scandir
+except ImportError:
+    from scandir import scandir
+
 from elodie import geolocation
 from elodie import constants
+from elodie import stats
+from elodie import transfer
 from elodie.localstorage import Db
 
 
 class FileSystem(object):
 
-    """A class for interacting with the file system."""
+    """A class for interacting with the file system.
+
+    :meth:`process_file` may be called from several threads at once. Checking
+    for duplicates and claiming a destination path are serialized so two
+    threads never copy the same file or write to the same path.
+
+    :param db: Database to check and record hashes in. Hashes are written
+        in batches to a Db we're given. A new one is created if not given
+        and each hash is written right away.
+    :type db: :class:`~elodie.localstorage.Db`
+    """
+
+    def __init__(self, db=None):
+        # Only the owner of a long lived Db flushes it so hashes added to
+        #   one we create have to be written right away.
+        self.write_hashes = False
+        if(db is None):
+            db = Db()
+            self.write_hashes = True
+        self.db = db
+        #: How files are copied, one of :data:`elodie.transfer.MODES`.
+        self.transfer_mode = 'copy'
+        #: :class:`~elodie.localstorage.ImportJournal` to record copies in.
+        self.journal = None
+        self.in_progress = threading.Condition()
+        self.pending_files = set()
+        self.pending_paths = set()
+        self.buffers = threading.local()
+
+    def copy_with_checksum(self, source, destination):
+        """Copy a file and create its hash while reading it.
+
+        Like shutil.copy2() this also copies permission bits and times. Each
+        thread reuses one buffer of `constants.copy_buffer_size` bytes.
+
+        :param str source: Path of the file to copy.
+        :param str destination: Path to copy the file to.
+        :returns: str SHA-256 hash of the file
+        """
+        buf = getattr(self.buffers, 'buf', None)
+        if(buf is None):
+            buf = bytearray(constants.copy_buffer_size)
+            self.buffers.buf = buf
+
+        hasher = hashlib.sha256()
+        with open(source, 'rb') as fsrc:
+            with open(destination, 'wb') as fdst:
+                while True:
+                    length = fsrc.readinto(buf)
+                    if(not length):
+                        break
+                    chunk = buffer(buf, 0, length)
+                    hasher.update(chunk)
+                    fdst.write(chunk)
+
+        shutil.copystat(source, destination)
+        return hasher.hexdigest()
 
     def create_directory(self, directory_path):
         """Create a directory if it does not already exist.
@@ -59,17 +124,48 @@ class FileSystem(object):
 
         :param str path string: Path to start recursive file listing
         :param tuple(str) extensions: File extensions to include (whitelist)
+        :returns: list(str)
+        """
+        return list(self.iter_all_files(path, extensions))
+
+    def iter_all_files(self, path, extensions=None):
+        """Recursively yield all files which match a path and extension.
+
+        Files are yielded as directories are read so callers can start
+        working before the whole tree has been listed. We use scandir so
+        telling files and directories apart doesn't need a stat() call on
+        most file systems. Like os.walk() symlinks to directories are not
+        followed and directories we can't read are skipped.
+
+        :param str path string: Path to start recursive file listing
+        :param tuple(str) extensions: File extensions to include (whitelist)
+        :returns: generator of str
         """
-        files = []
-        for dirname, dirnames, filenames in os.walk(path):
-            # print path to all filenames.
-            for filename in filenames:
-                if(
-                    extensions is None or
-                    filename.lower().endswith(extensions)
-                ):
-                    files.append(os.path.join(dirname, filename))
-        return files
+        directories = [path]
+        while(len(directories) > 0):
+            # Each directory is read before its files are yielded so the
+            #   time spent listing it can be measured.
+            files = []
+            with stats.timer('walk'):
+                try:
+                    entries = scandir(directories.pop())
+                except OSError:
+                    continue
+
+                for entry in entries:
+                    if(entry.is_dir(follow_symlinks=False)):
+                        directories.append(entry.path)
+                    elif(
+                        (
+                            extensions is None or
+                            entry.name.lower().endswith(extensions)
+                        ) and
+                        entry.is_file()
+                    ):
+                        files.append(entry.path)
+
+            for current_file in files:
+                yield current_file
 
     def get_current_directory(self):
         """Get the current working directory.
@@ -154,7 +250,8 @@ class FileSystem(object):
         ):
             place_name = geolocation.place_name(
                 metadata['latitude'],
-                metadata['longitude']
+                metadata['longitude'],
+                self.db
             )
             if(place_name is not None):
                 path.append(place_name)
@@ -187,34 +284,85 @@ class FileSystem(object):
         file_name = self.get_file_name(media)
         dest_path = os.path.join(dest_directory, file_name)
 
-        db = Db()
-        checksum = db.checksum(_file)
-        if(checksum is None):
-            if(constants.debug is True):
-                print 'Could not get checksum for %s. Skipping...' % _file
-            return
-
-        # If duplicates are not allowed and this hash exists in the db then we
-        #   return
-        if(allow_duplicate is False and db.check_hash(checksum) is True):
-            if(constants.debug is True):
-                print '%s already exists at %s. Skipping...' % (
-                    _file,
-                    db.get_hash(checksum)
-                )
-            return
+        db = self.db
+        stat = os.stat(_file)
+        partial_checksum = db.partial_checksum(_file)
+        # Files with the same content have the same size and partial hash.
+        key = (stat.st_size, partial_checksum)
+        checksum = None
+        if(db.rehash is False):
+            checksum = db.get_cached_checksum(stat)
+
+        with self.in_progress:
+            # Wait for any other thread writing to the same destination or
+            #   copying a file which could be the same as this one.
+            while(
+                dest_path in self.pending_paths or
+                key in self.pending_files
+            ):
+                self.in_progress.wait()
+
+            self.pending_paths.add(dest_path)
+            self.pending_files.add(key)
 
-        self.create_directory(dest_directory)
-
-        if(move is True):
-            stat = os.stat(_file)
-            shutil.move(_file, dest_path)
-            os.utime(dest_path, (stat.st_atime, stat.st_mtime))
-        else:
-            shutil.copy2(_file, dest_path)
-
-        db.add_hash(checksum, dest_path)
-        db.update_hash_db()
+        try:
+            # If duplicates are not allowed and this hash exists in the db
+            #   then we return.
+            # The size and partial hash rule out most new files so we only
+            #   read the whole file up front if it could be a duplicate.
+            if(
+                allow_duplicate is False and
+                db.might_have_hash(stat.st_size, partial_checksum) is True
+            ):
+                if(checksum is None):
+                    checksum = db.checksum(_file)
+                if(db.check_hash(checksum) is True):
+                    if(constants.debug is True):
+                        print '%s already exists at %s. Skipping...' % (
+                            _file,
+                            db.get_hash(checksum)
+                        )
+                    return
+
+            self.create_directory(dest_directory)
+
+            journal = self.journal
+            if(journal is not None):
+                journal.record(_file, 'copying', stat, destination=dest_path)
+
+            if(move is True):
+                if(checksum is None):
+                    checksum = db.checksum(_file)
+                with stats.timer('move'):
+                    shutil.move(_file, dest_path)
+                    os.utime(dest_path, (stat.st_atime, stat.st_mtime))
+            elif(checksum is None and self.transfer_mode == 'copy'):
+                with stats.timer('copy and hash', stat.st_size):
+                    checksum = self.copy_with_checksum(_file, dest_path)
+                db.add_cached_checksum(stat, checksum)
+            else:
+                # Other modes don't read the file in Python so the hash is
+                #   created separately, unless it's cached.
+                if(checksum is None):
+                    checksum = db.checksum(_file)
+                with stats.timer('copy', stat.st_size):
+                    transfer.transfer_file(_file, dest_path,
+                                           self.transfer_mode)
+
+            # The copy is journaled before its hash is added. Another thread
+            #   may commit the hash db at any time and a hash must never be
+            #   committed for a file the journal says is still copying.
+            if(journal is not None):
+                journal.record(_file, 'copied', stat, destination=dest_path,
+                               checksum=checksum, partial=partial_checksum)
+            db.add_hash(checksum, dest_path, self.write_hashes,
+                        size=stat.st_size, partial=partial_checksum)
+            db.checkpoint()
+        finally:
+            with self.in_progress:
+                self.pending_paths.discard(dest_path)
+                self.pending_files.discard(key)
+                self.in_progress.notify_all()
 
         return dest_path
 
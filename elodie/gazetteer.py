@@ -0,0 +1,99 @@
+"""
+Look up place names offline from a GeoNames style gazetteer.
+
+GeoNames publishes lists of cities with their coordinates at
+http://download.geonames.org/export/dump/ (i.e. `cities1000.txt`). Loading
+one into a :class:`~elodie.geoindex.GeoIndex` lets us name a location
+without calling MapQuest.
+"""
+
+from elodie.geoindex import GeoIndex
+
+
+class Gazetteer(object):
+
+    """Reverse geocode coordinates using GeoNames dump files.
+
+    :param str cities: Path to a GeoNames cities file.
+    :param str admin1: Path to a GeoNames `admin1CodesASCII.txt` file used
+        to name states, if given.
+    :param str countries: Path to a GeoNames `countryInfo.txt` file used to
+        name countries, if given.
+    :param int city_distance: A city must be this many meters away or closer
+        to be used as the place name.
+    :param int region_distance: Beyond `city_distance` we use the state or
+        country of a city this many meters away or closer.
+    """
+
+    def __init__(self, cities, admin1=None, countries=None,
+                 city_distance=20000, region_distance=100000):
+        self.city_distance = city_distance
+        self.region_distance = region_distance
+        self.index = GeoIndex()
+        # Each city is stored once as (name, country code, admin1 code) and
+        #   the index refers to it by position.
+        self.cities = []
+        self.states = {}
+        self.countries = {}
+
+        self._load_cities(cities)
+        if(admin1 is not None):
+            self.states = self._load_names(admin1, 0, 1)
+        if(countries is not None):
+            self.countries = self._load_names(countries, 0, 4)
+
+    def reverse_lookup(self, latitude, longitude):
+        """Find the city, state and country for a latitude and longitude.
+
+        The result has the same shape as a MapQuest Nominatim response so it
+        can be used in its place.
+
+        :param float latitude:
+        :param float longitude:
+        :returns: dict, with an empty address if nothing is close enough.
+        """
+        address = {}
+        position = self.index.nearest(latitude, longitude, self.city_distance)
+        if(position is not None):
+            address['city'] = self.cities[position][0]
+        else:
+            position = self.index.nearest(
+                latitude,
+                longitude,
+                self.region_distance
+            )
+
+        if(position is not None):
+            country_code, admin1_code = self.cities[position][1:]
+            state_code = '%s.%s' % (country_code, admin1_code)
+            if(state_code in self.states):
+                address['state'] = self.states[state_code]
+            if(country_code in self.countries):
+                address['country'] = self.countries[country_code]
+
+        return {'address': address}
+
+    def _load_cities(self, cities):
+        with open(cities, 'r') as f:
+            for line in f:
+                columns = line.rstrip('\n').split('\t')
+                if(len(columns) < 11):
+                    continue
+                try:
+                    latitude = float(columns[4])
+                    longitude = float(columns[5])
+                except ValueError:
+                    continue
+                self.index.add(latitude, longitude, len(self.cities))
+                self.cities.append((columns[1], columns[8], columns[10]))
+
+    def _load_names(self, path, code_column, name_column):
+        names = {}
+        with open(path, 'r') as f:
+            for line in f:
+                if(line.startswith('#')):
+                    continue
+                columns = line.rstrip('\n').split('\t')
+                if(len(columns) > max(code_column, name_column)):
+                    names[columns[code_column]] = columns[name_column]
+        return names
@@ -0,0 +1,116 @@
+"""
+A grid based spatial index for finding the closest known place to a
+latitude and longitude.
+"""
+
+from math import ceil, cos, floor, radians, sqrt
+
+#: Radius of the earth in meters.
+EARTH_RADIUS = 6371000
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Get the distance in meters between two points.
+
+    Locations we compare are close together so we use an equirectangular
+    approximation instead of the haversine formula.
+    From http://stackoverflow.com/questions/15736995/how-can-i-quickly-estimate-the-distance-between-two-latitude-longitude-points  # noqa
+
+    :param float lat1: Latitude of the first point.
+    :param float lon1: Longitude of the first point.
+    :param float lat2: Latitude of the second point.
+    :param float lon2: Longitude of the second point.
+    :returns: float
+    """
+    # Take the short way around when crossing the antimeridian.
+    delta_lon = (lon2 - lon1 + 180) % 360 - 180
+    x = radians(delta_lon) * cos(0.5 * radians(lat2 + lat1))
+    y = radians(lat2 - lat1)
+    return EARTH_RADIUS * sqrt(x * x + y * y)
+
+
+class GeoIndex(object):
+
+    """Index values by latitude and longitude.
+
+    Values are put into cells of `cell_size` degrees. Finding the closest
+    value to a point only looks at cells which could hold a value within
+    the threshold instead of at every value.
+
+    :param float cell_size: Size of a cell in degrees.
+    """
+
+    def __init__(self, cell_size=0.1):
+        self.cell_size = cell_size
+        self.longitude_cells = int(round(360 / cell_size))
+        self.cells = {}
+
+    def __len__(self):
+        return sum(len(items) for items in self.cells.itervalues())
+
+    def add(self, latitude, longitude, value):
+        """Add a value at a latitude and longitude.
+
+        :param float latitude:
+        :param float longitude:
+        :param value: Value to return from :meth:`nearest`.
+        """
+        cell = self._cell(latitude, longitude)
+        if(cell not in self.cells):
+            self.cells[cell] = []
+        self.cells[cell].append((latitude, longitude, value))
+
+    def nearest(self, latitude, longitude, threshold_m):
+        """Find the value closest to a latitude and longitude.
+
+        :param float latitude:
+        :param float longitude:
+        :param int threshold_m: The value must be this close to the given
+            latitude and longitude.
+        :returns: The value, or None if there is none within the threshold.
+        """
+        nearest_value = None
+        closest = None
+        for items in self._cells_within(latitude, longitude, threshold_m):
+            for item_lat, item_lon, value in items:
+                d = distance(latitude, longitude, item_lat, item_lon)
+                if(d <= threshold_m and (closest is None or d < closest)):
+                    closest = d
+                    nearest_value = value
+
+        return nearest_value
+
+    def _cell(self, latitude, longitude):
+        row = int(floor(latitude / self.cell_size))
+        column = int(floor((longitude + 180) / self.cell_size))
+        return (row, column % self.longitude_cells)
+
+    def _cells_within(self, latitude, longitude, threshold_m):
+        """Yield the items of each cell which may be within the threshold."""
+        latitude_span = threshold_m / (radians(1) * EARTH_RADIUS)
+        rows = int(ceil(latitude_span / self.cell_size))
+
+        # A degree of longitude gets shorter towards the poles.
+        furthest_latitude = min(abs(latitude) + latitude_span, 90)
+        longitude_scale = cos(radians(furthest_latitude))
+        if(longitude_scale > 0):
+            columns = int(ceil(latitude_span / longitude_scale /
+                               self.cell_size))
+        else:
+            columns = self.longitude_cells
+        columns = min(columns, self.longitude_cells // 2)
+
+        # If the area covers more cells than we have we check them all.
+        if((2 * rows + 1) * (2 * columns + 1) >= len(self.cells)):
+            for items in self.cells.itervalues():
+                yield items
+            return
+
+        row, column = self._cell(latitude, longitude)
+        seen = set()
+        for i in range(row - rows, row + rows + 1):
+            for j in range(column - columns, column + columns + 1):
+                cell = (i, j % self.longitude_cells)
+                if(cell in self.cells and cell not in seen):
+                    seen.add(cell)
+                    yield self.cells[cell]
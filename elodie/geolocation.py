@@ -1,15 +1,70 @@
 """Look up geolocation information for media objects."""
 
-from os import path
+from os import makedirs, path
 from ConfigParser import ConfigParser
+from multiprocessing.pool import ThreadPool
 import fractions
 import pyexiv2
+import threading
+import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 import urllib
 
 from elodie import constants
-from elodie.localstorage import Db
+from elodie import stats
+from elodie.gazetteer import Gazetteer
+from elodie.geoindex import GeoIndex
+from elodie.localstorage import Db, ResponseCache
+
+
+__GAZETTEER__ = None
+__RATE_LIMITER__ = None
+__RESPONSE_CACHE__ = None
+__SESSION__ = None
+__SESSION_LOCK__ = threading.Lock()
+
+
+class RateLimiter(object):
+
+    """Limit calls to `rate` each second with a token bucket.
+
+    The bucket holds up to `burst` tokens and refills at `rate` tokens each
+    second. Each call takes a token, waiting for one if the bucket is
+    empty. A RateLimiter can be shared between threads.
+
+    :param float rate: Calls allowed per second. 0 means no limit.
+    :param int burst: Calls allowed at once after a quiet period.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.lock = threading.Lock()
+        self.updated = time.time()
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        if(self.rate <= 0):
+            return
+
+        with self.lock:
+            now = time.time()
+            self.tokens = min(
+                self.burst,
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            # Taking a token we don't have yet reserves the next one so
+            #   waiting threads are let through in turn.
+            self.tokens -= 1
+            delay = -self.tokens / self.rate
+
+        if(delay > 0):
+            time.sleep(delay)
 
 
 class Fraction(fractions.Fraction):
@@ -28,9 +83,10 @@ class Fraction(fractions.Fraction):
         return fractions.Fraction.from_float(value).limit_denominator(99999)
 
 
-def coordinates_by_name(name):
+def coordinates_by_name(name, db=None):
     # Try to get cached location first
-    db = Db()
+    if(db is None):
+        db = Db()
     cached_coordinates = db.get_location_coordinates(name)
     if(cached_coordinates is not None):
         return {
@@ -74,6 +130,41 @@ def coordinates_by_name(name):
     return None
 
 
+def coordinates_by_names(names, db=None, jobs=None):
+    """Look up the coordinates of many place names at once.
+
+    Each distinct name is looked up once and up to `jobs` lookups run at
+    the same time.
+
+    :param list names: Names of places.
+    :param db: Db to check for cached coordinates.
+    :param int jobs: Number of lookups to run at the same time.
+    :returns: list of what :func:`coordinates_by_name` returns for each name,
+        in the same order.
+    """
+    if(db is None):
+        db = Db()
+    if(jobs is None):
+        jobs = constants.geolocation_jobs
+
+    unique_names = list(set(names))
+    if(len(unique_names) == 0):
+        return []
+
+    pool = ThreadPool(min(jobs, len(unique_names)))
+    try:
+        results = pool.map(
+            lambda name: coordinates_by_name(name, db),
+            unique_names
+        )
+    finally:
+        pool.close()
+        pool.join()
+
+    coordinates = dict(zip(unique_names, results))
+    return [coordinates[name] for name in names]
+
+
 def decimal_to_dms(decimal, signed=True):
     # if decimal is negative we need to make the degrees and minutes
     #   negative also
@@ -112,6 +203,118 @@ def dms_to_decimal(degrees, minutes, seconds, direction=' '):
     ) * sign
 
 
+def get_gazetteer():
+    """Get the offline gazetteer if one is set up in config.ini.
+
+    The gazetteer is loaded the first time it's needed. To use one add a
+    [Gazetteer] section with the path to a GeoNames cities file and,
+    optionally, files to name states and countries.
+
+    :returns: :class:`~elodie.gazetteer.Gazetteer` or None
+    """
+    global __GAZETTEER__
+    # Other threads wait for the gazetteer to load instead of looking up
+    #   places online in the meantime.
+    with __SESSION_LOCK__:
+        if(__GAZETTEER__ is None):
+            __GAZETTEER__ = load_gazetteer() or False
+    return __GAZETTEER__ or None
+
+
+def load_gazetteer():
+    """Load the offline gazetteer set up in config.ini.
+
+    :returns: :class:`~elodie.gazetteer.Gazetteer` or None
+    """
+    config_file = '%s/config.ini' % constants.application_directory
+    if not path.exists(config_file):
+        return None
+
+    config = ConfigParser()
+    config.read(config_file)
+    if('Gazetteer' not in config.sections()):
+        return None
+
+    options = dict(config.items('Gazetteer'))
+    if('cities' not in options):
+        return None
+
+    return Gazetteer(
+        path.expanduser(options['cities']),
+        admin1=path.expanduser(options['admin1'])
+        if 'admin1' in options else None,
+        countries=path.expanduser(options['countries'])
+        if 'countries' in options else None
+    )
+
+
+def get_rate_limiter():
+    """Get the rate limiter shared by requests to MapQuest.
+
+    :returns: :class:`RateLimiter`
+    """
+    global __RATE_LIMITER__
+    with __SESSION_LOCK__:
+        if(__RATE_LIMITER__ is None):
+            rate = constants.geolocation_rate_limit
+            config_file = '%s/config.ini' % constants.application_directory
+            if path.exists(config_file):
+                config = ConfigParser()
+                config.read(config_file)
+                if(
+                    'MapQuest' in config.sections() and
+                    config.has_option('MapQuest', 'rate_limit')
+                ):
+                    rate = config.getfloat('MapQuest', 'rate_limit')
+
+            __RATE_LIMITER__ = RateLimiter(rate, constants.geolocation_jobs)
+    return __RATE_LIMITER__
+
+
+def get_session():
+    """Get the HTTP session shared by requests to MapQuest.
+
+    The session keeps connections open between requests and retries
+    requests which fail to connect or get a server error.
+
+    :returns: requests.Session
+    """
+    global __SESSION__
+    with __SESSION_LOCK__:
+        if(__SESSION__ is None):
+            retry = Retry(
+                total=constants.geolocation_retries,
+                backoff_factor=0.5,
+                status_forcelist=[429, 500, 502, 503, 504]
+            )
+            adapter = HTTPAdapter(
+                pool_maxsize=constants.geolocation_jobs,
+                max_retries=retry
+            )
+            __SESSION__ = requests.Session()
+            __SESSION__.mount('http://', adapter)
+            __SESSION__.mount('https://', adapter)
+    return __SESSION__
+
+
+def get_response_cache():
+    """Get the cache of responses from MapQuest.
+
+    :returns: :class:`~elodie.localstorage.ResponseCache`
+    """
+    global __RESPONSE_CACHE__
+    with __SESSION_LOCK__:
+        if(__RESPONSE_CACHE__ is None):
+            if not path.exists(constants.application_directory):
+                makedirs(constants.application_directory)
+            __RESPONSE_CACHE__ = ResponseCache(
+                constants.geolocation_cache_db,
+                constants.geolocation_cache_ttl,
+                constants.geolocation_cache_size
+            )
+    return __RESPONSE_CACHE__
+
+
 def get_key():
     config_file = '%s/config.ini' % constants.application_directory
     if not path.exists(config_file):
@@ -125,48 +328,166 @@ def get_key():
     return config.get('MapQuest', 'key')
 
 
-def place_name(lat, lon):
+def place_name(lat, lon, db=None):
 
     # Try to get cached location first
-    db = Db()
-    # 3km distace radious for a match
-    cached_place_name = db.get_location_name(lat, lon, 3000)
+    # Locations are written in batches by a Db we were given. One we create
+    #   has to write them before we return.
+    write = False
+    if(db is None):
+        db = Db()
+        write = True
+    cached_place_name = db.get_location_name(
+        lat,
+        lon,
+        constants.location_distance
+    )
     if(cached_place_name is not None):
         return cached_place_name
 
-    lookup_place_name = None
+    lookup_place_name = get_place_name(lat, lon)
+    if(lookup_place_name is not None):
+        db.add_location(lat, lon, lookup_place_name, write)
+        db.checkpoint()
+    return lookup_place_name
+
+
+def prefetch_place_names(coordinates, db=None, jobs=None):
+    """Look up place names for many coordinates and cache them in the db.
+
+    Coordinates close to a location already in the db, or to one looked up
+    here, share its name. So we only look up one point of each cluster of
+    coordinates. Lookups run in `jobs` threads and requests to MapQuest are
+    rate limited. Afterwards :func:`place_name` finds each name in the db.
+
+    :param list coordinates: (latitude, longitude) tuples. Tuples with
+        a None latitude or longitude are skipped.
+    :param db: Db to check and add locations to.
+    :param int jobs: Number of lookups to run at the same time.
+    :returns: int Number of lookups made.
+    """
+    write = False
+    if(db is None):
+        db = Db()
+        write = True
+    if(jobs is None):
+        jobs = constants.geolocation_jobs
+
+    distance = constants.location_distance
+    clusters = GeoIndex()
+    lookups = []
+    for lat, lon in coordinates:
+        if(lat is None or lon is None):
+            continue
+        if(
+            db.get_location_name(lat, lon, distance) is not None or
+            clusters.nearest(lat, lon, distance) is not None
+        ):
+            continue
+        clusters.add(lat, lon, True)
+        lookups.append((lat, lon))
+
+    if(len(lookups) == 0):
+        return 0
+
+    pool = ThreadPool(min(jobs, len(lookups)))
+    try:
+        names = pool.map(lambda point: get_place_name(*point), lookups)
+    finally:
+        pool.close()
+        pool.join()
+
+    for (lat, lon), name in zip(lookups, names):
+        if(name is not None):
+            db.add_location(lat, lon, name)
+    if(write is True):
+        db.flush()
+    else:
+        db.checkpoint()
+    return len(lookups)
+
+
+def place_names(coordinates, db=None, jobs=None):
+    """Get the place names for many coordinates at once.
+
+    See :func:`prefetch_place_names` for how lookups are grouped.
+
+    :param list coordinates: (latitude, longitude) tuples.
+    :param db: Db to check and add locations to.
+    :param int jobs: Number of lookups to run at the same time.
+    :returns: list of str or None for each coordinate, in the same order.
+    """
+    if(db is None):
+        db = Db()
+    prefetch_place_names(coordinates, db, jobs)
+
+    names = []
+    for lat, lon in coordinates:
+        name = None
+        if(lat is not None and lon is not None):
+            name = db.get_location_name(lat, lon, constants.location_distance)
+        names.append(name)
+    return names
+
+
+def get_place_name(lat, lon):
+    """Look up the name of the city, state or country at a location.
+
+    Unlike :func:`place_name` this doesn't use or update the location db.
+
+    :param float lat:
+    :param float lon:
+    :returns: str or None
+    """
     geolocation_info = reverse_lookup(lat, lon)
     if(geolocation_info is not None):
         if('address' in geolocation_info):
             address = geolocation_info['address']
             if('city' in address):
-                lookup_place_name = address['city']
+                return address['city']
             elif('state' in address):
-                lookup_place_name = address['state']
+                return address['state']
             elif('country' in address):
-                lookup_place_name = address['country']
-
-    if(lookup_place_name is not None):
-        db.add_location(lat, lon, lookup_place_name)
-        # TODO: Maybe this should only be done on exit and not for every write.
-        db.update_location_db()
-    return lookup_place_name
+                return address['country']
+    return None
 
 
 def reverse_lookup(lat, lon):
     if(lat is None or lon is None):
         return None
 
+    gazetteer = get_gazetteer()
+    if(gazetteer is not None):
+        return gazetteer.reverse_lookup(lat, lon)
+
+    # About 10 meters apart is the same place.
+    cache_key = 'reverse:%s:%.4f,%.4f' % (
+        constants.accepted_language,
+        lat,
+        lon
+    )
+    cache = get_response_cache()
+    cached_response = cache.get(cache_key)
+    if(cached_response is not None):
+        return cached_response
+
     key = get_key()
+    get_rate_limiter().wait()
 
     try:
         params = {'format': 'json', 'key': key, 'lat': lat, 'lon': lon}
         headers = {"Accept-Language": constants.accepted_language}
-        r = requests.get(
-            'http://open.mapquestapi.com/nominatim/v1/reverse.php?%s' %
-            urllib.urlencode(params), headers=headers
-        )
-        return r.json()
+        with stats.timer('geocode'):
+            r = get_session().get(
+                '%s/nominatim/v1/reverse.php?%s' %
+                (constants.mapquest_url, urllib.urlencode(params)),
+                headers=headers,
+                timeout=constants.geolocation_timeout
+            )
+        response = r.json()
+        if(r.status_code == requests.codes.ok):
+            cache.set(cache_key, response)
+        return response
     except requests.exceptions.RequestException as e:
         if(constants.debug is True):
             print e
@@ -182,17 +503,29 @@ def lookup(name):
     if(name is None or len(name) == 0):
         return None
 
+    cache_key = 'lookup:%s' % ' '.join(name.lower().split())
+    cache = get_response_cache()
+    cached_response = cache.get(cache_key)
+    if(cached_response is not None):
+        return cached_response
+
     key = get_key()
+    get_rate_limiter().wait()
 
     try:
         params = {'format': 'json', 'key': key, 'location': name}
         if(constants.debug is True):
-            print 'http://open.mapquestapi.com/geocoding/v1/address?%s' % urllib.urlencode(params)  # noqa
-        r = requests.get(
-            'http://open.mapquestapi.com/geocoding/v1/address?%s' %
-            urllib.urlencode(params)
-        )
-        return r.json()
+            print '%s/geocoding/v1/address?%s' % (constants.mapquest_url, urllib.urlencode(params))  # noqa
+        with stats.timer('geocode'):
+            r = get_session().get(
+                '%s/geocoding/v1/address?%s' %
+                (constants.mapquest_url, urllib.urlencode(params)),
+                timeout=constants.geolocation_timeout
+            )
+        response = r.json()
+        if(r.status_code == requests.codes.ok):
+            cache.set(cache_key, response)
+        return response
     except requests.exceptions.RequestException as e:
         if(constants.debug is True):
             print e
@@ -4,16 +4,29 @@ Methods for interacting with information Elodie caches about stored media.
 
 import hashlib
 import json
-from math import radians, cos, sqrt
 import os
-import sys
+import sqlite3
+import threading
+import time
 
 from elodie import constants
+from elodie import stats
+from elodie.geoindex import GeoIndex
 
 
 class Db(object):
 
-    """A class for interacting with the JSON files created by Elodie."""
+    """A class for interacting with the databases created by Elodie.
+
+    Hashes are stored in a SQLite database so lookups are indexed and adding
+    a hash does not rewrite the entire database. Locations are stored in a
+    JSON file.
+
+    Added hashes and locations are written in batches. Call :meth:`flush`
+    before exiting to write anything pending.
+
+    A Db can be shared between threads.
+    """
 
     def __init__(self):
         # verify that the application directory (~/.elodie) exists,
@@ -21,21 +34,51 @@ class Db(object):
         if not os.path.exists(constants.application_directory):
             os.makedirs(constants.application_directory)
 
-        # If the hash db doesn't exist we create it.
-        # Otherwise we only open for reading
-        if not os.path.isfile(constants.hash_db):
-            with open(constants.hash_db, 'a'):
-                os.utime(constants.hash_db, None)
-
-        self.hash_db = {}
-
-        # We know from above that this file exists so we open it
-        #   for reading only.
-        with open(constants.hash_db, 'r') as f:
-            try:
-                self.hash_db = json.load(f)
-            except ValueError:
-                pass
+        self.lock = threading.RLock()
+
+        # Connecting creates the hash db if it doesn't exist.
+        # text_factory=str lets us store file paths which are 8-bit strings.
+        # Access from other threads is serialized with self.lock.
+        self.hash_db = sqlite3.connect(
+            constants.hash_db,
+            check_same_thread=False
+        )
+        self.hash_db.text_factory = str
+        self.hash_db.execute('PRAGMA journal_mode=WAL')
+        self.hash_db.execute('PRAGMA synchronous=NORMAL')
+        # size and partial let us rule out duplicates without reading the
+        #   whole file. See might_have_hash().
+        self.hash_db.execute(
+            'CREATE TABLE IF NOT EXISTS hashes '
+            '(checksum TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, '
+            'partial TEXT)'
+        )
+        columns = [
+            row[1] for row in self.hash_db.execute('PRAGMA table_info(hashes)')
+        ]
+        for column in ['size INTEGER', 'partial TEXT']:
+            if(column.split(' ')[0] not in columns):
+                self.hash_db.execute(
+                    'ALTER TABLE hashes ADD COLUMN %s' % column
+                )
+        self.hash_db.execute(
+            'CREATE INDEX IF NOT EXISTS hashes_size ON hashes (size)'
+        )
+        # Checksums of source files keyed by what os.stat() tells us.
+        self.hash_db.execute(
+            'CREATE TABLE IF NOT EXISTS checksum_cache '
+            '(device INTEGER, inode INTEGER, size INTEGER, mtime_ns INTEGER, '
+            'checksum TEXT NOT NULL, PRIMARY KEY (device, inode))'
+        )
+        self._migrate_legacy_hash_db()
+        self.pending_hashes = 0
+
+        # Hashes recorded without a size get one from their file the first
+        #   time might_have_hash() is called.
+        self.hashes_indexed = False
+
+        #: If True checksum() ignores cached checksums and reads every file.
+        self.rehash = False
 
         # If the location db doesn't exist we create it.
         # Otherwise we only open for reading
@@ -53,16 +96,74 @@ class Db(object):
             except ValueError:
                 pass
 
-    def add_hash(self, key, value, write=False):
+        self.location_index = GeoIndex()
+        self.location_names = {}
+        for data in self.location_db:
+            self._index_location(data)
+
+        self.pending_locations = 0
+        self.location_db_written = time.time()
+
+    def _migrate_legacy_hash_db(self):
+        """Import hashes from the JSON hash db used by earlier versions.
+
+        This runs once. After the hashes are committed the JSON file is
+        renamed so it isn't imported again, without replacing a file
+        renamed by an earlier migration. We record the size of each file
+        which still exists so it can be found by :meth:`might_have_hash`.
+        """
+        legacy_hash_db = constants.legacy_hash_db
+        if not os.path.isfile(legacy_hash_db):
+            return
+
+        with open(legacy_hash_db, 'r') as f:
+            try:
+                hashes = json.load(f)
+            except ValueError:
+                hashes = {}
+
+        rows = []
+        for key, value in hashes.iteritems():
+            size = None
+            if(os.path.isfile(value)):
+                size = os.path.getsize(value)
+            rows.append((key, value, size))
+
+        self.hash_db.executemany(
+            'INSERT OR REPLACE INTO hashes (checksum, path, size) '
+            'VALUES (?, ?, ?)',
+            rows
+        )
+        self.hash_db.commit()
+
+        migrated = '%s.migrated' % legacy_hash_db
+        count = 1
+        while(os.path.exists(migrated)):
+            migrated = '%s.migrated.%d' % (legacy_hash_db, count)
+            count += 1
+        os.rename(legacy_hash_db, migrated)
+
+    def add_hash(self, key, value, write=False, size=None, partial=None):
         """Add a hash to the hash db.
 
+        Hashes added without `write` are batched in an open transaction
+        until :meth:`update_hash_db` is called.
+
         :param str key:
         :param str value:
         :param bool write: If true, write the hash db to disk.
+        :param int size: Size of the file in bytes.
+        :param str partial: Hash from :meth:`partial_checksum`.
         """
-        self.hash_db[key] = value
-        if(write is True):
-            self.update_hash_db()
+        with self.lock:
+            self.hash_db.execute(
+                'INSERT OR REPLACE INTO hashes '
+                '(checksum, path, size, partial) VALUES (?, ?, ?, ?)',
+                (key, value, size, partial)
+            )
+            self.pending_hashes += 1
+            if(write is True):
+                self.update_hash_db()
 
     def check_hash(self, key):
         """Check whether a hash is present for the given key.
@@ -70,7 +171,7 @@ class Db(object):
         :param str key:
         :returns: bool
         """
-        return key in self.hash_db
+        return self.get_hash(key) is not None
 
     def get_hash(self, key):
         """Get the hash value for a given key.
@@ -78,43 +179,191 @@ class Db(object):
         :param str key:
         :returns: str or None
         """
-        if(self.check_hash(key) is True):
-            return self.hash_db[key]
-        return None
+        with self.lock:
+            row = self.hash_db.execute(
+                'SELECT path FROM hashes WHERE checksum = ?',
+                (key,)
+            ).fetchone()
+        if(row is None):
+            return None
+        return row[0]
+
+    def might_have_hash(self, size, partial):
+        """Check cheaply whether a file could already be in the hash db.
+
+        A file can only be a duplicate if a file of the same size and with
+        the same partial hash was added. If this returns True the full hash
+        has to be checked with :meth:`check_hash`.
+
+        Hashes added without a size, like those from the JSON hash db, get
+        the size of the file they point to the first time this is called.
+        Ones whose file doesn't exist anymore are left out so the file they
+        were created from can be imported again.
+
+        :param int size: Size of the file in bytes.
+        :param str partial: Hash from :meth:`partial_checksum`.
+        :returns: bool
+        """
+        with self.lock:
+            if(self.hashes_indexed is False):
+                self._index_hashes()
+
+            row = self.hash_db.execute(
+                'SELECT 1 FROM hashes WHERE size = ? AND '
+                '(partial = ? OR partial IS NULL) LIMIT 1',
+                (size, partial)
+            ).fetchone()
+        return row is not None
+
+    def _index_hashes(self):
+        """Record the size of hashes added without one if we can."""
+        rows = self.hash_db.execute(
+            'SELECT checksum, path FROM hashes WHERE size IS NULL'
+        ).fetchall()
+        sizes = []
+        for checksum, path in rows:
+            if(os.path.isfile(path)):
+                sizes.append((os.path.getsize(path), checksum))
+        if(len(sizes) > 0):
+            self.hash_db.executemany(
+                'UPDATE hashes SET size = ? WHERE checksum = ?',
+                sizes
+            )
+            self.update_hash_db()
+        self.hashes_indexed = True
 
     def update_hash_db(self):
-        """Write the hash db to disk."""
-        with open(constants.hash_db, 'w') as f:
-            json.dump(self.hash_db, f)
+        """Commit pending hashes to disk."""
+        with self.lock, stats.timer('hash db write'):
+            self.hash_db.commit()
+            self.pending_hashes = 0
+
+    def checkpoint(self):
+        """Write pending hashes and locations once enough have accumulated.
+
+        A long lived Db calls this after each added hash or location so
+        hashes are written in batches of `constants.hash_db_batch_size`.
+        Locations are written in batches of
+        `constants.location_db_batch_size`, or once the oldest pending one
+        is `constants.location_db_interval` seconds old.
+        """
+        with self.lock:
+            if(self.pending_hashes >= constants.hash_db_batch_size):
+                self.update_hash_db()
+
+            if(
+                self.pending_locations >= constants.location_db_batch_size or
+                (
+                    self.pending_locations > 0 and
+                    time.time() - self.location_db_written >=
+                    constants.location_db_interval
+                )
+            ):
+                self.update_location_db()
+
+    def flush(self):
+        """Write everything pending to disk."""
+        with self.lock:
+            self.update_hash_db()
+            if(self.pending_locations > 0):
+                self.update_location_db()
 
     def checksum(self, file_path, blocksize=65536):
         """Create a hash value for the given file.
 
         See http://stackoverflow.com/a/3431835/1318758.
 
+        The hash is cached by the device, inode, size and modification time
+        of the file so unchanged files aren't read again. Set `rehash` to
+        hash every file again.
+
         :param str file_path: Path to the file to create a hash for.
         :param int blocksize: Read blocks of this size from the file when
             creating the hash.
         :returns: str or None
         """
+        stat = os.stat(file_path)
+        if(self.rehash is False):
+            cached_checksum = self.get_cached_checksum(stat)
+            if(cached_checksum is not None):
+                return cached_checksum
+
         hasher = hashlib.sha256()
-        with open(file_path, 'rb') as f:
+        with stats.timer('hash', stat.st_size), open(file_path, 'rb') as f:
             buf = f.read(blocksize)
 
             while len(buf) > 0:
                 hasher.update(buf)
                 buf = f.read(blocksize)
-            return hasher.hexdigest()
-        return None
+            checksum = hasher.hexdigest()
+        self.add_cached_checksum(stat, checksum)
+        return checksum
+
+    def partial_checksum(self, file_path, blocksize=65536):
+        """Create a hash value from the start and end of the given file.
+
+        Used with the size of the file to rule out duplicates before creating
+        a full hash with :meth:`checksum`.
+
+        :param str file_path: Path to the file to create a hash for.
+        :param int blocksize: Number of bytes to read from each end.
+        :returns: str
+        """
+        hasher = hashlib.sha256()
+        with stats.timer('partial hash'), open(file_path, 'rb') as f:
+            hasher.update(f.read(blocksize))
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            if(size > blocksize):
+                f.seek(max(blocksize, size - blocksize))
+                hasher.update(f.read(blocksize))
+        return hasher.hexdigest()
+
+    def add_cached_checksum(self, stat, checksum):
+        """Remember the checksum of a file.
+
+        The cache is written along with the hash db.
+
+        :param stat: Result of os.stat() for the file.
+        :param str checksum:
+        """
+        # Without inodes (i.e. on Windows) we can't tell files apart.
+        if(stat.st_ino == 0):
+            return
+
+        with self.lock:
+            self.hash_db.execute(
+                'INSERT OR REPLACE INTO checksum_cache '
+                '(device, inode, size, mtime_ns, checksum) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (stat.st_dev, stat.st_ino, stat.st_size, _mtime_ns(stat),
+                 checksum)
+            )
+
+    def get_cached_checksum(self, stat):
+        """Get the cached checksum of a file if it hasn't changed.
+
+        :param stat: Result of os.stat() for the file.
+        :returns: str or None
+        """
+        if(stat.st_ino == 0):
+            return None
+
+        with self.lock:
+            row = self.hash_db.execute(
+                'SELECT checksum FROM checksum_cache WHERE device = ? AND '
+                'inode = ? AND size = ? AND mtime_ns = ?',
+                (stat.st_dev, stat.st_ino, stat.st_size, _mtime_ns(stat))
+            ).fetchone()
+        if(row is None):
+            return None
+        return row[0]
 
     # Location database
-    # Currently quite simple just a list of long/lat pairs with a name
-    # If it gets many entries a lookup might take too long and a better
-    # structure might be needed. Some speed up ideas:
-    # - Sort it and inter-half method can be used
-    # - Use integer part of long or lat as key to get a lower search list
-    # - Cache a small number of lookups, photos are likely to be taken in
-    #   clusters around a spot during import.
+    # A list of long/lat pairs with a name, stored as JSON.
+    # Lookups by coordinates go through a grid index (see elodie.geoindex)
+    # and lookups by name through a dict of normalized names. Both are built
+    # when the db is loaded and kept up to date as locations are added.
 
     def add_location(self, latitude, longitude, place, write=False):
         """Add a location to the database.
@@ -128,9 +377,14 @@ class Db(object):
         data['lat'] = latitude
         data['long'] = longitude
         data['name'] = place
-        self.location_db.append(data)
-        if(write is True):
-            self.update_location_db()
+        with self.lock:
+            self.location_db.append(data)
+            self._index_location(data)
+            if(self.pending_locations == 0):
+                self.location_db_written = time.time()
+            self.pending_locations += 1
+            if(write is True):
+                self.update_location_db()
 
     def get_location_name(self, latitude, longitude, threshold_m):
         """Find a name for a location in the database.
@@ -141,42 +395,315 @@ class Db(object):
             the given latitude and longitude.
         :returns: str, or None if a matching location couldn't be found.
         """
-        last_d = sys.maxint
-        name = None
-        for data in self.location_db:
-            # As threshold is quite small use simple math
-            # From http://stackoverflow.com/questions/15736995/how-can-i-quickly-estimate-the-distance-between-two-latitude-longitude-points  # noqa
-            # convert decimal degrees to radians
-
-            lon1, lat1, lon2, lat2 = map(
-                radians,
-                [longitude, latitude, data['long'], data['lat']]
+        with self.lock:
+            return self.location_index.nearest(
+                latitude,
+                longitude,
+                threshold_m
             )
 
-            r = 6371000  # radius of the earth in m
-            x = (lon2 - lon1) * cos(0.5 * (lat2 + lat1))
-            y = lat2 - lat1
-            d = r * sqrt(x * x + y * y)
-            # Use if closer then threshold_km reuse lookup
-            if(d <= threshold_m and d < last_d):
-                name = data['name']
-            last_d = d
-
-        return name
-
     def get_location_coordinates(self, name):
         """Get the latitude and longitude for a location.
 
+        Names are matched ignoring case and extra whitespace. If several
+        locations have the name we return the first one added.
+
         :param str name: Name of the location.
         :returns: tuple(float), or None if the location wasn't in the database.
         """
-        for data in self.location_db:
-            if data['name'] == name:
-                return (data['lat'], data['long'])
+        with self.lock:
+            return self.location_names.get(_normalize_name(name))
 
-        return None
+    def _index_location(self, data):
+        """Add a location from the location db to the indexes."""
+        self.location_index.add(data['lat'], data['long'], data['name'])
+        self.location_names.setdefault(
+            _normalize_name(data['name']),
+            (data['lat'], data['long'])
+        )
 
     def update_location_db(self):
-        """Write the location db to disk."""
-        with open(constants.location_db, 'w') as f:
-            json.dump(self.location_db, f)
+        """Write the location db to disk.
+
+        The db is written to a temporary file which then replaces the
+        location db, so an interrupted write doesn't lose locations.
+        """
+        with self.lock, stats.timer('location db write'):
+            temporary_path = '%s.tmp' % constants.location_db
+            with open(temporary_path, 'w') as f:
+                json.dump(self.location_db, f)
+                f.flush()
+                os.fsync(f.fileno())
+            try:
+                os.rename(temporary_path, constants.location_db)
+            except OSError:
+                # Windows won't rename over an existing file.
+                os.remove(constants.location_db)
+                os.rename(temporary_path, constants.location_db)
+            self.pending_locations = 0
+            self.location_db_written = time.time()
+
+
+class ResponseCache(object):
+
+    """An on disk cache of JSON responses from a web service.
+
+    Responses expire after `ttl` seconds. Once there are more than `size`
+    responses the least recently used ones are removed.
+
+    A ResponseCache can be shared between threads.
+
+    :param str path: Path of the SQLite database to store responses in.
+    :param int ttl: Seconds to keep a response.
+    :param int size: Number of responses to keep.
+    """
+
+    def __init__(self, path, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.text_factory = str
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses '
+            '(key TEXT PRIMARY KEY, response TEXT NOT NULL, '
+            'created REAL NOT NULL, accessed REAL NOT NULL)'
+        )
+        self.db.execute(
+            'CREATE INDEX IF NOT EXISTS responses_accessed '
+            'ON responses (accessed)'
+        )
+        self.db.commit()
+
+    def get(self, key):
+        """Get a cached response.
+
+        :param str key:
+        :returns: The decoded response, or None if there is no fresh one.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute(
+                'SELECT response FROM responses WHERE key = ? AND created > ?',
+                (key, now - self.ttl)
+            ).fetchone()
+            if(row is None):
+                return None
+
+            self.db.execute(
+                'UPDATE responses SET accessed = ? WHERE key = ?',
+                (now, key)
+            )
+            self.db.commit()
+        return json.loads(row[0])
+
+    def set(self, key, response):
+        """Cache a response and evict old ones.
+
+        :param str key:
+        :param response: A response which can be encoded as JSON.
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(key, response, created, accessed) VALUES (?, ?, ?, ?)',
+                (key, json.dumps(response), now, now)
+            )
+            self.db.execute(
+                'DELETE FROM responses WHERE created <= ?',
+                (now - self.ttl,)
+            )
+            self.db.execute(
+                'DELETE FROM responses WHERE key IN (SELECT key FROM '
+                'responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                (self.size,)
+            )
+            self.db.commit()
+
+
+class ImportJournal(object):
+
+    """An append-only record of how far imports got with each source file.
+
+    Each line of the journal is a JSON object with the source and library
+    paths, the state the import of the source reached and the size and
+    modification time the source had. The states are:
+
+    * `copying` is written before the source is copied to `destination`.
+    * `copied` is written once the copy is complete and its `checksum` was
+      added to the hash db.
+
+    Sources aren't journaled when they're found, read or hashed. Walking
+    and reading a file's metadata is cheaper than writing and syncing a
+    line for it, and a file which was copied is skipped on its size and
+    modification time without being read or hashed again. Files copied
+    before the journal was last compacted are skipped once their hash is
+    found in the hash db.
+
+    A line that was cut short by a crash is ignored. Once the hash db was
+    written to disk :meth:`compact` rewrites the journal with only the
+    sources which are still being copied, so it only grows with unfinished
+    work.
+
+    An ImportJournal can be shared between threads.
+
+    :param str path: Path of the journal file.
+    :param str library: Path of the library files are imported into.
+    """
+
+    def __init__(self, path, library):
+        self.path = path
+        self.library = os.path.abspath(library)
+        self.lock = threading.Lock()
+        # Latest entry for each source imported into this library.
+        self.entries = {}
+
+        if os.path.isfile(path):
+            with open(path, 'r') as f:
+                for line in f:
+                    entry = self._parse(line)
+                    if(entry is not None):
+                        self.entries[entry['source']] = entry
+
+        self.journal = open(path, 'a')
+
+    def get(self, source, stat):
+        """Get the entry for a source file if it hasn't changed since.
+
+        :param str source: Path of the source file.
+        :param stat: Result of os.stat() for the source file.
+        :returns: dict or None
+        """
+        entry = self.entries.get(os.path.abspath(source))
+        if(
+            entry is None or
+            entry['size'] != stat.st_size or
+            entry['mtime'] != stat.st_mtime
+        ):
+            return None
+        return entry
+
+    def record(self, source, state, stat, **kwargs):
+        """Append the state of a source file to the journal.
+
+        The line is flushed so it survives the process crashing; it's
+        synced to disk with :meth:`sync`.
+
+        :param str source: Path of the source file.
+        :param str state: One of `copying` or `copied`.
+        :param stat: Result of os.stat() for the source file.
+        :param kwargs: Other values to store, like the `destination`.
+        """
+        entry = dict(kwargs)
+        entry.update({
+            'library': self.library,
+            'source': os.path.abspath(source),
+            'state': state,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime
+        })
+        try:
+            line = json.dumps(entry)
+        except UnicodeDecodeError:
+            # Paths which aren't utf-8 can't be stored so they're redone.
+            return
+        with self.lock:
+            self.journal.write('%s\n' % line)
+            self.journal.flush()
+            self.entries[entry['source']] = entry
+
+    def sync(self):
+        """Write recorded states to disk."""
+        with self.lock:
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def compact(self):
+        """Forget copied files and rewrite the journal.
+
+        Call this once the hash db has been written to disk, which then
+        has the hashes of every copied file. Lines of other libraries are
+        copied over as they are. The journal is written to a temporary file
+        which then replaces it.
+        """
+        with self.lock:
+            self.entries = dict(
+                (source, entry) for source, entry in self.entries.iteritems()
+                if entry['state'] == 'copying'
+            )
+
+            self.journal.close()
+            temporary_path = '%s.tmp' % self.path
+            with open(temporary_path, 'w') as f:
+                with open(self.path, 'r') as journal:
+                    for line in journal:
+                        # Lines cut short by a crash are left out.
+                        if(
+                            line.endswith('\n') and
+                            self._library_key not in line
+                        ):
+                            f.write(line)
+                for entry in self.entries.itervalues():
+                    f.write('%s\n' % json.dumps(entry))
+                f.flush()
+                os.fsync(f.fileno())
+
+            try:
+                os.rename(temporary_path, self.path)
+            except OSError:
+                # Windows won't rename over an existing file.
+                os.remove(self.path)
+                os.rename(temporary_path, self.path)
+            self.journal = open(self.path, 'a')
+
+    @property
+    def _library_key(self):
+        # How this library appears in every line of the journal for it.
+        return '"library": %s' % json.dumps(self.library)
+
+    def _parse(self, line):
+        """Parse a line of the journal if it's for this library.
+
+        :returns: dict or None
+        """
+        # Lines of other libraries are skipped without parsing them.
+        if(self._library_key not in line):
+            return None
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return None
+        # File paths are 8-bit strings like os.path returns.
+        for key in ('library', 'source', 'destination'):
+            if(isinstance(entry.get(key), unicode)):
+                entry[key] = entry[key].encode('utf-8')
+        if(entry['library'] != self.library):
+            return None
+        return entry
+
+    def close(self):
+        with self.lock:
+            self.journal.close()
+
+
+def _normalize_name(name):
+    """Normalize a location name so lookups ignore case and whitespace.
+
+    :param str name:
+    :returns: str
+    """
+    if(name is None):
+        return None
+    return ' '.join(name.lower().split())
+
+
+def _mtime_ns(stat):
+    """Get the modification time of a file in nanoseconds.
+
+    :param stat: Result of os.stat() for the file.
+    :returns: int
+    """
+    if(hasattr(stat, 'st_mtime_ns')):
+        return stat.st_mtime_ns
+    return int(stat.st_mtime * 1000000000)
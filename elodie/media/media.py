@@ -11,13 +11,13 @@ are used to represent the actual files.
 
 # load modules
 from elodie import constants
-from elodie.dependencies import get_exiftool
+from elodie.exiftool import get_exiftool_pool
 
+from datetime import datetime
 import mimetypes
 import os
 import pyexiv2
 import re
-import subprocess
 
 
 class Media(object):
@@ -34,6 +34,21 @@ class Media(object):
         'longitude': 'longitude_ref'
     }
 
+    #: Tags read with exiftool. Composite GPS values are signed decimals.
+    exiftool_tags = (
+        '-Album',
+        '-DisplayName',
+        '-Headline',
+        '-Title',
+        '-ImageDescription',
+        '-CreationDate',
+        '-MediaCreateDate',
+        '-DateTimeOriginal',
+        '-ModifyDate',
+        '-Composite:GPSLatitude',
+        '-Composite:GPSLongitude'
+    )
+
     def __init__(self, source=None):
         self.source = source
         self.exif_map = {
@@ -44,7 +59,10 @@ class Media(object):
             'longitude_ref': 'Exif.GPSInfo.GPSLongitudeRef',
         }
         self.exiftool_attributes = None
+        self.exiftool_metadata = None
         self.metadata = None
+        # Result of is_valid(), which subclasses cache here
+        self.valid = None
 
     def get_album(self):
         """Get album from EXIF
@@ -105,31 +123,18 @@ class Media(object):
         if(self.exiftool_attributes is not None):
             return self.exiftool_attributes
 
-        exiftool = get_exiftool()
-        if(exiftool is None):
+        exiftool_metadata = self.get_exiftool_metadata()
+        if(exiftool_metadata is None):
             return False
 
-        source = self.source
-        process_output = subprocess.Popen(
-            '%s "%s"' % (exiftool, source),
-            stdout=subprocess.PIPE,
-            shell=True,
-            universal_newlines=True
-        )
-        output = process_output.stdout.read()
-
-        # Get album from exiftool output
         album = None
-        album_regex = re.search('Album +: +(.+)', output)
-        if(album_regex is not None):
-            album = album_regex.group(1)
+        if('Album' in exiftool_metadata):
+            album = str(exiftool_metadata['Album'])
 
-        # Get title from exiftool output
         title = None
-        for key in ['Displayname', 'Headline', 'Title', 'ImageDescription']:
-            title_regex = re.search('%s +: +(.+)' % key, output)
-            if(title_regex is not None):
-                title_return = title_regex.group(1).strip()
+        for key in ['DisplayName', 'Headline', 'Title', 'ImageDescription']:
+            if(key in exiftool_metadata):
+                title_return = str(exiftool_metadata[key]).strip()
                 if(len(title_return) > 0):
                     title = title_return
                     break
@@ -141,6 +146,71 @@ class Media(object):
 
         return self.exiftool_attributes
 
+    def get_exiftool_coordinate(self, type='latitude'):
+        """Get latitude or longitude from exiftool.
+
+        exiftool gives us the composite GPS values as signed decimals.
+
+        :param str type: Type of coordinate to get. Either "latitude" or
+            "longitude".
+        :returns: float or None if not present
+        """
+        exiftool_metadata = self.get_exiftool_metadata()
+        if(exiftool_metadata is None):
+            return None
+
+        key = 'GPS%s' % type.capitalize()
+        if(key not in exiftool_metadata):
+            return None
+
+        try:
+            return float(exiftool_metadata[key])
+        except (TypeError, ValueError):
+            return None
+
+    def get_exiftool_dates(self, keys):
+        """Get dates from exiftool.
+
+        Dates are in %Y:%m:%d %H:%M:%S format and any time zone after that
+        is ignored.
+
+        :param list keys: Tags in `exiftool_tags` to get dates from.
+        :returns: list of datetime in the same order as the keys, leaving
+            out missing or invalid dates.
+        """
+        exiftool_metadata = self.get_exiftool_metadata()
+        if(exiftool_metadata is None):
+            return []
+
+        dates = []
+        for key in keys:
+            if(key not in exiftool_metadata):
+                continue
+            date = re.match('([0-9: ]+)', str(exiftool_metadata[key]))
+            if(date is not None):
+                try:
+                    dates.append(datetime.strptime(
+                        date.group(1),
+                        '%Y:%m:%d %H:%M:%S'
+                    ))
+                except ValueError:
+                    pass
+        return dates
+
+    def get_exiftool_metadata(self):
+        """Get the tags in `exiftool_tags` for the media object.
+
+        This is normally loaded for many files at once by
+        :meth:`load_exiftool_metadata`. If it wasn't we read it for this file
+        alone.
+
+        :returns: dict, or None if exiftool was not available.
+        """
+        if(self.exiftool_metadata is None):
+            self.load_exiftool_metadata([self])
+
+        return self.exiftool_metadata
+
     def get_extension(self):
         """Get the file extension as a lowercased string.
 
@@ -220,24 +290,32 @@ class Media(object):
         if(name is None):
             return False
 
-        exiftool = get_exiftool()
-        if(exiftool is None):
+        if(self.write_exiftool('-xmp-elodie:Album=%s' % name) is False):
             return False
 
+        self.set_metadata(album=name)
+        return True
+
+    def write_exiftool(self, *args):
+        """Write tags to the file with a single exiftool command.
+
+        The file's access and modification times are kept and the backup
+        exiftool makes is removed.
+
+        :param args: Tag assignments to pass to exiftool, i.e.
+            `-xmp-elodie:Album=Foo`.
+        :returns: bool
+        """
         source = self.source
         stat = os.stat(source)
         exiftool_config = constants.exiftool_config
         if(constants.debug is True):
-            print '%s -config "%s" -xmp-elodie:Album="%s" "%s"' % (exiftool, exiftool_config, name, source)  # noqa
-        process_output = subprocess.Popen(
-            '%s -config "%s" -xmp-elodie:Album="%s" "%s"' %
-            (exiftool, exiftool_config, name, source),
-            stdout=subprocess.PIPE,
-            shell=True
+            print 'exiftool -config "%s" %s "%s"' % (exiftool_config, ' '.join('"%s"' % arg for arg in args), source)  # noqa
+        updated = get_exiftool_pool(exiftool_config).execute_write(
+            *(list(args) + [source])
         )
-        process_output.communicate()
 
-        if(process_output.returncode != 0):
+        if(updated is False):
             return False
 
         os.utime(source, (stat.st_atime, stat.st_mtime))
@@ -246,9 +324,46 @@ class Media(object):
         if(os.path.isfile(exiftool_backup_file) is True):
             os.remove(exiftool_backup_file)
 
-        self.set_metadata(album=name)
+        self.reset_cache()
         return True
 
+    def write_metadata(self, date_taken=None, latitude=None, longitude=None,
+                       title=None, album=None):
+        """Write several metadata values to the file at once.
+
+        Only the values which aren't None are written. This calls the
+        individual set methods; subclasses override it to update the file
+        in a single pass.
+
+        :param datetime date_taken: When the file was taken.
+        :param float latitude: Latitude of the file.
+        :param float longitude: Longitude of the file.
+        :param str title: Title of the file.
+        :param str album: Name of the album.
+        :returns: bool True if every value was written.
+        """
+        written = True
+        if(date_taken is not None):
+            written = self.set_date_taken(date_taken) and written
+        if(latitude is not None and longitude is not None):
+            written = self.set_location(latitude, longitude) and written
+        if(title is not None):
+            written = self.set_title(title) and written
+        if(album is not None):
+            written = self.set_album(album) and written
+        return written
+
+    def reset_cache(self):
+        """Forget what was read from the file so it's read again.
+
+        Methods which write to the file call this. Subclasses which store
+        more of what they read extend it.
+        """
+        self.exiftool_attributes = None
+        self.exiftool_metadata = None
+        self.metadata = None
+        self.valid = None
+
     def set_album_from_folder(self):
         metadata = self.get_metadata()
 
@@ -291,6 +406,13 @@ class Media(object):
             if(key in metadata):
                 self.metadata[key] = kwargs[key]
 
+    def needs_exiftool_metadata(self):
+        """Check whether the getters use metadata read by exiftool.
+
+        :returns: bool
+        """
+        return True
+
     @classmethod
     def get_class_by_file(cls, _file, classes):
         extension = os.path.splitext(_file)[1][1:].lower()
@@ -301,6 +423,30 @@ class Media(object):
 
         return None
 
+    @classmethod
+    def load_exiftool_metadata(cls, media_list):
+        """Read exiftool metadata for many media objects with one command.
+
+        Each media object gets its `exiftool_metadata` populated so calls
+        to its getters don't start another exiftool command.
+
+        :param list media_list: Media objects to load metadata for. Those
+            which don't need exiftool are skipped.
+        """
+        media_list = [
+            media for media in media_list if media.needs_exiftool_metadata()
+        ]
+        if(len(media_list) == 0):
+            return
+
+        sources = [media.source for media in media_list]
+        metadata = get_exiftool_pool().get_metadata(sources, cls.exiftool_tags)
+        if(metadata is None):
+            return
+
+        for media in media_list:
+            media.exiftool_metadata = metadata.get(media.source, {})
+
     @classmethod
     def get_valid_extensions(cls):
         """Static method to access static extensions variable.
@@ -12,9 +12,10 @@ import re
 import subprocess
 import time
 
-from elodie import constants
+from elodie import exif_parser
 from media import Media
 from elodie import geolocation
+from elodie import stats
 
 
 class Photo(Media):
@@ -34,6 +35,14 @@ class Photo(Media):
 
         # We only want to parse EXIF once so we store it here
         self.exif = None
+        # Metadata from elodie.exif_parser, False if it couldn't be read
+        self.jpeg_metadata = None
+
+    def reset_cache(self):
+        """Forget what was read from the photo so it's read again."""
+        super(Photo, self).reset_cache()
+        self.exif = None
+        self.jpeg_metadata = None
 
     def get_duration(self):
         """Get the duration of a photo in seconds. Uses ffmpeg/ffprobe.
@@ -67,23 +76,11 @@ class Photo(Media):
         if(not self.is_valid()):
             return None
 
-        key = self.exif_map[type]
-        exif = self.get_exif()
-
-        if(key not in exif):
-            return None
-
-        try:
-            # this is a hack to get the proper direction by negating the
-            #   values for S and W
-            coords = exif[key].value
-            return geolocation.dms_to_decimal(
-                *coords,
-                direction=exif[self.exif_map[self.d_coordinates[type]]].value
-            )
+        jpeg_metadata = self.get_jpeg_metadata()
+        if(jpeg_metadata is not None):
+            return jpeg_metadata[type]
 
-        except KeyError:
-            return None
+        return self.get_exiftool_coordinate(type)
 
     def get_date_taken(self):
         """Get the date which the photo was taken.
@@ -104,39 +101,91 @@ class Photo(Media):
         #   the conversion in the local timezone
         # EXIF DateTime is already stored as a timestamp
         # Sourced from https://github.com/photo/frontend/blob/master/src/libraries/models/Photo.php#L500  # noqa
-        exif = self.get_exif()
-        for key in self.exif_map['date_taken']:
-            try:
-                if(key in exif):
-                    if(re.match('\d{4}(-|:)\d{2}(-|:)\d{2}', str(exif[key].value)) is not None):  # noqa
-                        seconds_since_epoch = time.mktime(exif[key].value.timetuple())  # noqa
-                        break
-            except BaseException as e:
-                if(constants.debug is True):
-                    print e
-                pass
+        jpeg_metadata = self.get_jpeg_metadata()
+        if(jpeg_metadata is not None):
+            dates = [jpeg_metadata['date_taken']]
+        else:
+            dates = self.get_exiftool_dates(['DateTimeOriginal', 'ModifyDate'])
+        for date in dates:
+            if(date is not None):
+                seconds_since_epoch = time.mktime(date.timetuple())
+                break
 
         if(seconds_since_epoch == 0):
             return None
 
         return time.gmtime(seconds_since_epoch)
 
+    def get_exiftool_attributes(self):
+        """Get the album and title of the photo.
+
+        JPEGs are read with :mod:`elodie.exif_parser` instead of exiftool.
+
+        :returns: dict, or False if exiftool was not available.
+        """
+        if(self.exiftool_attributes is not None):
+            return self.exiftool_attributes
+
+        jpeg_metadata = self.get_jpeg_metadata()
+        if(jpeg_metadata is None):
+            return super(Photo, self).get_exiftool_attributes()
+
+        self.exiftool_attributes = {
+            'album': jpeg_metadata['album'],
+            'title': jpeg_metadata['title']
+        }
+        return self.exiftool_attributes
+
+    def get_jpeg_metadata(self):
+        """Read the photo's metadata without pyexiv2 or exiftool.
+
+        This only reads the start of the file, which is much faster than
+        parsing every tag. We store the result so it's only read once. Other
+        photos are read with exiftool, see
+        :meth:`~elodie.media.media.Media.get_exiftool_metadata`.
+
+        :returns: dict from :func:`elodie.exif_parser.read_jpeg`, or None if
+            the photo isn't a JPEG it can read.
+        """
+        if(not self.is_valid()):
+            return None
+
+        if(self.jpeg_metadata is None):
+            with stats.timer('parse jpeg'):
+                self.jpeg_metadata = (
+                    exif_parser.read_jpeg(self.source) or False
+                )
+
+        return self.jpeg_metadata or None
+
+    def needs_exiftool_metadata(self):
+        """JPEGs we can read ourselves don't need exiftool.
+
+        :returns: bool
+        """
+        return self.get_jpeg_metadata() is None
+
     def is_valid(self):
         """Check the file extension against valid file extensions.
 
         The list of valid file extensions come from self.extensions. This
-        also checks whether the file is an image.
+        also checks whether the file is an image. The result is cached.
 
         :returns: bool
         """
+        if(self.valid is not None):
+            return self.valid
+
         source = self.source
 
         # gh-4 This checks if the source file is an image.
         # It doesn't validate against the list of supported types.
-        if(imghdr.what(source) is None):
-            return False
-
-        return os.path.splitext(source)[1][1:].lower() in self.extensions
+        with stats.timer('validate'):
+            self.valid = (
+                os.path.splitext(source)[1][1:].lower() in self.extensions and
+                imghdr.what(source) is not None
+            )
+        return self.valid
 
     def set_date_taken(self, time):
         """Set the date/time a photo was taken.
@@ -160,6 +209,7 @@ class Photo(Media):
                 exif_metadata[key] = pyexiv2.ExifTag(key, time)
 
         exif_metadata.write()
+        self.reset_cache()
         return True
 
     def set_location(self, latitude, longitude):
@@ -182,6 +232,7 @@ class Photo(Media):
         exif_metadata['Exif.GPSInfo.GPSLongitudeRef'] = pyexiv2.ExifTag('Exif.GPSInfo.GPSLongitudeRef', 'E' if longitude >= 0 else 'W')  # noqa
 
         exif_metadata.write()
+        self.reset_cache()
         return True
 
     def set_title(self, title):
@@ -200,4 +251,42 @@ class Photo(Media):
         exif_metadata['Xmp.dc.title'] = title
 
         exif_metadata.write()
+        self.reset_cache()
         return True
+
+    def write_metadata(self, date_taken=None, latitude=None, longitude=None,
+                       title=None, album=None):
+        """Write several metadata values to the photo with one exiftool
+        command.
+
+        Only the values which aren't None are written.
+
+        :param datetime date_taken: When the photo was taken.
+        :param float latitude: Latitude of the file.
+        :param float longitude: Longitude of the file.
+        :param str title: Title of the photo.
+        :param str album: Name of the album.
+        :returns: bool
+        """
+        args = []
+        if(date_taken is not None):
+            value = date_taken.strftime('%Y:%m:%d %H:%M:%S')
+            # Same tags as set_date_taken().
+            args.append('-exif:DateTimeOriginal=%s' % value)
+            args.append('-exif:ModifyDate=%s' % value)
+        if(latitude is not None and longitude is not None):
+            args.append('-exif:GPSLatitude=%s' % abs(latitude))
+            args.append('-exif:GPSLatitudeRef=%s' % (
+                'N' if latitude >= 0 else 'S'))
+            args.append('-exif:GPSLongitude=%s' % abs(longitude))
+            args.append('-exif:GPSLongitudeRef=%s' % (
+                'E' if longitude >= 0 else 'W'))
+        if(title is not None):
+            args.append('-xmp-dc:Title=%s' % title)
+        if(album is not None):
+            args.append('-xmp-elodie:Album=%s' % album)
+
+        if(len(args) == 0):
+            return False
+
+        return self.write_exiftool(*args)
@@ -18,7 +18,8 @@ import time
 
 from elodie import constants
 from elodie import plist_parser
-from elodie.dependencies import get_exiftool
+from elodie import quicktime_parser
+from elodie import stats
 from media import Media
 
 
@@ -37,6 +38,14 @@ class Video(Media):
     def __init__(self, source=None):
         super(Video, self).__init__(source)
 
+        # Metadata from elodie.quicktime_parser, False if it couldn't be read
+        self.quicktime_metadata = None
+
+    def reset_cache(self):
+        """Forget what was read from the video so it's read again."""
+        super(Video, self).reset_cache()
+        self.quicktime_metadata = None
+
     def get_avmetareadwrite(self):
         """Get path to executable avmetareadwrite binary.
 
@@ -53,31 +62,20 @@ class Video(Media):
         return avmetareadwrite
 
     def get_coordinate(self, type='latitude'):
-        """Get latitude or longitude of photo from EXIF.
+        """Get latitude or longitude of the video.
 
-        :returns: time object or None for non-video files or 0 timestamp
+        :param str type: Type of coordinate to get. Either "latitude" or
+            "longitude".
+        :returns: float or None if not present in EXIF or a non-video file
         """
-        exif_data = self.get_exif()
-        if(exif_data is None):
-            return None
-
-        coords = re.findall('(GPS %s +: .+)' % type.capitalize(), exif_data)
-        if(coords is None or len(coords) == 0):
-            return None
-
-        coord_string = coords[0]
-        coordinate = re.findall('([0-9.]+)', coord_string)
-        direction = re.search('[NSEW]$', coord_string)
-        if(coordinate is None or direction is None):
+        if(not self.is_valid()):
             return None
 
-        direction = direction.group(0)
+        quicktime_metadata = self.get_quicktime_metadata()
+        if(quicktime_metadata is not None):
+            return quicktime_metadata[type]
 
-        decimal_degrees = float(coordinate[0]) + float(coordinate[1])/60 + float(coordinate[2])/3600  # noqa
-        if(direction == 'S' or direction == 'W'):
-            decimal_degrees = decimal_degrees * -1
-
-        return decimal_degrees
+        return self.get_exiftool_coordinate(type)
 
     def get_date_taken(self):
         """Get the date which the video was taken.
@@ -95,23 +93,18 @@ class Video(Media):
         #   conversion in the local timezone
         # If the time is not found in EXIF we update EXIF
         seconds_since_epoch = min(os.path.getmtime(source), os.path.getctime(source))  # noqa
-        exif_data = self.get_exif()
-        for key in ['Creation Date', 'Media Create Date']:
-            date = re.search('%s +: +([0-9: ]+)' % key, exif_data)
-            if(date is not None):
-                date_string = date.group(1)
-                try:
-                    exif_seconds_since_epoch = time.mktime(
-                        datetime.strptime(
-                            date_string,
-                            '%Y:%m:%d %H:%M:%S'
-                        ).timetuple()
-                    )
-                    if(exif_seconds_since_epoch < seconds_since_epoch):
-                        seconds_since_epoch = exif_seconds_since_epoch
-                        break
-                except:
-                    pass
+        quicktime_metadata = self.get_quicktime_metadata()
+        if(quicktime_metadata is not None):
+            dates = quicktime_metadata['dates']
+        else:
+            dates = self.get_exiftool_dates(
+                ['CreationDate', 'MediaCreateDate']
+            )
+        for date in dates:
+            exif_seconds_since_epoch = time.mktime(date.timetuple())
+            if(exif_seconds_since_epoch < seconds_since_epoch):
+                seconds_since_epoch = exif_seconds_since_epoch
+                break
 
         if(seconds_since_epoch == 0):
             return None
@@ -145,23 +138,60 @@ class Video(Media):
     def get_exif(self):
         """Get exif data from video file.
 
-        Not all video files have exif and this currently relies on the CLI
-        exiftool program.
+        Not all video files have exif and this currently relies on the
+        shared pool of exiftool processes. See
+        :meth:`~elodie.media.media.Media.get_exiftool_metadata`.
+
+        :returns: dict or None if exiftool is not found
+        """
+        return self.get_exiftool_metadata()
+
+    def get_exiftool_attributes(self):
+        """Get the album and title of the video.
+
+        QuickTime and MP4 files are read with :mod:`elodie.quicktime_parser`
+        instead of exiftool.
+
+        :returns: dict, or False if exiftool was not available.
+        """
+        if(self.exiftool_attributes is not None):
+            return self.exiftool_attributes
+
+        quicktime_metadata = self.get_quicktime_metadata()
+        if(quicktime_metadata is None):
+            return super(Video, self).get_exiftool_attributes()
+
+        self.exiftool_attributes = {
+            'album': quicktime_metadata['album'],
+            'title': quicktime_metadata['title']
+        }
+        return self.exiftool_attributes
 
-        :returns: str or None if exiftool is not found
+    def get_quicktime_metadata(self):
+        """Read the video's metadata without exiftool.
+
+        We store the result so it's only read once.
+
+        :returns: dict from :func:`elodie.quicktime_parser.read_quicktime`,
+            or None if the video isn't a file it can read.
         """
-        exiftool = get_exiftool()
-        if(exiftool is None):
+        if(not self.is_valid()):
             return None
 
-        source = self.source
-        process_output = subprocess.Popen(
-            '%s "%s"' % (exiftool, source),
-            stdout=subprocess.PIPE,
-            shell=True,
-            universal_newlines=True
-        )
-        return process_output.stdout.read()
+        if(self.quicktime_metadata is None):
+            with stats.timer('parse quicktime'):
+                self.quicktime_metadata = quicktime_parser.read_quicktime(
+                    self.source
+                ) or False
+
+        return self.quicktime_metadata or None
+
+    def needs_exiftool_metadata(self):
+        """QuickTime and MP4 files we can read ourselves don't need exiftool.
+
+        :returns: bool
+        """
+        return self.get_quicktime_metadata() is None
 
     def is_valid(self):
         """Check the file extension against valid file extensions.
@@ -170,8 +200,12 @@ class Video(Media):
 
         :returns: bool
         """
-        source = self.source
-        return os.path.splitext(source)[1][1:].lower() in self.extensions
+        if(self.valid is None):
+            source = self.source
+            self.valid = (
+                os.path.splitext(source)[1][1:].lower() in self.extensions
+            )
+        return self.valid
 
     def set_date_taken(self, date_taken_as_datetime):
         """
@@ -224,6 +258,45 @@ class Video(Media):
         result = self.__update_using_plist(title=title)
         return result
 
+    def write_metadata(self, date_taken=None, latitude=None, longitude=None,
+                       title=None, album=None):
+        """Write several metadata values to the video at once.
+
+        The date, location and title are written with a single
+        avmetareadwrite pass instead of one per value. The album is stored in
+        XMP so it's written with exiftool afterwards.
+
+        :param datetime date_taken: When the video was recorded.
+        :param float latitude: Latitude of the file.
+        :param float longitude: Longitude of the file.
+        :param str title: Title for the file.
+        :param str album: Name of the album.
+        :returns: bool True if every value was written.
+        """
+        kwargs = {}
+        if(date_taken is not None):
+            kwargs['time'] = date_taken
+        if(latitude is not None and longitude is not None):
+            kwargs['latitude'] = latitude
+            kwargs['longitude'] = longitude
+        if(title is not None):
+            kwargs['title'] = title
+
+        written = True
+        if(len(kwargs) > 0):
+            written = self.__update_using_plist(**kwargs)
+            if(written is True and date_taken is not None):
+                os.utime(
+                    self.source,
+                    (
+                        int(time.time()),
+                        time.mktime(date_taken.timetuple())
+                    )
+                )
+        if(album is not None):
+            written = self.set_album(album) and written
+        return written
+
     def __update_using_plist(self, **kwargs):
         """Updates video metadata using avmetareadwrite.
 
@@ -397,6 +470,7 @@ class Video(Media):
             stat = os.stat(source)
             shutil.move(temp_movie, source)
             os.utime(source, (stat.st_atime, stat.st_mtime))
+            self.reset_cache()
 
             return True
 
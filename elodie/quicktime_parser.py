@@ -0,0 +1,244 @@
+"""
+Read the metadata Elodie needs from QuickTime and MP4 files without exiftool.
+
+These files are made of nested atoms. We seek from atom to atom and only read
+the few small atoms which hold the date, location, title and album, so even
+large videos take a handful of reads.
+"""
+
+import os
+import re
+import struct
+from datetime import datetime, timedelta
+
+from elodie.exif_parser import ELODIE, ParseError
+from elodie.exif_parser import get_xmp_property, parse_xmp
+
+# Atoms which may start a QuickTime or MP4 file.
+TOP_LEVEL_ATOMS = (
+    'ftyp', 'moov', 'mdat', 'wide', 'free', 'skip', 'pnot', 'uuid'
+)
+
+XMP_UUID = '\xbe\x7a\xcf\xcb\x97\xa9\x42\xe8\x9c\x71\x99\x94\x91\xe3\xaf\xac'
+
+# Times in QuickTime files are seconds since this date, in UTC.
+EPOCH = datetime(1904, 1, 1)
+
+# Item list data type for UTF-8 text
+UTF8 = 1
+
+DISPLAY_NAME = 'com.apple.quicktime.displayname'
+TITLE = 'com.apple.quicktime.title'
+ALBUM = 'com.apple.quicktime.album'
+CREATION_DATE = 'com.apple.quicktime.creationdate'
+LOCATION = 'com.apple.quicktime.location.ISO6709'
+
+
+def read_quicktime(path):
+    """Read the dates, location, title and album of a QuickTime or MP4 file.
+
+    The returned dict has the keys `dates`, `latitude` and `longitude`
+    (signed decimal degrees), `title` and `album`. `dates` is a list of
+    datetimes, most preferred first: the creation date in the time zone it
+    was recorded in and then the creation time of the movie in UTC. The
+    other keys are None if the file doesn't have them.
+
+    :param str path: Path to the file.
+    :returns: dict, or None if the file isn't one we can read.
+    """
+    try:
+        with open(path, 'rb') as f:
+            return _read_quicktime(f)
+    except (IOError, ParseError, struct.error):
+        return None
+
+
+def _read_quicktime(f):
+    end = os.fstat(f.fileno()).st_size
+    if(end < 8 or f.read(8)[4:8] not in TOP_LEVEL_ATOMS):
+        raise ParseError('Not a QuickTime file')
+
+    values = {}
+    create_date = None
+    for type, start, stop in _atoms(f, 0, end):
+        if(type == 'moov'):
+            create_date = _read_moov(f, start, stop, values)
+        elif(type == 'uuid' and stop - start > 16):
+            f.seek(start)
+            if(_read(f, 16) == XMP_UUID):
+                values.setdefault(
+                    'XMP',
+                    parse_xmp(_read(f, stop - start - 16))
+                )
+
+    dates = []
+    if(CREATION_DATE in values):
+        match = re.match(
+            r'(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})',
+            values[CREATION_DATE]
+        )
+        if(match is not None):
+            try:
+                dates.append(datetime(*[int(x) for x in match.groups()]))
+            except ValueError:
+                pass
+    if(create_date is not None):
+        dates.append(create_date)
+
+    latitude, longitude = None, None
+    for key in [LOCATION, '\xa9xyz']:
+        if(key in values):
+            match = re.match(
+                r'([+-]\d+(?:\.\d*)?)([+-]\d+(?:\.\d*)?)',
+                values[key]
+            )
+            if(match is not None):
+                latitude, longitude = [float(x) for x in match.groups()]
+                break
+
+    # Same order of preference as Media.get_exiftool_attributes().
+    title = None
+    for key in [DISPLAY_NAME, TITLE, '\xa9nam']:
+        if(key in values and len(values[key].strip()) > 0):
+            title = values[key].strip()
+            break
+
+    album = get_xmp_property(values.get('XMP'), ELODIE, 'Album')
+    for key in [ALBUM, '\xa9alb']:
+        if(album is None and key in values):
+            album = values[key]
+
+    return {
+        'dates': dates,
+        'latitude': latitude,
+        'longitude': longitude,
+        'title': title,
+        'album': album
+    }
+
+
+def _read(f, size):
+    data = f.read(size)
+    if(len(data) != size):
+        raise ParseError('Unexpected end of file')
+    return data
+
+
+def _atoms(f, start, end):
+    """Yield the type and the start and end of the data of each atom."""
+    offset = start
+    while(offset + 8 <= end):
+        f.seek(offset)
+        size, type = struct.unpack('>I4s', _read(f, 8))
+        header = 8
+        if(size == 1):
+            size = struct.unpack('>Q', _read(f, 8))[0]
+            header = 16
+        elif(size == 0):
+            size = end - offset
+        if(size < header or offset + size > end):
+            raise ParseError('Invalid atom size')
+
+        yield type, offset + header, offset + size
+        offset += size
+
+
+def _read_moov(f, start, end, values):
+    """Read the metadata in a moov atom into values.
+
+    :returns: datetime the movie was created, or None
+    """
+    create_date = None
+    for type, atom_start, atom_end in _atoms(f, start, end):
+        if(type == 'mvhd'):
+            f.seek(atom_start)
+            header = _read(f, 12)
+            if(header[0] == '\x01'):
+                seconds = struct.unpack('>Q', header[4:12])[0]
+            else:
+                seconds = struct.unpack('>I', header[4:8])[0]
+            if(seconds > 0):
+                create_date = EPOCH + timedelta(seconds=seconds)
+        elif(type == 'udta'):
+            _read_udta(f, atom_start, atom_end, values)
+        elif(type == 'meta'):
+            _read_meta(f, atom_start, atom_end, values)
+    return create_date
+
+
+def _read_udta(f, start, end, values):
+    for type, atom_start, atom_end in _atoms(f, start, end):
+        if(type in ('\xa9xyz', '\xa9nam', '\xa9alb')):
+            f.seek(atom_start)
+            data = _read(f, atom_end - atom_start)
+            if(data[4:8] == 'data'):
+                value = _read_data(data)
+            else:
+                # A QuickTime text is a 16 bit size and language code
+                #   followed by the text.
+                if(len(data) < 4):
+                    continue
+                size = struct.unpack('>H', data[:2])[0]
+                value = data[4:4 + size]
+            if(value is not None):
+                values.setdefault(type, value)
+        elif(type == 'XMP_'):
+            f.seek(atom_start)
+            values.setdefault(
+                'XMP',
+                parse_xmp(_read(f, atom_end - atom_start))
+            )
+        elif(type == 'meta'):
+            _read_meta(f, atom_start, atom_end, values)
+
+
+def _read_meta(f, start, end, values):
+    # In MP4 files meta has a version and flags before its children.
+    f.seek(start)
+    if(_read(f, 8)[4:8] != 'hdlr'):
+        start += 4
+
+    keys = []
+    for type, atom_start, atom_end in _atoms(f, start, end):
+        if(type == 'keys'):
+            f.seek(atom_start)
+            keys = _read_keys(_read(f, atom_end - atom_start))
+        elif(type == 'ilst'):
+            for item, item_start, item_end in _atoms(f, atom_start, atom_end):
+                # Items are named by a code or by their position in keys.
+                name = item
+                if(item[0] == '\x00'):
+                    index = struct.unpack('>I', item)[0]
+                    if(index < 1 or index > len(keys)):
+                        continue
+                    name = keys[index - 1]
+                f.seek(item_start)
+                value = _read_data(_read(f, item_end - item_start))
+                if(value is not None):
+                    values.setdefault(name, value)
+
+
+def _read_keys(data):
+    keys = []
+    count = struct.unpack('>I', data[4:8])[0]
+    offset = 8
+    for i in range(count):
+        if(offset + 8 > len(data)):
+            raise ParseError('Invalid keys atom')
+        size = struct.unpack('>I', data[offset:offset + 4])[0]
+        if(size < 8):
+            raise ParseError('Invalid key size')
+        keys.append(data[offset + 8:offset + size])
+        offset += size
+    return keys
+
+
+def _read_data(data):
+    """Get the text in the data atom of an item list item."""
+    if(len(data) < 16 or data[4:8] != 'data'):
+        return None
+    size = struct.unpack('>I', data[:4])[0]
+    type = struct.unpack('>I', data[8:12])[0] & 0xFFFFFF
+    if(type != UTF8):
+        return None
+    return data[16:size]
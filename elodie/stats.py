@@ -0,0 +1,209 @@
+"""
+Time the stages of importing and updating files.
+
+Code which does something worth measuring wraps it in :func:`timer`::
+
+    with stats.timer('hash', size):
+        ...
+
+Nothing is recorded until :func:`enable` is called so the timers cost next
+to nothing otherwise. Recorded stages are reported with :func:`get_report`.
+
+The count, total and longest duration of each stage are exact. Percentiles
+come from a random sample of :data:`SAMPLE_SIZE` durations so memory doesn't
+grow with the number of files.
+"""
+
+import json
+import math
+import random
+import threading
+import time
+
+__ENABLED__ = False
+__LOCK__ = threading.Lock()
+# Stage name to a :class:`Stage`.
+__STAGES__ = {}
+# Picks which durations are sampled, seeded so reports are reproducible.
+__RANDOM__ = random.Random(0)
+
+#: Formats :func:`get_report` can produce.
+FORMATS = ('table', 'json')
+
+#: Most durations kept per stage to compute percentiles from.
+SAMPLE_SIZE = 10000
+
+
+class Stage(object):
+
+    """What was recorded for a stage."""
+
+    __slots__ = ('count', 'total', 'max', 'bytes', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.samples = []
+
+    def add(self, seconds, size):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bytes += size
+        # Reservoir sampling keeps each duration with the same chance.
+        if(len(self.samples) < SAMPLE_SIZE):
+            self.samples.append(seconds)
+        else:
+            index = __RANDOM__.randint(0, self.count - 1)
+            if(index < SAMPLE_SIZE):
+                self.samples[index] = seconds
+
+
+class Timer(object):
+
+    """Context manager which records how long its block took.
+
+    :param str stage: Name of the stage.
+    :param int size: Bytes the stage handled, if any.
+    """
+
+    def __init__(self, stage, size=0):
+        self.stage = stage
+        self.size = size
+        self.start = None
+
+    def __enter__(self):
+        if(__ENABLED__):
+            self.start = time.time()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        if(self.start is not None):
+            record(self.stage, time.time() - self.start, self.size)
+        return False
+
+
+def enable(enabled=True):
+    """Start or stop recording.
+
+    :param bool enabled:
+    """
+    global __ENABLED__
+    __ENABLED__ = enabled
+
+
+def reset():
+    """Forget everything recorded so far."""
+    with __LOCK__:
+        __STAGES__.clear()
+        __RANDOM__.seed(0)
+
+
+def timer(stage, size=0):
+    """Time a block of code as a stage.
+
+    :param str stage: Name of the stage.
+    :param int size: Bytes the stage handled, if any.
+    :returns: :class:`Timer`
+    """
+    return Timer(stage, size)
+
+
+def record(stage, seconds, size=0):
+    """Record one run of a stage.
+
+    :param str stage: Name of the stage.
+    :param float seconds: How long it took.
+    :param int size: Bytes it handled, if any.
+    """
+    if(not __ENABLED__):
+        return
+
+    with __LOCK__:
+        if(stage not in __STAGES__):
+            __STAGES__[stage] = Stage()
+        __STAGES__[stage].add(seconds, size)
+
+
+def get_stats():
+    """Summarize what was recorded for each stage.
+
+    :returns: dict of stage name to a dict with the `count`, `total`,
+        `mean`, `p50`, `p90`, `p99` and `max` durations in seconds and the
+        total `bytes`.
+    """
+    with __LOCK__:
+        stages = dict(
+            (name, (stage.count, stage.total, stage.max, stage.bytes,
+                    sorted(stage.samples)))
+            for name, stage in __STAGES__.iteritems()
+        )
+
+    summary = {}
+    for name, (count, total, longest, size, samples) in stages.iteritems():
+        summary[name] = {
+            'count': count,
+            'total': total,
+            'mean': total / count,
+            'p50': _percentile(samples, 50),
+            'p90': _percentile(samples, 90),
+            'p99': _percentile(samples, 99),
+            'max': longest,
+            'bytes': size
+        }
+    return summary
+
+
+def get_report(format='table'):
+    """Format what was recorded as a table or as JSON.
+
+    Stages are ordered by their total time, longest first.
+
+    :param str format: One of :data:`FORMATS`.
+    :returns: str
+    """
+    summary = get_stats()
+    if(format == 'json'):
+        return json.dumps(summary, indent=2, sort_keys=True)
+
+    columns = ('stage', 'count', 'total', 'mean', 'p50', 'p90', 'p99', 'max',
+               'bytes')
+    rows = [columns]
+    for stage in sorted(summary, key=lambda s: -summary[s]['total']):
+        values = summary[stage]
+        rows.append(
+            (stage, str(values['count']), '%.3fs' % values['total']) +
+            tuple(
+                '%.1fms' % (values[key] * 1000)
+                for key in ('mean', 'p50', 'p90', 'p99', 'max')
+            ) +
+            (_format_size(values['bytes']),)
+        )
+
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    lines = []
+    for row in rows:
+        # The stage name is left aligned and numbers are right aligned.
+        lines.append('  '.join(
+            [row[0].ljust(widths[0])] +
+            [value.rjust(width) for value, width in zip(row[1:], widths[1:])]
+        ).rstrip())
+    return '\n'.join(lines)
+
+
+def _percentile(durations, percent):
+    """Get a percentile of a sorted list using the nearest rank."""
+    rank = int(math.ceil(percent / 100.0 * len(durations)))
+    return durations[max(0, rank - 1)]
+
+
+def _format_size(size):
+    if(size == 0):
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if(size < 1024):
+            return '%.1f%s' % (size, unit)
+        size /= 1024.0
+    return '%.1fTB' % size
@@ -0,0 +1,110 @@
+# Project imports
+import os
+import random
+import shutil
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from elodie import constants
+from elodie import stats
+from elodie.benchmarks import corpus
+from elodie.benchmarks import run
+from elodie.exif_parser import read_jpeg
+from elodie.quicktime_parser import read_quicktime
+
+os.environ['TZ'] = 'GMT'
+
+
+def test_make_jpeg():
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'photo.jpg')
+        corpus.make_jpeg(path, random.Random(0), 20000,
+                         date_taken=datetime(2015, 1, 2, 3, 4, 5),
+                         latitude=37.5, longitude=-122.25, title='Title',
+                         album='Album')
+        values = read_jpeg(path)
+        size = os.path.getsize(path)
+    finally:
+        shutil.rmtree(folder)
+
+    assert abs(size - 20000) < 100, size
+    assert values['date_taken'] == datetime(2015, 1, 2, 3, 4, 5), values
+    assert abs(values['latitude'] - 37.5) < 0.0001, values
+    assert abs(values['longitude'] + 122.25) < 0.0001, values
+    assert values['title'] == 'Title', values
+    assert values['album'] == 'Album', values
+
+def test_make_quicktime():
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, 'video.mov')
+        corpus.make_quicktime(path, random.Random(0), 20000,
+                              date_taken=datetime(2015, 1, 2, 3, 4, 5),
+                              latitude=37.5, longitude=-122.25, title='Title',
+                              album='Album')
+        values = read_quicktime(path)
+    finally:
+        shutil.rmtree(folder)
+
+    assert datetime(2015, 1, 2, 3, 4, 5) in values['dates'], values
+    assert abs(values['latitude'] - 37.5) < 0.0001, values
+    assert abs(values['longitude'] + 122.25) < 0.0001, values
+    assert values['title'] == 'Title', values
+    assert values['album'] == 'Album', values
+
+def test_generate_corpus_is_reproducible():
+    folder = tempfile.mkdtemp()
+    try:
+        first = corpus.generate_corpus(os.path.join(folder, 'a'), 20, 1)
+        second = corpus.generate_corpus(os.path.join(folder, 'b'), 20, 1)
+        contents = []
+        for paths in (first, second):
+            contents.append([open(path, 'rb').read() for path in paths])
+        names = [os.path.basename(path) for path in first]
+    finally:
+        shutil.rmtree(folder)
+
+    assert len(first) == 20, first
+    assert names == [os.path.basename(path) for path in second], second
+    assert contents[0] == contents[1]
+
+def test_workspace_restores_settings():
+    hash_db = constants.hash_db
+    with run.workspace() as folder:
+        assert constants.hash_db.startswith(folder), constants.hash_db
+
+    assert constants.hash_db == hash_db, constants.hash_db
+    assert not os.path.exists(folder), folder
+    assert stats.get_stats() == {}, stats.get_stats()
+
+def test_run():
+    lookups = run.LOOKUPS
+    run.LOOKUPS = 10
+    try:
+        results = run.run(['hash_db', 'location_cache'], [], [100, 200])
+    finally:
+        run.LOOKUPS = lookups
+
+    assert results['seed'] == 0, results
+    assert sorted(results['benchmarks']['hash_db']) == ['100', '200'], results
+    hash_db = results['benchmarks']['hash_db']['100']
+    assert hash_db['size'] == 100, hash_db
+    assert hash_db['stages']['check_hash']['count'] == 10, hash_db
+    location_cache = results['benchmarks']['location_cache']['200']
+    assert location_cache['stages']['get_location_name']['count'] == 10, location_cache
+
+def test_compare():
+    previous = {'benchmarks': {'hash_db': {'100': {
+        'size': 100, 'add_seconds': 2.0, 'stages': {'flush': {'p50': 0.0}}
+    }}}}
+    current = {'benchmarks': {'hash_db': {'100': {
+        'size': 100, 'add_seconds': 3.0, 'stages': {'flush': {'p50': 1.0}}
+    }}}}
+
+    rows = run.compare(previous, current)
+
+    assert rows == [('hash_db/100/add_seconds', 2.0, 3.0, 50.0)], rows
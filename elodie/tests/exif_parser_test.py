@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# Project imports
+import os
+import struct
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+import helper
+from elodie import exif_parser
+
+os.environ['TZ'] = 'GMT'
+
+def write_jpeg(*segments):
+    """Write a JPEG with the given (marker, payload) segments."""
+    f, path = tempfile.mkstemp(suffix='.jpg')
+    with os.fdopen(f, 'wb') as f:
+        f.write('\xff\xd8')
+        for marker, payload in segments:
+            f.write(struct.pack('>BBH', 0xff, marker, len(payload) + 2))
+            f.write(payload)
+        f.write('\xff\xda\x00\x02\xff\xd9')
+    return path
+
+def test_read_jpeg():
+    metadata = exif_parser.read_jpeg(helper.get_file('with-album-and-title-and-location.jpg'))
+
+    assert metadata['date_taken'] == datetime(2015, 12, 5, 0, 59, 26), metadata['date_taken']
+    assert helper.isclose(metadata['latitude'], 37.3667027222), metadata['latitude']
+    assert helper.isclose(metadata['longitude'], -122.033383611), metadata['longitude']
+    assert metadata['title'] == 'Some Title', metadata['title']
+    assert metadata['album'] == 'Test Album', metadata['album']
+
+def test_read_jpeg_southern_and_eastern_hemisphere():
+    metadata = exif_parser.read_jpeg(helper.get_file('with-location-inv.jpg'))
+
+    assert helper.isclose(metadata['latitude'], -37.3667027222), metadata['latitude']
+    assert helper.isclose(metadata['longitude'], 122.033383611), metadata['longitude']
+
+def test_read_jpeg_without_exif():
+    metadata = exif_parser.read_jpeg(helper.get_file('no-exif.jpg'))
+
+    assert metadata == {'date_taken': None, 'latitude': None, 'longitude': None, 'title': None, 'album': None}, metadata
+
+def test_read_jpeg_not_a_jpeg():
+    assert exif_parser.read_jpeg(helper.get_file('invalid.jpg')) is None
+    assert exif_parser.read_jpeg(helper.get_file('text.txt')) is None
+
+def test_read_jpeg_iptc_headline():
+    headline = 'Caf\xe9'
+    iptc = '\x1c\x02\x69' + struct.pack('>H', len(headline)) + headline
+    resource = '8BIM' + struct.pack('>H', 0x0404) + '\x00\x00' + struct.pack('>I', len(iptc)) + iptc
+    path = write_jpeg((0xed, 'Photoshop 3.0\x00' + resource))
+    try:
+        metadata = exif_parser.read_jpeg(path)
+    finally:
+        os.remove(path)
+
+    assert metadata['title'] == 'Café', metadata['title']
+
+def test_read_jpeg_xmp_album():
+    xmp = ('<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+           '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+           '<rdf:Description xmlns:elodie="https://github.com/jmathai/elodie/">'
+           '<elodie:Album><rdf:Alt>'
+           '<rdf:li xml:lang="de">Urlaub</rdf:li>'
+           '<rdf:li xml:lang="x-default">Vacation</rdf:li>'
+           '</rdf:Alt></elodie:Album>'
+           '</rdf:Description></rdf:RDF></x:xmpmeta>')
+    path = write_jpeg((0xe1, 'http://ns.adobe.com/xap/1.0/\x00' + xmp))
+    try:
+        metadata = exif_parser.read_jpeg(path)
+    finally:
+        os.remove(path)
+
+    assert metadata['album'] == 'Vacation', metadata['album']
+
+def test_read_jpeg_truncated():
+    path = write_jpeg((0xe1, 'Exif\x00\x00MM\x00\x2a\x00\x00\x00\x08\x00\x05'))
+    try:
+        metadata = exif_parser.read_jpeg(path)
+    finally:
+        os.remove(path)
+
+    assert metadata is None, metadata
+
+def test_read_jpeg_offset_without_value():
+    # IFD0 with one Exif IFD pointer whose count is 0.
+    path = write_jpeg((0xe1, 'Exif\x00\x00MM\x00\x2a\x00\x00\x00\x08\x00\x01'
+                             '\x87\x69\x00\x04\x00\x00\x00\x00\x00\x00\x00\x00'
+                             '\x00\x00\x00\x00'))
+    try:
+        metadata = exif_parser.read_jpeg(path)
+    finally:
+        os.remove(path)
+
+    assert metadata is None, metadata
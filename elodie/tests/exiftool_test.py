@@ -0,0 +1,103 @@
+# Project imports
+import os
+import sys
+import threading
+from StringIO import StringIO
+
+import mock
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+import helper
+from elodie.dependencies import get_exiftool
+from elodie.exiftool import ExifTool
+from elodie.exiftool import ExifToolPool
+from elodie.exiftool import get_exiftool_pool
+from nose.plugins.skip import SkipTest
+
+os.environ['TZ'] = 'GMT'
+
+def test_get_exiftool_pool_is_shared():
+    assert get_exiftool_pool() is get_exiftool_pool()
+    assert get_exiftool_pool() is not get_exiftool_pool('ExifTool_config')
+
+def test_execute():
+    if get_exiftool() is None:
+        raise SkipTest('exiftool executable not found')
+
+    pool = ExifToolPool(1)
+    output = pool.execute(helper.get_file('with-title.jpg'))
+    pool.terminate()
+
+    assert 'Some Title' in output, output
+
+def test_execute_reuses_process():
+    if get_exiftool() is None:
+        raise SkipTest('exiftool executable not found')
+
+    pool = ExifToolPool(1)
+    first = pool.execute(helper.get_file('plain.jpg'))
+    second = pool.execute(helper.get_file('with-title.jpg'))
+    processes = len(pool.processes)
+    pool.terminate()
+
+    assert processes == 1, processes
+    assert 'Some Title' not in first, first
+    assert 'Some Title' in second, second
+
+def test_get_metadata():
+    if get_exiftool() is None:
+        raise SkipTest('exiftool executable not found')
+
+    plain = helper.get_file('plain.jpg')
+    with_title = helper.get_file('with-title.jpg')
+    missing = helper.get_file('does-not-exist.jpg')
+
+    pool = ExifToolPool(1)
+    metadata = pool.get_metadata([plain, with_title, missing], ('-Title',))
+    pool.terminate()
+
+    assert plain in metadata, metadata
+    assert 'Title' not in metadata[plain], metadata[plain]
+    assert metadata[with_title]['Title'] == 'Some Title', metadata[with_title]
+    assert missing not in metadata, metadata
+
+def test_execute_reads_until_ready_line():
+    exiftool = ExifTool.__new__(ExifTool)
+    exiftool.process = mock.Mock()
+    exiftool.process.stdout = StringIO('Title: {ready}\n{ready}\n')
+
+    output = exiftool.execute('-Title', 'photo.jpg')
+
+    assert output == 'Title: {ready}\n', output
+    exiftool.process.stdin.write.assert_called_with('-Title\nphoto.jpg\n-execute\n')
+
+@mock.patch('elodie.exiftool.get_exiftool', return_value='echo')
+@mock.patch('elodie.exiftool.ExifTool')
+def test_execute_passes_unsafe_arguments_directly(mock_exiftool, mock_get_exiftool):
+    pool = ExifToolPool(1)
+
+    outputs = [
+        pool.execute('-json', path)
+        for path in ['new\nline.jpg', '#comment.jpg', ' space.jpg']
+    ]
+
+    assert outputs == ['-json new\nline.jpg\n', '-json #comment.jpg\n', '-json  space.jpg\n'], outputs
+    assert mock_exiftool.call_count == 0, mock_exiftool.call_count
+
+@mock.patch('elodie.exiftool.get_exiftool', return_value='exiftool')
+@mock.patch('elodie.exiftool.ExifTool')
+def test_acquire_replaces_discarded_process(mock_exiftool, mock_get_exiftool):
+    pool = ExifToolPool(1)
+    pool.timeout = 0.01
+    busy = pool._acquire()
+
+    acquired = []
+    thread = threading.Thread(target=lambda: acquired.append(pool._acquire()))
+    thread.start()
+    # The only process exits while the thread is waiting for it.
+    pool._discard(busy)
+    thread.join(5)
+
+    assert acquired == [mock_exiftool.return_value], acquired
+    assert mock_exiftool.call_count == 2, mock_exiftool.call_count
@@ -4,6 +4,7 @@ import sys
 
 import re
 import shutil
+import threading
 from datetime import datetime
 from datetime import timedelta
 import time
@@ -12,6 +13,7 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirna
 
 import helper
 from elodie.filesystem import FileSystem
+from elodie.localstorage import Db
 from elodie.media.media import Media
 from elodie.media.photo import Photo
 from elodie.media.video import Video
@@ -20,6 +22,23 @@ from nose.plugins.skip import SkipTest
 os.environ['TZ'] = 'GMT'
 
 
+def test_copy_with_checksum():
+    filesystem = FileSystem()
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = helper.get_file('plain.jpg')
+    destination = os.path.join(folder, 'plain.jpg')
+    checksum = filesystem.copy_with_checksum(origin, destination)
+
+    destination_checksum = helper.checksum(destination)
+    destination_mtime = os.path.getmtime(destination)
+
+    shutil.rmtree(folder)
+
+    assert checksum == helper.checksum(origin), checksum
+    assert checksum == destination_checksum, destination_checksum
+    assert destination_mtime == os.path.getmtime(origin), destination_mtime
+
 def test_create_directory_success():
     filesystem = FileSystem()
     folder = os.path.join(helper.temp_dir(), helper.random_string(10))
@@ -213,6 +232,73 @@ def test_process_file_plain():
     assert origin_checksum == destination_checksum, destination_checksum
     assert helper.path_tz_fix(os.path.join('2015-12-Dec','Unknown Location','2015-12-05_00-59-26-photo.jpg')) in destination, destination
 
+def test_process_file_with_hardlink_transfer():
+    filesystem = FileSystem()
+    filesystem.transfer_mode = 'hardlink'
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder,'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+
+    media = Photo(origin)
+    destination = filesystem.process_file(origin, temporary_folder, media, allowDuplicate=True)
+
+    same_file = os.path.samefile(origin, destination)
+    origin_checksum = helper.checksum(origin)
+    hash_path = filesystem.db.get_hash(origin_checksum)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(os.path.dirname(os.path.dirname(destination)))
+
+    assert same_file == True, same_file
+    assert hash_path == destination, hash_path
+
+def test_process_file_writes_hash_without_db():
+    filesystem = FileSystem()
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder,'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    # Make the file unique so its hash isn't already committed.
+    with open(origin, 'ab') as f:
+        f.write(str(time.time()))
+
+    media = Photo(origin)
+    destination = filesystem.process_file(origin, temporary_folder, media, allowDuplicate=True)
+
+    # A separate connection only sees committed hashes.
+    hash_path = Db().get_hash(helper.checksum(origin))
+
+    shutil.rmtree(folder)
+    shutil.rmtree(os.path.dirname(os.path.dirname(destination)))
+
+    assert hash_path == destination, hash_path
+
+def test_process_file_batches_hashes_with_db():
+    db = Db()
+    filesystem = FileSystem(db)
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder,'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    # Make the file unique so its hash isn't already committed.
+    with open(origin, 'ab') as f:
+        f.write(str(time.time()))
+
+    media = Photo(origin)
+    destination = filesystem.process_file(origin, temporary_folder, media, allowDuplicate=True)
+
+    checksum = helper.checksum(origin)
+    pending = Db().check_hash(checksum)
+    db.flush()
+    written = Db().check_hash(checksum)
+
+    shutil.rmtree(folder)
+    shutil.rmtree(os.path.dirname(os.path.dirname(destination)))
+
+    assert pending == False, pending
+    assert written == True, written
+
 def test_process_file_with_title():
     filesystem = FileSystem()
     temporary_folder, folder = helper.create_working_folder()
@@ -332,3 +418,46 @@ def test_process_file_with_album_and_title_and_location():
     assert origin_checksum is not None, origin_checksum
     assert origin_checksum == destination_checksum, destination_checksum
     assert helper.path_tz_fix(os.path.join('2015-12-Dec','Test Album','2015-12-05_00-59-26-photo-some-title.jpg')) in destination, destination
+
+def test_process_file_concurrent_duplicates():
+    filesystem = FileSystem()
+    temporary_folder, folder = helper.create_working_folder()
+
+    # A unique file so the hash isn't in the db from another test
+    origin = os.path.join(folder,'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    with open(origin, 'ab') as f:
+        f.write(helper.random_string(10))
+
+    destinations = []
+    def process():
+        media = Photo(origin)
+        destinations.append(filesystem.process_file(origin, temporary_folder, media))
+
+    threads = [threading.Thread(target=process) for x in range(0, 4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    copied = [destination for destination in destinations if destination is not None]
+
+    shutil.rmtree(folder)
+    shutil.rmtree(os.path.dirname(os.path.dirname(copied[0])))
+
+    assert len(copied) == 1, destinations
+
+def test_iter_all_files_recursive():
+    filesystem = FileSystem()
+    folder = helper.populate_folder(5)
+    subfolder = helper.populate_folder(3)
+    shutil.move(subfolder, os.path.join(folder, 'subfolder'))
+
+    files = filesystem.iter_all_files(folder, ('jpg',))
+    first_file = next(files)
+    files = [first_file] + list(files)
+
+    shutil.rmtree(folder)
+
+    assert len(files) == 5, files
+    assert len([f for f in files if 'subfolder' in f]) == 2, files
@@ -0,0 +1,72 @@
+# Project imports
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from elodie.gazetteer import Gazetteer
+
+os.environ['TZ'] = 'GMT'
+
+CITIES = [
+    # geonameid, name, asciiname, alternatenames, latitude, longitude,
+    #   feature class, feature code, country code, cc2, admin1 code
+    ['5368361', 'Los Angeles', 'Los Angeles', '', '34.05223', '-118.24368', 'P', 'PPLA2', 'US', '', 'CA'],
+    ['5391959', 'San Francisco', 'San Francisco', '', '37.77493', '-122.41942', 'P', 'PPLA2', 'US', '', 'CA'],
+    ['2643743', 'London', 'London', '', '51.50853', '-0.12574', 'P', 'PPLC', 'GB', '', 'ENG'],
+]
+
+def write_gazetteer():
+    folder = tempfile.mkdtemp()
+    with open(os.path.join(folder, 'cities.txt'), 'w') as f:
+        for city in CITIES:
+            f.write('%s\n' % '\t'.join(city))
+    with open(os.path.join(folder, 'admin1.txt'), 'w') as f:
+        f.write('US.CA\tCalifornia\tCalifornia\t5332921\n')
+        f.write('GB.ENG\tEngland\tEngland\t6269131\n')
+    with open(os.path.join(folder, 'countries.txt'), 'w') as f:
+        f.write('#ISO\tISO3\tISO-Numeric\tfips\tCountry\n')
+        f.write('US\tUSA\t840\tUS\tUnited States\n')
+        f.write('GB\tGBR\t826\tUK\tUnited Kingdom\n')
+    return folder
+
+def test_reverse_lookup_city():
+    folder = write_gazetteer()
+    try:
+        gazetteer = Gazetteer(
+            os.path.join(folder, 'cities.txt'),
+            admin1=os.path.join(folder, 'admin1.txt'),
+            countries=os.path.join(folder, 'countries.txt')
+        )
+        result = gazetteer.reverse_lookup(37.78, -122.41)
+    finally:
+        shutil.rmtree(folder)
+
+    assert result == {'address': {'city': 'San Francisco', 'state': 'California', 'country': 'United States'}}, result
+
+def test_reverse_lookup_region():
+    folder = write_gazetteer()
+    try:
+        gazetteer = Gazetteer(
+            os.path.join(folder, 'cities.txt'),
+            admin1=os.path.join(folder, 'admin1.txt'),
+            countries=os.path.join(folder, 'countries.txt')
+        )
+        # About 50km from London.
+        result = gazetteer.reverse_lookup(51.95, -0.12)
+    finally:
+        shutil.rmtree(folder)
+
+    assert result == {'address': {'state': 'England', 'country': 'United Kingdom'}}, result
+
+def test_reverse_lookup_nothing_close():
+    folder = write_gazetteer()
+    try:
+        gazetteer = Gazetteer(os.path.join(folder, 'cities.txt'))
+        result = gazetteer.reverse_lookup(0.0, 0.0)
+    finally:
+        shutil.rmtree(folder)
+
+    assert result == {'address': {}}, result
@@ -0,0 +1,69 @@
+# Project imports
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+import helper
+from elodie.geoindex import GeoIndex
+from elodie.geoindex import distance
+
+os.environ['TZ'] = 'GMT'
+
+def test_distance():
+    # One degree of latitude is about 111km
+    d = distance(10.0, 20.0, 11.0, 20.0)
+
+    assert 111000 < d < 111400, d
+
+def test_distance_across_antimeridian():
+    d = distance(0.0, 179.99, 0.0, -179.99)
+
+    assert d < 3000, d
+
+def test_nearest():
+    index = GeoIndex()
+    latitude, longitude, name = helper.get_test_location()
+    index.add(latitude, longitude, name)
+    index.add(latitude + 1, longitude + 1, 'Elsewhere')
+
+    assert index.nearest(helper.random_coordinate(latitude, 4), helper.random_coordinate(longitude, 4), 3000) == name
+    assert index.nearest(latitude + 0.5, longitude + 0.5, 3000) is None
+
+def test_nearest_returns_closest():
+    index = GeoIndex()
+    index.add(10.0, 10.0, 'Far')
+    index.add(10.01, 10.01, 'Near')
+
+    assert index.nearest(10.012, 10.012, 5000) == 'Near'
+
+def test_nearest_matches_linear_scan():
+    index = GeoIndex()
+    points = []
+    for x in range(0, 2000):
+        point = (random.uniform(-89.0, 89.0), random.uniform(-180.0, 180.0), x)
+        points.append(point)
+        index.add(*point)
+
+    for x in range(0, 200):
+        latitude, longitude = random.uniform(-89.0, 89.0), random.uniform(-180.0, 180.0)
+        threshold = random.choice([3000, 50000, 500000])
+
+        expected = None
+        closest = None
+        for point in points:
+            d = distance(latitude, longitude, point[0], point[1])
+            if d <= threshold and (closest is None or d < closest):
+                closest = d
+                expected = point[2]
+
+        assert index.nearest(latitude, longitude, threshold) == expected
+
+def test_len():
+    index = GeoIndex()
+    index.add(1.0, 1.0, 'a')
+    index.add(1.0, 1.0, 'b')
+    index.add(50.0, 1.0, 'c')
+
+    assert len(index) == 3, len(index)
@@ -1,13 +1,22 @@
 # Project imports
+import BaseHTTPServer
+import json
+import mock
 import os
 import random
 import re
+import SocketServer
 import sys
+import threading
+import time
+import urlparse
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
 
 import helper
+from elodie import constants
 from elodie import geolocation
+from elodie.localstorage import Db
 
 os.environ['TZ'] = 'GMT'
 
@@ -40,3 +49,144 @@ def test_decimal_to_dms_unsigned():
         new_target_decimal_value = abs(target_decimal_value)
 
         assert new_target_decimal_value == check_value, '%s does not match %s' % (check_value, new_target_decimal_value)
+
+@mock.patch('elodie.geolocation.reverse_lookup')
+def test_prefetch_place_names(mock_reverse_lookup):
+    mock_reverse_lookup.return_value = {'address': {'city': 'Sunnyvale'}}
+    db = Db()
+    latitude = random.uniform(-60, 60)
+    longitude = random.uniform(-170, 170)
+    coordinates = [
+        (latitude, longitude),
+        (latitude + 0.001, longitude),
+        (latitude, longitude + 0.001),
+        (latitude + 1, longitude + 1),
+        (None, longitude)
+    ]
+
+    lookups = geolocation.prefetch_place_names(coordinates, db)
+
+    assert lookups == 2, lookups
+    assert mock_reverse_lookup.call_count == 2, mock_reverse_lookup.call_count
+    assert geolocation.place_name(latitude + 0.001, longitude, db) == 'Sunnyvale'
+    assert mock_reverse_lookup.call_count == 2, mock_reverse_lookup.call_count
+
+def test_rate_limiter():
+    limiter = geolocation.RateLimiter(100)
+    start = time.time()
+    for x in range(0, 5):
+        limiter.wait()
+
+    # The first call doesn't wait.
+    assert time.time() - start >= 0.04, time.time() - start
+
+def test_get_gazetteer_waits_for_load():
+    gazetteer = object()
+    def load_gazetteer():
+        time.sleep(0.1)
+        return gazetteer
+
+    results = []
+    previous = geolocation.__GAZETTEER__
+    geolocation.__GAZETTEER__ = None
+    try:
+        with mock.patch('elodie.geolocation.load_gazetteer', side_effect=load_gazetteer) as mock_load:
+            threads = [
+                threading.Thread(target=lambda: results.append(geolocation.get_gazetteer()))
+                for x in range(0, 4)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+    finally:
+        geolocation.__GAZETTEER__ = previous
+
+    assert results == [gazetteer] * 4, results
+    assert mock_load.call_count == 1, mock_load.call_count
+
+@mock.patch('elodie.geolocation.get_session')
+def test_reverse_lookup_caches_response(mock_get_session):
+    response = mock_get_session.return_value.get.return_value
+    response.status_code = 200
+    response.json.return_value = {'address': {'city': 'Sunnyvale'}}
+    latitude = random.uniform(-60, 60)
+    longitude = random.uniform(-170, 170)
+
+    first = geolocation.reverse_lookup(latitude, longitude)
+    second = geolocation.reverse_lookup(latitude, longitude)
+
+    assert first == second == {'address': {'city': 'Sunnyvale'}}, (first, second)
+    assert mock_get_session.return_value.get.call_count == 1, mock_get_session.return_value.get.call_count
+
+class MapQuestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    """Stand in for MapQuest which answers with the query it was sent."""
+
+    requests = []
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = dict(urlparse.parse_qsl(url.query))
+        MapQuestHandler.requests.append(self.path)
+        if(url.path == '/nominatim/v1/reverse.php'):
+            response = {'address': {'city': 'City %s' % query['lat']}}
+        else:
+            response = {'results': [{'locations': [{
+                'geocodeQuality': 'CITY',
+                'latLng': {'lat': 37.368, 'lng': -122.03}
+            }]}]}
+        body = json.dumps(response)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_mapquest_server():
+    MapQuestHandler.requests = []
+    server = SocketServer.ThreadingTCPServer(('127.0.0.1', 0), MapQuestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, 'http://127.0.0.1:%s' % server.server_address[1]
+
+def test_place_names():
+    server, url = start_mapquest_server()
+    latitude = random.uniform(-60, 60)
+    longitude = random.uniform(-170, 170)
+    coordinates = [
+        (latitude, longitude),
+        (latitude + 1, longitude),
+        (latitude + 0.001, longitude),
+        (None, None)
+    ]
+    try:
+        with mock.patch.object(constants, 'mapquest_url', url):
+            names = geolocation.place_names(coordinates, Db(), 2)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(MapQuestHandler.requests) == 2, MapQuestHandler.requests
+    assert names[0] is not None and names[0] == names[2], names
+    assert names[1] is not None and names[1] != names[0], names
+    assert names[3] is None, names
+
+def test_coordinates_by_names():
+    server, url = start_mapquest_server()
+    name = 'Sunnyvale %s' % helper.random_string(10)
+    try:
+        with mock.patch.object(constants, 'mapquest_url', url):
+            coordinates = geolocation.coordinates_by_names([name, name], Db())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert len(MapQuestHandler.requests) == 1, MapQuestHandler.requests
+    assert coordinates[0] == {'latitude': 37.368, 'longitude': -122.03}, coordinates
+    assert coordinates[1] == coordinates[0], coordinates
@@ -1,12 +1,19 @@
 # Project imports
+import json
 import os
+import random
+import shutil
 import sys
+import tempfile
+
+import mock
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
 
 import helper
-from elodie.localstorage import Db
+from elodie.localstorage import Db, ImportJournal, ResponseCache
 from elodie import constants
+from nose.plugins.skip import SkipTest
 
 os.environ['TZ'] = 'GMT'
 
@@ -118,6 +125,75 @@ def test_update_hash_db():
     db3 = Db()
     assert db3.check_hash(random_key) == True
 
+def test_checkpoint():
+    db = Db()
+
+    random_key = helper.random_string(10)
+    db.add_hash(random_key, helper.random_string(12))
+    db.checkpoint()
+
+    # A single pending hash is below the batch size so it is not written
+    db2 = Db()
+    assert db2.check_hash(random_key) == False
+
+    for x in range(0, constants.hash_db_batch_size):
+        db.add_hash(helper.random_string(10), helper.random_string(12))
+    db.checkpoint()
+
+    db3 = Db()
+    assert db3.check_hash(random_key) == True
+    assert db.pending_hashes == 0, db.pending_hashes
+
+def _temporary_application_directory():
+    """Patch the constants which point into ~/.elodie to a new folder."""
+    folder = tempfile.mkdtemp()
+    return folder, mock.patch.multiple(
+        constants,
+        application_directory=folder,
+        hash_db=os.path.join(folder, 'hash.db'),
+        legacy_hash_db=os.path.join(folder, 'hash.json'),
+        location_db=os.path.join(folder, 'location.json')
+    )
+
+def test_migrate_legacy_hash_db():
+    random_key = helper.random_string(10)
+    random_value = helper.random_string(12)
+
+    folder, patch = _temporary_application_directory()
+    try:
+        with patch:
+            with open(constants.legacy_hash_db, 'w') as f:
+                json.dump({random_key: random_value}, f)
+
+            db = Db()
+            value = db.get_hash(random_key)
+            renamed = os.path.isfile(constants.legacy_hash_db) == False
+    finally:
+        shutil.rmtree(folder)
+
+    assert value == random_value, 'Legacy hash was not migrated'
+    assert renamed == True, 'Legacy hash db was not renamed'
+
+def test_migrate_legacy_hash_db_keeps_earlier_migration():
+    folder, patch = _temporary_application_directory()
+    try:
+        with patch:
+            with open('%s.migrated' % constants.legacy_hash_db, 'w') as f:
+                f.write('earlier')
+            with open(constants.legacy_hash_db, 'w') as f:
+                json.dump({helper.random_string(10): helper.random_string(12)}, f)
+
+            Db()
+
+            with open('%s.migrated' % constants.legacy_hash_db, 'r') as f:
+                earlier = f.read()
+            renamed = os.path.isfile('%s.migrated.1' % constants.legacy_hash_db)
+    finally:
+        shutil.rmtree(folder)
+
+    assert earlier == 'earlier', earlier
+    assert renamed == True, renamed
+
 def test_checksum():
     db = Db()
 
@@ -136,6 +212,47 @@ def test_add_location():
 
     assert name == retrieved_name
 
+def test_location_checkpoint():
+    db = Db()
+
+    name = helper.random_string(10)
+    db.add_location(1.0, 2.0, name)
+    db.checkpoint()
+
+    # A single pending location is below the batch size so it is not written
+    db2 = Db()
+    assert db2.get_location_coordinates(name) is None
+
+    for x in range(0, constants.location_db_batch_size):
+        db.add_location(1.0, 2.0, helper.random_string(10))
+    db.checkpoint()
+
+    db3 = Db()
+    assert db3.get_location_coordinates(name) == (1.0, 2.0)
+    assert db.pending_locations == 0, db.pending_locations
+    assert os.path.isfile('%s.tmp' % constants.location_db) == False
+
+def test_location_checkpoint_after_interval():
+    db = Db()
+
+    name = helper.random_string(10)
+    db.add_location(1.0, 2.0, name)
+    db.location_db_written -= constants.location_db_interval
+    db.checkpoint()
+
+    db2 = Db()
+    assert db2.get_location_coordinates(name) == (1.0, 2.0)
+
+def test_flush_writes_locations():
+    db = Db()
+
+    name = helper.random_string(10)
+    db.add_location(1.0, 2.0, name)
+    db.flush()
+
+    db2 = Db()
+    assert db2.get_location_coordinates(name) == (1.0, 2.0)
+
 def test_get_location_name():
     db = Db()
 
@@ -195,6 +312,25 @@ def test_get_location_coordinates_exists():
     assert location[0] == latitude
     assert location[1] == longitude
 
+def test_get_location_coordinates_ignores_case_and_whitespace():
+    db = Db()
+
+    name = 'Sunnyvale %s' % helper.random_string(10)
+    db.add_location(37.368, -122.03, name)
+
+    location = db.get_location_coordinates('  %s ' % name.upper().replace(' ', '   '))
+
+    assert location == (37.368, -122.03), location
+
+def test_get_location_coordinates_returns_first_added():
+    db = Db()
+
+    name = helper.random_string(10)
+    db.add_location(1.0, 2.0, name)
+    db.add_location(3.0, 4.0, name)
+
+    assert db.get_location_coordinates(name) == (1.0, 2.0)
+
 def test_get_location_coordinates_does_not_exists():
     db = Db()
     
@@ -207,3 +343,242 @@ def test_get_location_coordinates_does_not_exists():
     location = db.get_location_coordinates(name)
 
     assert location is None
+
+def test_checksum_cached():
+    db = Db()
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder, 'file.txt')
+    with open(origin, 'w') as f:
+        f.write(helper.random_string(20))
+    os.utime(origin, (1000000000, 1000000000))
+    stat = os.stat(origin)
+
+    checksum = db.checksum(origin)
+
+    if stat.st_ino == 0:
+        raise SkipTest('Checksums are not cached without inodes')
+
+    assert db.get_cached_checksum(stat) == checksum
+
+    # Same size and mtime but different content returns the cached value
+    #   unless we ask for the file to be hashed again.
+    with open(origin, 'w') as f:
+        f.write(helper.random_string(20))
+    os.utime(origin, (1000000000, 1000000000))
+
+    assert db.checksum(origin) == checksum
+
+    db.rehash = True
+    rehashed_checksum = db.checksum(origin)
+    expected_checksum = helper.checksum(origin)
+
+    shutil.rmtree(folder)
+
+    assert rehashed_checksum != checksum
+    assert rehashed_checksum == expected_checksum
+
+def test_partial_checksum():
+    db = Db()
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder, 'file.txt')
+    with open(origin, 'w') as f:
+        f.write('a' * 100)
+    small_checksum = db.partial_checksum(origin, 64)
+
+    # Bytes in the middle of a file aren't read
+    with open(origin, 'w') as f:
+        f.write('a' * 64 + 'b' * 10 + 'a' * 100)
+    first_checksum = db.partial_checksum(origin, 64)
+    with open(origin, 'w') as f:
+        f.write('a' * 64 + 'c' * 10 + 'a' * 100)
+    second_checksum = db.partial_checksum(origin, 64)
+
+    shutil.rmtree(folder)
+
+    assert small_checksum != first_checksum
+    assert first_checksum == second_checksum
+
+def test_might_have_hash():
+    db = Db()
+
+    size = random.randint(1000000000, 2000000000)
+    partial = helper.random_string(10)
+
+    assert db.might_have_hash(size, partial) == False
+
+    db.add_hash(helper.random_string(10), helper.random_string(12), size=size, partial=partial)
+
+    assert db.might_have_hash(size, partial) == True
+    assert db.might_have_hash(size, helper.random_string(10)) == False
+    assert db.might_have_hash(size + 1, partial) == False
+
+def test_might_have_hash_without_size():
+    temporary_folder, folder = helper.create_working_folder()
+    path = os.path.join(folder, 'photo.jpg')
+    # A size no other test uses.
+    with open(path, 'wb') as f:
+        f.write('\x00' * random.randint(3000000, 4000000))
+    size = os.path.getsize(path)
+
+    db = Db()
+    db.add_hash(helper.random_string(10), path, True)
+    db.add_hash(helper.random_string(10), os.path.join(folder, 'missing.jpg'), True)
+
+    # Sizes are read from the files when a Db first checks.
+    db = Db()
+    found = db.might_have_hash(size, helper.random_string(10))
+    not_found = db.might_have_hash(size + 1, helper.random_string(10))
+
+    shutil.rmtree(folder)
+
+    assert found == True, found
+    # Hashes without a size or a file don't match every file.
+    assert not_found == False, not_found
+
+def test_response_cache():
+    folder = helper.temp_dir()
+    path = os.path.join(folder, 'response-cache-%s.db' % helper.random_string(10))
+    try:
+        cache = ResponseCache(path, 3600, 2)
+        cache.set('a', {'address': {'city': 'Sunnyvale'}})
+
+        assert cache.get('a') == {'address': {'city': 'Sunnyvale'}}, cache.get('a')
+        assert cache.get('b') is None
+
+        # Reopening the cache reads responses from disk.
+        cache = ResponseCache(path, 3600, 2)
+        assert cache.get('a') == {'address': {'city': 'Sunnyvale'}}, cache.get('a')
+    finally:
+        os.remove(path)
+
+def test_response_cache_expires():
+    folder = helper.temp_dir()
+    path = os.path.join(folder, 'response-cache-%s.db' % helper.random_string(10))
+    try:
+        cache = ResponseCache(path, -1, 2)
+        cache.set('a', {})
+
+        assert cache.get('a') is None, cache.get('a')
+    finally:
+        os.remove(path)
+
+def test_response_cache_evicts_least_recently_used():
+    folder = helper.temp_dir()
+    path = os.path.join(folder, 'response-cache-%s.db' % helper.random_string(10))
+    try:
+        cache = ResponseCache(path, 3600, 2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1, cache.get('a')
+        assert cache.get('b') is None, cache.get('b')
+        assert cache.get('c') == 3, cache.get('c')
+    finally:
+        os.remove(path)
+
+def test_import_journal():
+    temporary_folder, folder = helper.create_working_folder()
+    path = os.path.join(folder, 'import.journal')
+    source = os.path.join(folder, 'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    stat = os.stat(source)
+    try:
+        journal = ImportJournal(path, '/library')
+        assert journal.get(source, stat) is None
+
+        journal.record(source, 'copying', stat, destination='/library/photo.jpg')
+        journal.record(source, 'copied', stat, destination='/library/photo.jpg', checksum='abc')
+        journal.close()
+
+        # The latest state is read back when the journal is opened again.
+        journal = ImportJournal(path, '/library')
+        entry = journal.get(source, stat)
+        journal.close()
+
+        # Other libraries have their own entries.
+        other_journal = ImportJournal(path, '/other-library')
+        other_entry = other_journal.get(source, stat)
+        other_journal.close()
+    finally:
+        shutil.rmtree(folder)
+
+    assert entry['state'] == 'copied', entry
+    assert entry['destination'] == '/library/photo.jpg', entry
+    assert entry['checksum'] == 'abc', entry
+    assert other_entry is None, other_entry
+
+def test_import_journal_ignores_changed_sources():
+    temporary_folder, folder = helper.create_working_folder()
+    path = os.path.join(folder, 'import.journal')
+    source = os.path.join(folder, 'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    try:
+        journal = ImportJournal(path, '/library')
+        journal.record(source, 'copied', os.stat(source), destination='/library/photo.jpg')
+
+        with open(source, 'a') as f:
+            f.write('changed')
+        entry = journal.get(source, os.stat(source))
+        journal.close()
+    finally:
+        shutil.rmtree(folder)
+
+    assert entry is None, entry
+
+def test_import_journal_ignores_incomplete_line():
+    temporary_folder, folder = helper.create_working_folder()
+    path = os.path.join(folder, 'import.journal')
+    source = os.path.join(folder, 'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    stat = os.stat(source)
+    try:
+        journal = ImportJournal(path, '/library')
+        journal.record(source, 'copying', stat, destination='/library/photo.jpg')
+        journal.close()
+        # An import which crashed while writing a line.
+        with open(path, 'a') as f:
+            f.write('{"source": "%s", "sta' % source)
+
+        journal = ImportJournal(path, '/library')
+        entry = journal.get(source, stat)
+        journal.close()
+    finally:
+        shutil.rmtree(folder)
+
+    assert entry['state'] == 'copying', entry
+
+def test_import_journal_compact():
+    temporary_folder, folder = helper.create_working_folder()
+    path = os.path.join(folder, 'import.journal')
+    source = os.path.join(folder, 'photo.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), source)
+    stat = os.stat(source)
+    try:
+        other_journal = ImportJournal(path, '/other-library')
+        other_journal.record(source, 'copied', stat, destination='/other-library/photo.jpg')
+        other_journal.close()
+
+        copying = os.path.join(folder, 'copying.jpg')
+        shutil.copyfile(source, copying)
+        journal = ImportJournal(path, '/library')
+        journal.record(source, 'copying', stat, destination='/library/photo.jpg')
+        journal.record(source, 'copied', stat, destination='/library/photo.jpg')
+        journal.record(copying, 'copying', os.stat(copying), destination='/library/copying.jpg')
+        journal.compact()
+        entry = journal.get(source, stat)
+        journal.close()
+
+        with open(path, 'r') as f:
+            lines = sorted(
+                (json.loads(line)['library'], json.loads(line)['state'])
+                for line in f
+            )
+    finally:
+        shutil.rmtree(folder)
+
+    assert entry is None, entry
+    assert lines == [('/library', 'copying'), ('/other-library', 'copied')], lines
@@ -35,14 +35,14 @@ def test_get_coordinate():
     audio = Audio(helper.get_file('audio.m4a'))
     coordinate = audio.get_coordinate()
 
-    assert coordinate == 29.75893888888889, coordinate
+    assert coordinate == 29.758938, coordinate
 
 def test_get_coordinate_latitude():
     raise SkipTest('gh-61 this test fails on travisci')
     audio = Audio(helper.get_file('audio.m4a'))
     coordinate = audio.get_coordinate('latitude')
 
-    assert coordinate == 29.75893888888889, coordinate
+    assert coordinate == 29.758938, coordinate
 
 def test_get_coordinate_longitude():
     raise SkipTest('gh-61 this test fails on travisci')
@@ -3,6 +3,7 @@ import os
 import sys
 
 import hashlib
+import mock
 import random
 import re
 import shutil
@@ -14,6 +15,7 @@ sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirna
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
 
 import helper
+from elodie import exif_parser
 from elodie.media.audio import Audio
 from elodie.media.media import Media
 from elodie.media.photo import Photo
@@ -52,3 +54,63 @@ def is_valid():
     media = Media()
 
     assert not media.is_valid()
+
+def test_load_exiftool_metadata():
+    temporary_folder, folder = helper.create_working_folder()
+    avi = os.path.join(folder, 'video.avi')
+    shutil.copyfile(helper.get_file('text.txt'), avi)
+    video = Video(avi)
+
+    Media.load_exiftool_metadata([video])
+
+    shutil.rmtree(folder)
+
+    assert video.exiftool_metadata is not None
+
+def test_load_exiftool_metadata_skips_readable_files():
+    plain = Photo(helper.get_file('plain.jpg'))
+    with_title = Photo(helper.get_file('with-title.jpg'))
+    video = Video(helper.get_file('video.mov'))
+    audio = Audio(helper.get_file('audio.m4a'))
+
+    Media.load_exiftool_metadata([plain, with_title, video, audio])
+
+    assert plain.exiftool_metadata is None
+    assert with_title.exiftool_metadata is None
+    assert video.exiftool_metadata is None
+    assert audio.exiftool_metadata is None
+    assert plain.get_title() is None, plain.get_title()
+    assert with_title.get_title() == 'Some Title', with_title.get_title()
+    assert audio.get_title() == 'Test Audio', audio.get_title()
+
+def test_is_valid_is_cached():
+    photo = Photo(helper.get_file('plain.jpg'))
+    assert photo.is_valid()
+
+    with mock.patch('elodie.media.photo.imghdr') as mock_imghdr:
+        assert photo.is_valid()
+
+    assert mock_imghdr.what.called is False
+
+def test_get_metadata_reads_file_once():
+    photo = Photo(helper.get_file('with-album-and-title-and-location.jpg'))
+
+    with mock.patch('elodie.exif_parser.read_jpeg', wraps=exif_parser.read_jpeg) as mock_read_jpeg:
+        metadata = photo.get_metadata()
+
+    assert mock_read_jpeg.call_count == 1, mock_read_jpeg.call_count
+    assert metadata['album'] == 'Test Album', metadata['album']
+    assert metadata['title'] == 'Some Title', metadata['title']
+    assert metadata['latitude'] is not None, metadata['latitude']
+
+def test_reset_cache():
+    video = Video(helper.get_file('video.mov'))
+    video.get_metadata()
+
+    video.reset_cache()
+
+    assert video.metadata is None
+    assert video.exiftool_attributes is None
+    assert video.quicktime_metadata is None
+    assert video.valid is None
+    assert video.get_coordinate('latitude') == 38.1893
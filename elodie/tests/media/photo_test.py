@@ -235,3 +235,38 @@ def test_set_title_non_ascii():
     shutil.rmtree(folder)
 
     assert metadata['title'] == utf8_title, metadata['title']
+
+def test_write_metadata():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = '%s/photo.jpg' % folder
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+
+    photo = Photo(origin)
+    photo.get_metadata()
+
+    status = photo.write_metadata(
+        date_taken=datetime(2013, 9, 30, 7, 6, 5),
+        latitude=11.1111111111,
+        longitude=-99.9999999999,
+        title='my photo title',
+        album='my album'
+    )
+
+    assert status == True, status
+
+    # The cached metadata is read again from the updated file.
+    metadata = photo.get_metadata()
+
+    shutil.rmtree(folder)
+
+    assert metadata['date_taken'] == helper.time_convert((2013, 9, 30, 7, 6, 5, 0, 273, 0)), metadata['date_taken']
+    assert helper.isclose(metadata['latitude'], 11.1111111111, 1e-6), metadata['latitude']
+    assert helper.isclose(metadata['longitude'], -99.9999999999, 1e-6), metadata['longitude']
+    assert metadata['title'] == 'my photo title', metadata['title']
+    assert metadata['album'] == 'my album', metadata['album']
+
+def test_write_metadata_without_values():
+    photo = Photo(helper.get_file('plain.jpg'))
+
+    assert photo.write_metadata() == False
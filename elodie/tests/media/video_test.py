@@ -8,6 +8,8 @@ import tempfile
 import time
 import datetime
 
+import mock
+
 from nose.plugins.skip import SkipTest
 
 sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))))
@@ -37,13 +39,13 @@ def test_get_coordinate():
     video = Video(helper.get_file('video.mov'))
     coordinate = video.get_coordinate()
 
-    assert coordinate == 38.189299999999996, coordinate
+    assert coordinate == 38.1893, coordinate
 
 def test_get_coordinate_latitude():
     video = Video(helper.get_file('video.mov'))
     coordinate = video.get_coordinate('latitude')
 
-    assert coordinate == 38.189299999999996, coordinate
+    assert coordinate == 38.1893, coordinate
 
 def test_get_coordinate_longitude():
     video = Video(helper.get_file('video.mov'))
@@ -177,3 +179,36 @@ def test_set_title_non_ascii():
 def can_edit_exif():
     video = Video()
     return video.get_avmetareadwrite()
+
+def test_write_metadata_updates_plist_once():
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = '%s/video.mov' % folder
+    shutil.copyfile(helper.get_file('video.mov'), origin)
+
+    video = Video(origin)
+    date_taken = datetime.datetime(2013, 9, 30, 7, 6, 5)
+    with mock.patch.object(Video, '_Video__update_using_plist',
+                           return_value=True) as update_using_plist, \
+            mock.patch.object(Video, 'set_album',
+                              return_value=True) as set_album:
+        status = video.write_metadata(
+            date_taken=date_taken,
+            latitude=11.1111111111,
+            longitude=99.9999999999,
+            title='my video title',
+            album='my album'
+        )
+    mtime = os.path.getmtime(origin)
+
+    shutil.rmtree(folder)
+
+    assert status == True, status
+    update_using_plist.assert_called_once_with(
+        time=date_taken,
+        latitude=11.1111111111,
+        longitude=99.9999999999,
+        title='my video title'
+    )
+    set_album.assert_called_once_with('my album')
+    assert mtime == time.mktime(date_taken.timetuple()), mtime
@@ -0,0 +1,90 @@
+# Project imports
+import os
+import struct
+import sys
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+import helper
+from elodie import quicktime_parser
+
+os.environ['TZ'] = 'GMT'
+
+def atom(type, *children):
+    data = ''.join(children)
+    return struct.pack('>I4s', len(data) + 8, type) + data
+
+def write_movie(*atoms):
+    f, path = tempfile.mkstemp(suffix='.mp4')
+    with os.fdopen(f, 'wb') as f:
+        f.write(''.join(atoms))
+    return path
+
+def test_read_quicktime_video():
+    metadata = quicktime_parser.read_quicktime(helper.get_file('video.mov'))
+
+    assert metadata['dates'][0] == datetime(2015, 1, 19, 12, 45, 11), metadata['dates']
+    assert metadata['latitude'] == 38.1893, metadata['latitude']
+    assert metadata['longitude'] == -119.9558, metadata['longitude']
+    assert metadata['title'] is None, metadata['title']
+    assert metadata['album'] is None, metadata['album']
+
+def test_read_quicktime_audio():
+    metadata = quicktime_parser.read_quicktime(helper.get_file('audio.m4a'))
+
+    assert metadata['latitude'] == 29.758938, metadata['latitude']
+    assert metadata['longitude'] == -95.3677, metadata['longitude']
+    assert metadata['title'] == 'Test Audio', metadata['title']
+
+def test_read_quicktime_not_a_movie():
+    assert quicktime_parser.read_quicktime(helper.get_file('plain.jpg')) is None
+    assert quicktime_parser.read_quicktime(helper.get_file('text.txt')) is None
+
+def test_read_quicktime_mp4_item_list():
+    mvhd = atom('mvhd', '\x00' * 4, struct.pack('>I', 3535056000), '\x00' * 92)
+    ilst = atom('ilst',
+        atom('\xa9nam', atom('data', struct.pack('>II', 1, 0), 'My Title')),
+        atom('\xa9alb', atom('data', struct.pack('>II', 1, 0), 'My Album')))
+    meta = atom('meta', '\x00' * 4, atom('hdlr', '\x00' * 25), ilst)
+    path = write_movie(
+        atom('ftyp', 'mp42'),
+        atom('mdat', '\x00' * 100),
+        atom('moov', mvhd, atom('udta', meta))
+    )
+    try:
+        metadata = quicktime_parser.read_quicktime(path)
+    finally:
+        os.remove(path)
+
+    assert metadata['dates'] == [datetime(2016, 1, 8)], metadata['dates']
+    assert metadata['title'] == 'My Title', metadata['title']
+    assert metadata['album'] == 'My Album', metadata['album']
+    assert metadata['latitude'] is None, metadata['latitude']
+
+def test_read_quicktime_xmp_album():
+    xmp = ('<x:xmpmeta xmlns:x="adobe:ns:meta/">'
+           '<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+           '<rdf:Description xmlns:elodie="https://github.com/jmathai/elodie/"'
+           ' elodie:Album="Vacation"/>'
+           '</rdf:RDF></x:xmpmeta>')
+    path = write_movie(
+        atom('ftyp', 'qt  '),
+        atom('moov', atom('udta', atom('XMP_', xmp)))
+    )
+    try:
+        metadata = quicktime_parser.read_quicktime(path)
+    finally:
+        os.remove(path)
+
+    assert metadata['album'] == 'Vacation', metadata['album']
+
+def test_read_quicktime_truncated():
+    path = write_movie(atom('ftyp', 'mp42'), struct.pack('>I4s', 1000, 'moov'))
+    try:
+        metadata = quicktime_parser.read_quicktime(path)
+    finally:
+        os.remove(path)
+
+    assert metadata is None, metadata
@@ -0,0 +1,115 @@
+# Project imports
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+from elodie import stats
+
+os.environ['TZ'] = 'GMT'
+
+
+def test_timer_disabled():
+    stats.reset()
+    with stats.timer('hash', 100):
+        pass
+    stats.record('copy', 1.0, 100)
+
+    assert stats.get_stats() == {}, stats.get_stats()
+
+def test_timer():
+    stats.reset()
+    stats.enable()
+    try:
+        with stats.timer('hash', 100):
+            pass
+        with stats.timer('hash', 50):
+            pass
+        summary = stats.get_stats()
+    finally:
+        stats.enable(False)
+        stats.reset()
+
+    assert summary['hash']['count'] == 2, summary
+    assert summary['hash']['bytes'] == 150, summary
+    assert summary['hash']['total'] >= 0, summary
+
+def test_timer_records_exceptions():
+    stats.reset()
+    stats.enable()
+    try:
+        try:
+            with stats.timer('copy'):
+                raise IOError()
+        except IOError:
+            pass
+        summary = stats.get_stats()
+    finally:
+        stats.enable(False)
+        stats.reset()
+
+    assert summary['copy']['count'] == 1, summary
+
+def test_get_stats_percentiles():
+    stats.reset()
+    stats.enable()
+    try:
+        for i in range(1, 101):
+            stats.record('exiftool', i / 1000.0)
+        summary = stats.get_stats()['exiftool']
+    finally:
+        stats.enable(False)
+        stats.reset()
+
+    assert summary['count'] == 100, summary
+    assert summary['p50'] == 0.05, summary
+    assert summary['p90'] == 0.09, summary
+    assert summary['p99'] == 0.099, summary
+    assert summary['max'] == 0.1, summary
+    assert abs(summary['mean'] - 0.0505) < 1e-9, summary
+
+def test_get_stats_samples_durations():
+    sample_size = stats.SAMPLE_SIZE
+    stats.SAMPLE_SIZE = 100
+    stats.reset()
+    stats.enable()
+    try:
+        for i in range(1, 10001):
+            stats.record('hash', i / 10000.0, 1)
+        samples = len(stats.__STAGES__['hash'].samples)
+        summary = stats.get_stats()['hash']
+    finally:
+        stats.SAMPLE_SIZE = sample_size
+        stats.enable(False)
+        stats.reset()
+
+    assert samples == 100, samples
+    assert summary['count'] == 10000, summary
+    assert summary['bytes'] == 10000, summary
+    assert summary['max'] == 1.0, summary
+    assert abs(summary['mean'] - 0.50005) < 1e-9, summary
+    # The sample is spread over every duration recorded.
+    assert 0.35 < summary['p50'] < 0.65, summary
+    assert summary['p99'] > 0.9, summary
+
+def test_get_report():
+    stats.reset()
+    stats.enable()
+    try:
+        stats.record('hash', 0.5, 2048)
+        stats.record('walk', 2.0)
+        table = stats.get_report('table')
+        report = json.loads(stats.get_report('json'))
+    finally:
+        stats.enable(False)
+        stats.reset()
+
+    lines = table.split('\n')
+    assert lines[0].split()[0] == 'stage', table
+    # Slowest stages come first.
+    assert lines[1].split()[0] == 'walk', table
+    assert lines[2].split()[0] == 'hash', table
+    assert '2.0KB' in lines[2], table
+    assert report['hash']['bytes'] == 2048, report
+    assert report['walk']['count'] == 1, report
@@ -0,0 +1,135 @@
+# Project imports
+import os
+import sys
+
+import errno
+import shutil
+
+import mock
+from nose.tools import assert_raises
+
+sys.path.insert(0, os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))))
+
+import helper
+from elodie import transfer
+
+os.environ['TZ'] = 'GMT'
+
+
+def _transfer(mode):
+    temporary_folder, folder = helper.create_working_folder()
+
+    origin = os.path.join(folder, 'plain.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    os.utime(origin, (1000000000, 1000000000))
+    destination = os.path.join(folder, 'copy.jpg')
+
+    used_mode = transfer.transfer_file(origin, destination, mode)
+
+    result = {
+        'mode': used_mode,
+        'checksum': helper.checksum(destination),
+        'mtime': os.path.getmtime(destination),
+        'same_file': os.path.samefile(origin, destination)
+    }
+
+    shutil.rmtree(folder)
+
+    return result
+
+def test_transfer_file_copy():
+    result = _transfer('copy')
+
+    assert result['mode'] == 'copy', result['mode']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+    assert result['mtime'] == 1000000000, result['mtime']
+    assert result['same_file'] == False, result['same_file']
+
+def test_transfer_file_hardlink():
+    result = _transfer('hardlink')
+
+    assert result['mode'] == 'hardlink', result['mode']
+    assert result['same_file'] == True, result['same_file']
+
+def test_transfer_file_kernel():
+    result = _transfer('kernel')
+
+    assert result['mode'] in ('kernel', 'copy'), result['mode']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+    assert result['mtime'] == 1000000000, result['mtime']
+
+def test_transfer_file_reflink():
+    # Depending on the file system the clone may fall back to a copy.
+    result = _transfer('reflink')
+
+    assert result['mode'] in ('reflink', 'kernel', 'copy'), result['mode']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+    assert result['mtime'] == 1000000000, result['mtime']
+    assert result['same_file'] == False, result['same_file']
+
+def test_transfer_file_reflink_falls_back():
+    error = IOError(errno.EOPNOTSUPP, 'Operation not supported')
+    with mock.patch.object(transfer.fcntl, 'ioctl', side_effect=error):
+        result = _transfer('reflink')
+
+    assert result['mode'] in ('kernel', 'copy'), result['mode']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+
+def test_transfer_file_hardlink_falls_back_across_devices():
+    error = OSError(errno.EXDEV, 'Invalid cross-device link')
+    with mock.patch.object(transfer.os, 'link', side_effect=error):
+        result = _transfer('hardlink')
+
+    assert result['mode'] != 'hardlink', result['mode']
+    assert result['same_file'] == False, result['same_file']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+
+def test_transfer_file_kernel_falls_back_to_copy():
+    error = OSError(errno.ENOSYS, 'Function not implemented')
+    with mock.patch.object(transfer, '_copy_file_range', side_effect=error), \
+            mock.patch.object(transfer, '_sendfile', side_effect=error):
+        result = _transfer('kernel')
+
+    assert result['mode'] == 'copy', result['mode']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+
+def test_transfer_file_kernel_falls_back_when_nothing_is_copied():
+    with mock.patch.object(transfer, '_copy_file_range', return_value=0), \
+            mock.patch.object(transfer, '_sendfile', return_value=0):
+        result = _transfer('kernel')
+
+    assert result['mode'] == 'copy', result['mode']
+    assert result['checksum'] == helper.checksum(helper.get_file('plain.jpg')), result['checksum']
+
+def test_transfer_file_kernel_raises_on_short_copy():
+    # Copy a few bytes and then nothing, like a source which shrank.
+    lengths = [10]
+    def copy_file_range(fd_in, fd_out, count):
+        if(len(lengths) == 0):
+            return 0
+        return os.write(fd_out, os.read(fd_in, lengths.pop()))
+
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'plain.jpg')
+    shutil.copyfile(helper.get_file('plain.jpg'), origin)
+    destination = os.path.join(folder, 'copy.jpg')
+
+    try:
+        with mock.patch.object(transfer, '_copy_file_range', side_effect=copy_file_range):
+            assert_raises(IOError, transfer.transfer_file, origin, destination, 'kernel')
+    finally:
+        shutil.rmtree(folder)
+
+def test_transfer_file_raises_other_errors():
+    temporary_folder, folder = helper.create_working_folder()
+    origin = os.path.join(folder, 'does-not-exist.jpg')
+    destination = os.path.join(folder, 'copy.jpg')
+
+    try:
+        for mode in transfer.MODES:
+            assert_raises((IOError, OSError), transfer.transfer_file, origin, destination, mode)
+    finally:
+        shutil.rmtree(folder)
+
+def test_transfer_file_invalid_mode():
+    assert_raises(ValueError, transfer.transfer_file, 'a', 'b', 'invalid')
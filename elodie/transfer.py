@@ -0,0 +1,198 @@
+"""
+Copy files into the library without reading them in Python if we can.
+
+Each mode falls back to the ones after it in :data:`MODES` when the file
+system or platform doesn't support it, ending with a plain copy.
+
+* `hardlink` links the destination to the source.
+* `reflink` clones the source with the FICLONE ioctl so both files share
+  their blocks until one is modified, on file systems like btrfs and XFS.
+* `kernel` copies the data in the kernel with copy_file_range() or
+  sendfile().
+* `copy` copies the data with :func:`shutil.copy2`.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+#: Transfer modes, in order of fallback.
+MODES = ('hardlink', 'reflink', 'kernel', 'copy')
+
+#: ioctl to clone a file on Linux, _IOW(0x94, 9, int).
+FICLONE = 0x40049409
+
+#: Bytes to copy with a single copy_file_range() or sendfile() call.
+CHUNK_SIZE = 1024 * 1024 * 1024
+
+# Errors which mean a mode isn't supported for a file so we fall back.
+UNSUPPORTED_ERRNOS = set(
+    getattr(errno, name) for name in (
+        'EINVAL', 'EMLINK', 'ENOSYS', 'ENOTSUP', 'ENOTTY', 'EOPNOTSUPP',
+        'EPERM', 'EXDEV'
+    ) if hasattr(errno, name)
+)
+
+__LIBC__ = None
+
+
+class UnsupportedError(Exception):
+
+    """Raised when a transfer mode can't be used for a file."""
+
+    pass
+
+
+def transfer_file(source, destination, mode='copy'):
+    """Copy a file using the given mode or the first fallback which works.
+
+    Permission bits and times are copied like :func:`shutil.copy2`.
+
+    :param str source: Path of the file to copy.
+    :param str destination: Path to copy the file to. It's replaced if it
+        exists.
+    :param str mode: One of :data:`MODES`.
+    :returns: str the mode which was used.
+    """
+    if(mode not in MODES):
+        raise ValueError('Unknown transfer mode %s' % mode)
+
+    for current_mode in MODES[MODES.index(mode):-1]:
+        try:
+            TRANSFERS[current_mode](source, destination)
+            return current_mode
+        except UnsupportedError:
+            continue
+        except (IOError, OSError) as e:
+            if(e.errno not in UNSUPPORTED_ERRNOS):
+                raise
+
+    # Errors from a plain copy are real errors.
+    copy(source, destination)
+    return 'copy'
+
+
+def hardlink(source, destination):
+    if(not hasattr(os, 'link')):
+        raise UnsupportedError('Hard links are not supported')
+    # Like the other modes an existing destination is replaced.
+    if(os.path.lexists(destination)):
+        if(os.path.samefile(source, destination)):
+            return
+        os.remove(destination)
+    os.link(source, destination)
+
+
+def reflink(source, destination):
+    if(fcntl is None):
+        raise UnsupportedError('ioctl is not supported')
+    with open(source, 'rb') as fsrc:
+        with open(destination, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(source, destination)
+
+
+def kernel_copy(source, destination):
+    size = os.path.getsize(source)
+    with open(source, 'rb') as fsrc:
+        with open(destination, 'wb') as fdst:
+            for function in (_copy_file_range, _sendfile):
+                try:
+                    copied = _copy_chunks(function, fsrc, fdst, size)
+                    if(copied == size):
+                        break
+                    # Some file systems copy nothing and return 0, so we
+                    #   try the next way to copy.
+                    if(copied > 0):
+                        raise IOError('Copied %d of %d bytes of %s' % (
+                            copied, size, source))
+                except UnsupportedError:
+                    continue
+                except (IOError, OSError) as e:
+                    # We can only fall back if nothing was copied yet.
+                    copied = os.lseek(fdst.fileno(), 0, os.SEEK_CUR)
+                    if(e.errno not in UNSUPPORTED_ERRNOS or copied > 0):
+                        raise
+            else:
+                raise UnsupportedError('In-kernel copies are not supported')
+    shutil.copystat(source, destination)
+
+
+def copy(source, destination):
+    shutil.copy2(source, destination)
+
+
+TRANSFERS = {
+    'hardlink': hardlink,
+    'reflink': reflink,
+    'kernel': kernel_copy,
+    'copy': copy
+}
+
+
+def _copy_chunks(function, fsrc, fdst, size):
+    """Call a copy function until `size` bytes are copied.
+
+    :returns: int number of bytes copied
+    """
+    copied = 0
+    while(copied < size):
+        length = function(fsrc.fileno(), fdst.fileno(),
+                          min(CHUNK_SIZE, size - copied))
+        if(length == 0):
+            break
+        copied += length
+    return copied
+
+
+def _copy_file_range(fd_in, fd_out, count):
+    if(hasattr(os, 'copy_file_range')):
+        return os.copy_file_range(fd_in, fd_out, count)
+
+    function = _get_libc_function('copy_file_range')
+    function.argtypes = [
+        ctypes.c_int, ctypes.c_void_p, ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_size_t, ctypes.c_uint
+    ]
+    function.restype = ctypes.c_ssize_t
+    return _check(function(fd_in, None, fd_out, None, count, 0))
+
+
+def _sendfile(fd_in, fd_out, count):
+    if(hasattr(os, 'sendfile')):
+        return os.sendfile(fd_out, fd_in, None, count)
+
+    function = _get_libc_function('sendfile')
+    function.argtypes = [
+        ctypes.c_int, ctypes.c_int, ctypes.c_void_p, ctypes.c_size_t
+    ]
+    function.restype = ctypes.c_ssize_t
+    return _check(function(fd_out, fd_in, None, count))
+
+
+def _get_libc_function(name):
+    global __LIBC__
+    if(__LIBC__ is None):
+        path = ctypes.util.find_library('c')
+        if(path is None):
+            raise UnsupportedError('Could not find libc')
+        __LIBC__ = ctypes.CDLL(path, use_errno=True)
+
+    try:
+        return getattr(__LIBC__, name)
+    except AttributeError:
+        raise UnsupportedError('%s is not available' % name)
+
+
+def _check(result):
+    if(result < 0):
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+    return result